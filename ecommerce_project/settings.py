@@ -101,6 +101,47 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog cache (response API catalog công khai): CATALOG_CACHE_BACKEND = locmem | file | redis
+# locmem chỉ cache riêng từng process; version catalog/giỏ hàng (dùng cho key cache và ETag) luôn nằm
+# trong store dùng chung giữa các worker: 'catalog_versions' (file, hoặc Redis khi backend là redis)
+CATALOG_CACHE_BACKEND = config('CATALOG_CACHE_BACKEND', default='locmem')
+CATALOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'catalog')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        **CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+        'KEY_PREFIX': 'shop',
+    },
+    'catalog_versions': {
+        **(CATALOG_CACHE_BACKENDS['redis'] if CATALOG_CACHE_BACKEND == 'redis' else {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CATALOG_VERSION_LOCATION', default=str(BASE_DIR / 'cache' / 'catalog_versions')),
+        }),
+        'TIMEOUT': None,
+        'KEY_PREFIX': 'shop',
+    },
+}
+
+
 # Password validation (disabled for development)
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -142,6 +183,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Số thread tạo ảnh thu nhỏ (WebP/JPEG) cho ảnh sản phẩm sau khi upload
+IMAGE_RENDITION_WORKERS = config('IMAGE_RENDITION_WORKERS', default=2, cast=int)
+
+# Thời gian cache (giây) tồn kho khả dụng của từng SKU cho API /api/stock/availability/
+STOCK_AVAILABILITY_TTL = config('STOCK_AVAILABILITY_TTL', default=5, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
 
 application = get_wsgi_application()
+
+# Nạp sẵn fuzzy search index và index gợi ý khi khởi động worker (lỗi DB không được chặn việc khởi động)
+try:
+    from shop.services.fuzzy_search_service import fuzzy_search_index
+    from shop.services.suggestion_service import suggestion_index
+    fuzzy_search_index.load()
+    suggestion_index.load()
+except Exception:
+    import logging
+    logging.getLogger(__name__).exception("Không thể nạp search index khi khởi động")
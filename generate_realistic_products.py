@@ -14,6 +14,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
 django.setup()
 
 from shop.models import Product, ProductVariant, ProductVariantImage, ProductSKU, Category, Brand
+from shop.services import ProductSummaryService
+from shop.services.code_allocator_service import CodeAllocatorService
 from django.core.files.base import ContentFile
 import requests
 from io import BytesIO
@@ -264,6 +266,7 @@ def create_product_with_variants(category, brand, template_data, index):
     # Tạo 2-4 variants (màu sắc khác nhau)
     num_colors = random.randint(2, min(4, len(template_data['colors'])))
     selected_colors = random.sample(template_data['colors'], num_colors)
+    skus = []
     
     for color in selected_colors:
         # Random giá cho mỗi màu
@@ -296,7 +299,7 @@ def create_product_with_variants(category, brand, template_data, index):
         # Tạo SKUs cho các sizes
         for size in template_data['sizes']:
             stock = random.randint(10, 200)
-            ProductSKU.objects.create(
+            skus.append(ProductSKU(
                 variant=variant,
                 size=size,
                 stock_quantity=stock,
@@ -305,7 +308,11 @@ def create_product_with_variants(category, brand, template_data, index):
                 reorder_point=10,
                 cost_price=price * Decimal('0.6'),  # Cost = 60% giá bán
                 is_active=True
-            )
+            ))
+    
+    # Tạo toàn bộ SKUs của sản phẩm trong một lần (mã SKU được cấp theo lô)
+    CodeAllocatorService.bulk_create(ProductSKU, skus)
+    ProductSummaryService.refresh_product(product)
     
     return product
 
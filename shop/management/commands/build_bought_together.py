@@ -0,0 +1,48 @@
+"""
+Management command to build the "frequently bought together" index
+Chạy lệnh: python manage.py build_bought_together [--rebuild]
+
+Mặc định chỉ cộng các đơn hàng mới (chạy định kỳ bằng cron)
+"""
+
+from django.core.management.base import BaseCommand
+from shop.services.catalog_cache_service import CatalogCacheService
+from shop.services.co_purchase_service import CoPurchaseService, MIN_SUPPORT, TOP_K
+
+
+class Command(BaseCommand):
+    help = 'Cập nhật chỉ mục sản phẩm thường được mua cùng từ đơn hàng đã giao / đã thanh toán'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Xóa và xây lại toàn bộ từ đầu',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help=f'Số sản phẩm mua kèm giữ lại cho mỗi sản phẩm (mặc định {TOP_K})',
+        )
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=MIN_SUPPORT,
+            help=f'Số đơn mua chung tối thiểu (mặc định {MIN_SUPPORT})',
+        )
+
+    def handle(self, *args, **options):
+        top_k = max(1, options['top_k'])
+        min_support = max(1, options['min_support'])
+
+        if options['rebuild']:
+            self.stdout.write('🔄 Xây lại toàn bộ chỉ mục mua kèm...')
+            products, rows = CoPurchaseService.rebuild(top_k, min_support)
+        else:
+            self.stdout.write('🔄 Cộng các đơn hàng mới vào chỉ mục mua kèm...')
+            products, rows = CoPurchaseService.update(top_k, min_support)
+
+        if products:
+            CatalogCacheService.bump_version()
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã tính lại {products} sản phẩm ({rows} cặp mua kèm)'))
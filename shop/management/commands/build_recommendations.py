@@ -0,0 +1,30 @@
+"""
+Management command to rebuild personalized "for you" recommendations
+Chạy lệnh: python manage.py build_recommendations
+"""
+
+from django.core.management.base import BaseCommand
+from shop.services.recommendation_service import RecommendationService, TOP_N, USER_CHUNK
+
+
+class Command(BaseCommand):
+    help = 'Tính lại danh sách gợi ý "dành cho bạn" từ wishlist, đơn hàng và review'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=TOP_N,
+            help=f'Số sản phẩm gợi ý cho mỗi user (mặc định {TOP_N})',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=USER_CHUNK,
+            help=f'Số user mỗi transaction (mặc định {USER_CHUNK})',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('🔄 Tính lại gợi ý cho các user có tương tác...')
+        users, rows = RecommendationService.rebuild(max(1, options['top_n']), max(1, options['chunk_size']))
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã lưu gợi ý cho {users} user ({rows} dòng)'))
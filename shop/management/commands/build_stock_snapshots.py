@@ -0,0 +1,30 @@
+"""
+Management command to build daily stock snapshots from the stock ledger (StockHistory)
+Chạy hàng ngày sau nửa đêm (cron) - chỉ đọc giao dịch của các ngày chưa dựng
+Chạy lệnh: python manage.py build_stock_snapshots [--until YYYY-MM-DD]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from shop.services.stock_snapshot_service import StockSnapshotService
+
+
+class Command(BaseCommand):
+    help = 'Dựng snapshot tồn kho cuối ngày cho các ngày chưa dựng (mặc định đến hết hôm qua)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', help='Ngày cuối cần dựng (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            until = parse_date(options['until'])
+            if until is None:
+                raise CommandError('--until phải có dạng YYYY-MM-DD')
+
+        last = StockSnapshotService.watermark()
+        self.stdout.write(f'🔄 Dựng snapshot tồn kho (đã dựng đến: {last or "chưa có"})...')
+        created = StockSnapshotService.build(until)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Đã tạo {created} snapshot, dựng đến {StockSnapshotService.watermark() or "chưa có"}'
+        ))
@@ -0,0 +1,51 @@
+"""
+Management command to move legacy product images into content-addressed storage
+and rebuild blob reference counts
+Chạy lệnh: python manage.py dedupe_media
+"""
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from shop.models import ProductVariantImage
+from shop.services.catalog_cache_service import CatalogCacheService
+from shop.services.image_rendition_service import ImageRenditionService
+from shop.services.media_blob_service import MediaBlobService, image_storage
+from shop.storage import BLOB_PREFIX
+
+
+class Command(BaseCommand):
+    help = 'Chuyển ảnh sản phẩm cũ sang storage đặt tên theo nội dung (gộp file trùng) và đếm lại tham chiếu'
+
+    def handle(self, *args, **options):
+        storage = image_storage()
+        legacy = list(
+            ProductVariantImage.objects.exclude(image='').exclude(image__startswith=BLOB_PREFIX)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        self.stdout.write(f'🔄 Chuyển {len(legacy)} file ảnh cũ...')
+
+        moved = missing = 0
+        for name in legacy:
+            if not storage.exists(name):
+                missing += 1
+                continue
+            with storage.open(name, 'rb') as source:
+                new_name = storage.save(name, File(source))
+            # update() để không kích hoạt signal - tham chiếu được đếm lại bên dưới.
+            # Ảnh thu nhỏ cũ nằm theo tên file cũ - xóa để tạo lại theo blob
+            ProductVariantImage.objects.filter(image=name).update(image=new_name, renditions={})
+            storage.delete(name)
+            ImageRenditionService.delete_for(name)
+            moved += 1
+
+        self.stdout.write('🔄 Đếm lại tham chiếu...')
+        blobs = MediaBlobService.rebuild_counts()
+        if moved:
+            CatalogCacheService.bump_version()
+
+        if missing:
+            self.stdout.write(self.style.WARNING(f'⚠️  {missing} file không tồn tại trong storage'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Đã chuyển {moved} file, {blobs} blob đang dùng. '
+            f'Chạy generate_image_renditions để tạo lại ảnh thu nhỏ'
+        ))
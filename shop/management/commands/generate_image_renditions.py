@@ -0,0 +1,59 @@
+"""
+Management command to generate WebP/JPEG renditions for existing product images
+Chạy lệnh: python manage.py generate_image_renditions [--all] [--workers 4]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from shop.models import ProductVariantImage
+from shop.services.catalog_cache_service import CatalogCacheService
+from shop.services.image_rendition_service import ImageRenditionService
+
+
+class Command(BaseCommand):
+    help = 'Tạo ảnh thu nhỏ (thumbnail, card, detail, zoom) cho ảnh sản phẩm đã có'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Tạo lại cho mọi ảnh (mặc định chỉ ảnh chưa có ảnh thu nhỏ)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Số ảnh xử lý song song (mặc định 4)',
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProductVariantImage.objects.exclude(image='')
+        if not options['all']:
+            queryset = queryset.filter(renditions={})
+        image_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'🔄 Tạo ảnh thu nhỏ cho {len(image_ids)} ảnh...')
+
+        workers = max(1, options['workers'])
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        if pool:
+            results = pool.map(lambda image_id: ImageRenditionService.run(image_id, False), image_ids)
+        else:
+            results = (ImageRenditionService.generate(image_id, False) for image_id in image_ids)
+
+        done = failed = 0
+        try:
+            for ok in results:
+                done += ok
+                failed += not ok
+                if (done + failed) % 100 == 0:
+                    self.stdout.write(f'   {done + failed}/{len(image_ids)}...')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if done:
+            CatalogCacheService.bump_version()
+        if failed:
+            self.stdout.write(self.style.WARNING(f'⚠️  {failed} ảnh lỗi (xem log)'))
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã tạo ảnh thu nhỏ cho {done} ảnh'))
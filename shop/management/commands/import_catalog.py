@@ -0,0 +1,71 @@
+"""
+Management command to import a supplier catalog (products -> variants -> SKUs) from CSV / NDJSON
+Chạy lệnh: python manage.py import_catalog catalog.csv [--format ndjson] [--chunk-size 2000]
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from shop.services.catalog_import_service import CatalogImportService, CHUNK_SIZE, detect_format
+
+
+class Command(BaseCommand):
+    help = 'Nhập catalog sản phẩm từ file CSV hoặc NDJSON (upsert theo mã sản phẩm, màu, size)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Đường dẫn file catalog (.csv, .ndjson, .jsonl)')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help='Định dạng file (mặc định theo phần mở rộng)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Số dòng mỗi transaction (mặc định {CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--reference',
+            default='',
+            help='Mã phiếu nhập ghi vào lịch sử kho',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or detect_format(options['path'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+
+        def progress(report):
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write(
+                f"   {report['rows']} dòng, {report['imported']} SKU đã nhập, "
+                f"{report['error_count']} lỗi ({report['imported'] / elapsed:.0f} SKU/s)"
+            )
+
+        self.stdout.write(f"🔄 Nhập catalog từ {options['path']}...")
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = CatalogImportService.import_file(
+                    stream, fmt, chunk_size=options['chunk_size'],
+                    reference=options['reference'], progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f"   Dòng {error['line']}: {error['error']}"))
+        if report['error_count'] > len(report['errors']):
+            self.stdout.write(self.style.WARNING(
+                f"   ... và {report['error_count'] - len(report['errors'])} lỗi khác"
+            ))
+        if report['error_count']:
+            self.stdout.write(self.style.WARNING(f"⚠️  {report['error_count']} dòng lỗi đã bị bỏ qua"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Đã nhập {report['imported']} SKU trong {time.monotonic() - started:.1f}s: "
+            f"sản phẩm +{report['products_created']} / ~{report['products_updated']}, "
+            f"màu +{report['variants_created']} / ~{report['variants_updated']}, "
+            f"size +{report['skus_created']} / ~{report['skus_updated']}"
+        ))
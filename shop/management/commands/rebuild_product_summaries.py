@@ -0,0 +1,34 @@
+"""
+Management command to rebuild denormalized product summary fields
+Chạy lệnh: python manage.py rebuild_product_summaries
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.models import Product
+from shop.services.product_summary_service import ProductSummaryService
+
+
+class Command(BaseCommand):
+    help = 'Tính lại giá min/max, ảnh đại diện, tồn kho, số review cho tất cả sản phẩm'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số sản phẩm cập nhật trong mỗi câu UPDATE (mặc định 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(f'🔄 Rebuild summary cho {len(product_ids)} sản phẩm...')
+
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                updated += ProductSummaryService.refresh(product_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã cập nhật {updated} sản phẩm'))
@@ -0,0 +1,22 @@
+"""
+Management command to rebuild the product full-text search index
+Chạy lệnh: python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.services.search_service import ProductSearchService
+
+
+class Command(BaseCommand):
+    help = 'Xây lại full-text index (SQLite FTS5) cho tất cả sản phẩm'
+
+    def handle(self, *args, **options):
+        if not ProductSearchService.is_available():
+            self.stdout.write(self.style.WARNING('⚠️  Database không phải SQLite - bỏ qua FTS5 index'))
+            return
+
+        with transaction.atomic():
+            count = ProductSearchService.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã index {count} sản phẩm'))
@@ -1,78 +1,52 @@
 # shop/management/commands/refresh_stock_alerts.py
+"""
+Management command to reconcile stock alerts with current stock for every SKU
+Chạy lệnh: python manage.py refresh_stock_alerts [--delete-resolved]
+"""
+
+import time
 from django.core.management.base import BaseCommand
-from shop.models import ProductVariant, StockAlert
-from shop.services.stock_service import StockService
+from django.db.models import Count, Q
+from shop.models import StockAlert
+from shop.services.stock_alert_service import StockAlertService
 
 
 class Command(BaseCommand):
-    help = 'Refresh all stock alerts - Xóa alerts cũ và tạo lại theo logic mới'
+    help = 'Refresh all stock alerts - resolve alerts đã hết điều kiện, tạo alerts còn thiếu theo tồn kho hiện tại'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--delete-resolved',
             action='store_true',
-            help='Xóa cả alerts đã resolved',
+            help='Xóa alerts đã resolved',
         )
 
     def handle(self, *args, **options):
-        delete_resolved = options['delete_resolved']
-        
         self.stdout.write('🔄 Bắt đầu refresh stock alerts...\n')
-        
-        # 1. Xóa alerts cũ
-        if delete_resolved:
-            deleted = StockAlert.objects.all().delete()
-            self.stdout.write(f'🗑️  Đã xóa {deleted[0]} alerts (bao gồm cả resolved)')
-        else:
-            deleted = StockAlert.objects.filter(is_resolved=False).delete()
-            self.stdout.write(f'🗑️  Đã xóa {deleted[0]} alerts chưa giải quyết')
-        
-        # 2. Tạo lại alerts cho tất cả variants
-        created_count = 0
-        for variant in ProductVariant.objects.select_related('product').all():
-            old_count = StockAlert.objects.filter(
-                product_variant=variant, 
-                is_resolved=False
-            ).count()
-            
-            # Tạo alert mới nếu cần
-            StockService.check_and_create_alerts(variant)
-            
-            new_count = StockAlert.objects.filter(
-                product_variant=variant, 
-                is_resolved=False
-            ).count()
-            
-            if new_count > old_count:
-                created_count += (new_count - old_count)
-                available = variant.available_quantity
-                self.stdout.write(
-                    f'  ⚠️  {variant.product.name} - {variant.size}/{variant.color}: '
-                    f'available={available}, minimum={variant.minimum_stock}, '
-                    f'reorder={variant.reorder_point}'
-                )
-        
-        self.stdout.write(f'\n✅ Đã tạo {created_count} alerts mới')
-        
+
+        # 1. Xóa alerts đã resolved nếu được yêu cầu
+        if options['delete_resolved']:
+            deleted = StockAlert.objects.filter(is_resolved=True).delete()
+            self.stdout.write(f'🗑️  Đã xóa {deleted[0]} alerts đã resolved')
+
+        # 2. Đồng bộ alerts của tất cả SKU
+        started = time.perf_counter()
+        counts = StockAlertService.reconcile()
+        self.stdout.write(
+            f'✅ Đã tạo {counts["created"]} alerts mới, resolve {counts["resolved"]}, '
+            f'cập nhật {counts["updated"]} ({time.perf_counter() - started:.2f}s)'
+        )
+
         # 3. Thống kê
-        stats = {
-            'out_of_stock': StockAlert.objects.filter(
-                alert_type='out_of_stock', 
-                is_resolved=False
-            ).count(),
-            'low_stock': StockAlert.objects.filter(
-                alert_type='low_stock', 
-                is_resolved=False
-            ).count(),
-            'reorder_needed': StockAlert.objects.filter(
-                alert_type='reorder_needed', 
-                is_resolved=False
-            ).count(),
-        }
-        
+        stats = StockAlert.objects.filter(is_resolved=False).aggregate(
+            out_of_stock=Count('id', filter=Q(alert_type='out_of_stock')),
+            low_stock=Count('id', filter=Q(alert_type='low_stock')),
+            reorder_needed=Count('id', filter=Q(alert_type='reorder_needed')),
+        )
+
         self.stdout.write('\n📊 Thống kê alerts hiện tại:')
         self.stdout.write(f'  🔴 Hết hàng: {stats["out_of_stock"]}')
         self.stdout.write(f'  ⚠️  Tồn kho thấp: {stats["low_stock"]}')
         self.stdout.write(f'  📦 Cần đặt hàng: {stats["reorder_needed"]}')
         self.stdout.write(f'  ───────────────')
-        self.stdout.write(f'  📍 Tổng: {sum(stats.values())}')
+        self.stdout.write(self.style.SUCCESS(f'  📍 Tổng: {sum(stats.values())}'))
@@ -0,0 +1,98 @@
+"""
+Management command to stress-test concurrent checkouts of one SKU from many processes
+Kiểm tra không bán vượt tồn kho và đo số lượt xuất kho / giây trên database đang cấu hình
+Chạy lệnh: python manage.py stress_stock --workers 8 --attempts 50 --stock 100 [--strategy locking]
+"""
+
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from shop.models import Category, Product, ProductSKU, ProductVariant, StockHistory
+from shop.services import StockService
+
+
+def _checkout(sku_id, attempts, strategy):
+    """Một worker: xuất kho từng đơn vị, trả về (thành công, hết hàng, lỗi DB)"""
+    # Connection kế thừa từ process cha không dùng được sau fork
+    connections.close_all()
+    sold = sold_out = errors = 0
+    try:
+        # Như checkout: SKU được nạp trước (qua giỏ hàng), giá trị trong bộ nhớ có thể đã cũ
+        sku = ProductSKU.objects.select_related('variant').get(pk=sku_id)
+        for _ in range(attempts):
+            try:
+                if strategy == 'locking':
+                    # So sánh: khóa dòng SKU, đọc lại rồi mới ghi
+                    with transaction.atomic():
+                        locked = ProductSKU.objects.select_for_update().select_related('variant').get(pk=sku_id)
+                        StockService.export_stock(locked, 1, notes='stress_stock')
+                else:
+                    StockService.export_stock(sku, 1, notes='stress_stock')
+                sold += 1
+            except ValueError:
+                sold_out += 1
+            except DatabaseError:
+                errors += 1
+    finally:
+        connections.close_all()
+    return sold, sold_out, errors
+
+
+class Command(BaseCommand):
+    help = 'Nhiều process cùng xuất kho một SKU: kiểm tra không bán vượt tồn kho và đo throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Số process đồng thời')
+        parser.add_argument('--attempts', type=int, default=50, help='Số lượt xuất kho mỗi process')
+        parser.add_argument('--stock', type=int, default=100, help='Tồn kho ban đầu của SKU thử nghiệm')
+        parser.add_argument(
+            '--strategy', choices=('atomic', 'locking'), default='atomic',
+            help='atomic: UPDATE có điều kiện; locking: SELECT ... FOR UPDATE trước khi ghi',
+        )
+        parser.add_argument('--keep', action='store_true', help='Giữ lại sản phẩm thử nghiệm')
+
+    def handle(self, *args, **options):
+        workers, attempts, stock = options['workers'], options['attempts'], options['stock']
+        if workers < 1 or attempts < 1 or stock < 0:
+            raise CommandError('--workers, --attempts phải > 0 và --stock >= 0')
+
+        category, category_created = Category.objects.get_or_create(name='Stress test')
+        product = Product.objects.create(name='Stress test', category=category, is_active=False)
+        try:
+            variant = ProductVariant.objects.create(product=product, color='Stress', price=1)
+            sku = ProductSKU.objects.create(variant=variant, size='S', stock_quantity=stock)
+
+            self.stdout.write(
+                f'🔄 {workers} process x {attempts} lượt xuất kho, tồn kho {stock} ({options["strategy"]})...'
+            )
+            connections.close_all()
+            started = time.perf_counter()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.starmap(_checkout, [(sku.pk, attempts, options['strategy'])] * workers)
+            elapsed = time.perf_counter() - started
+
+            sold = sum(result[0] for result in results)
+            sold_out = sum(result[1] for result in results)
+            errors = sum(result[2] for result in results)
+            sku.refresh_from_db()
+            exported = StockHistory.objects.filter(product_sku=sku, transaction_type='export').count()
+
+            self.stdout.write(
+                f'   Bán được: {sold}, hết hàng: {sold_out}, lỗi DB: {errors}, '
+                f'tồn kho còn: {sku.stock_quantity}, lịch sử xuất: {exported}'
+            )
+            self.stdout.write(f'   {workers * attempts / elapsed:.0f} lượt/giây ({elapsed:.2f}s)')
+        finally:
+            # Dọn dữ liệu thử nghiệm cả khi lỗi / Ctrl+C; danh mục chỉ xóa nếu do lệnh này tạo
+            if not options['keep']:
+                product.delete()
+                if category_created and not Product.objects.filter(category=category).exists():
+                    category.delete()
+
+        oversold = sold > stock or sku.stock_quantity != stock - sold or exported != sold
+        if oversold:
+            raise CommandError('❌ Tồn kho không khớp số lượng đã bán')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'⚠️  {errors} lượt lỗi DB (lock timeout) - không bán được'))
+        self.stdout.write(self.style.SUCCESS('✅ Không bán vượt tồn kho'))
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Exists, Min, Max, Sum, Count, F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def populate_summaries(apps, schema_editor):
+    """Tính dữ liệu tóm tắt cho tất cả sản phẩm hiện có"""
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    ProductVariantImage = apps.get_model('shop', 'ProductVariantImage')
+    ProductSKU = apps.get_model('shop', 'ProductSKU')
+    Review = apps.get_model('shop', 'Review')
+
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    final_price = Coalesce('discount_price', 'price', output_field=money)
+
+    def aggregate(queryset, lookup, expression, output_field):
+        subquery = queryset.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup).annotate(
+            value=expression
+        ).values('value')[:1]
+        return Coalesce(Subquery(subquery, output_field=output_field), Value(0), output_field=output_field)
+
+    Product.objects.update(
+        base_price=Coalesce(Subquery(
+            ProductVariant.objects.filter(product=OuterRef('pk')).order_by('color', 'id').values('price')[:1],
+            output_field=money
+        ), Value(0), output_field=money),
+        min_price=aggregate(ProductVariant.objects.all(), 'product', Min(final_price), money),
+        max_price=aggregate(ProductVariant.objects.all(), 'product', Max(final_price), money),
+        is_on_sale=Exists(ProductVariant.objects.filter(product=OuterRef('pk'), discount_price__isnull=False)),
+        primary_image=Coalesce(Subquery(
+            ProductVariantImage.objects.filter(variant__product=OuterRef('pk')).exclude(image='')
+            .order_by('variant__color', 'variant_id', 'order', 'id').values('image')[:1],
+            output_field=models.CharField()
+        ), Value(''), output_field=models.CharField()),
+        available_stock=aggregate(
+            ProductSKU.objects.all(), 'variant__product',
+            Sum(Greatest(F('stock_quantity') - F('reserved_quantity'), Value(0))),
+            models.IntegerField()
+        ),
+        review_count=aggregate(Review.objects.all(), 'product', Count('id'), models.IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_category_display_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='available_stock',
+            field=models.PositiveIntegerField(default=0, verbose_name='Tồn kho có thể bán'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='base_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Giá variant đầu tiên'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_on_sale',
+            field=models.BooleanField(default=False, verbose_name='Đang giảm giá'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Giá cao nhất'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Giá thấp nhất'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Ảnh đại diện'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Số đánh giá'),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:20
+
+from django.db import migrations
+
+
+FTS_TABLE = 'shop_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    """Tạo bảng FTS5 và index tất cả sản phẩm đang hoạt động (chỉ SQLite)"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, short_description, tags, brand, category, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 2.0, 4.0, 5.0, 3.0)')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, short_description, tags, brand, category) "
+        "SELECT p.id, p.name, p.short_description, "
+        "COALESCE((SELECT group_concat(j.value, ' ') FROM json_each(p.tags) j), ''), "
+        "COALESCE(b.name, ''), COALESCE(c.name, '') "
+        "FROM shop_product p "
+        "LEFT JOIN shop_brand b ON b.id = p.brand_id "
+        "LEFT JOIN shop_category c ON c.id = p.category_id "
+        "WHERE p.is_active"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_summary_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    """Tính materialized path cho các danh mục hiện có từ parent"""
+    Category = apps.get_model('shop', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def build(pk, seen=()):
+        if pk not in paths:
+            parent_id = parents[pk]
+            if parent_id in parents and parent_id not in seen:
+                paths[pk] = f'{build(parent_id, seen + (pk,))}{pk}/'
+            else:
+                paths[pk] = f'/{pk}/'
+        return paths[pk]
+
+    categories = [Category(pk=pk, path=build(pk), depth=build(pk).count('/') - 2) for pk in parents]
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_user_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariantimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
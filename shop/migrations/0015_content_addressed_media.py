@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:37
+
+import shop.models
+import shop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_variant_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Đường dẫn file')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Số tham chiếu')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='productvariantimage',
+            name='image',
+            field=models.ImageField(storage=shop.storage.variant_image_storage, upload_to=shop.models.variant_image_path, verbose_name='Ảnh'),
+        ),
+    ]
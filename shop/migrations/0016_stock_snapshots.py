@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('quantity_change', models.IntegerField()),
+                ('value_change', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('product_sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='shop.productsku')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='stocksnapshot_date_idx')],
+                'unique_together': {('product_sku', 'date')},
+            },
+        ),
+    ]
@@ -1,10 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
-from django.utils.text import slugify
 from datetime import timedelta
-import uuid
 import os
+from .utils import format_price_range, media_url
+from .storage import variant_image_storage
 
 
 
@@ -29,9 +29,24 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children')
     display_group = models.CharField(max_length=20, choices=DISPLAY_GROUP_CHOICES, default='other', help_text='Nhóm hiển thị trong mega menu')
+    # Materialized path "/<id gốc>/.../<id>/" - được cập nhật khi lưu (xem CategoryTreeService)
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        from .services.category_tree_service import CategoryTreeService
+        parent_path = CategoryTreeService.parent_path(self.parent_id)
+        CategoryTreeService.validate_parent(self, parent_path)
+        super().save(*args, **kwargs)
+        CategoryTreeService.move(self, parent_path)
+    
+    def get_descendants(self, include_self=True):
+        """Queryset danh mục con ở mọi cấp"""
+        queryset = Category.objects.filter(path__startswith=self.path)
+        return queryset if include_self else queryset.exclude(pk=self.pk)
 
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -69,68 +84,47 @@ class Product(models.Model):
     is_featured = models.BooleanField(default=False)  # Sản phẩm nổi bật
     is_new = models.BooleanField(default=False)  # Sản phẩm mới
     
+    # Dữ liệu tóm tắt cho product card - được cập nhật bởi ProductSummaryService
+    # (signals khi variant/ảnh/SKU/review thay đổi, hoặc lệnh rebuild_product_summaries)
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Giá variant đầu tiên')
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Giá thấp nhất')
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Giá cao nhất')
+    primary_image = models.CharField(max_length=255, blank=True, verbose_name='Ảnh đại diện')
+    review_count = models.PositiveIntegerField(default=0, verbose_name='Số đánh giá')
+    available_stock = models.PositiveIntegerField(default=0, verbose_name='Tồn kho có thể bán')
+    is_on_sale = models.BooleanField(default=False, verbose_name='Đang giảm giá')
+    
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Index cho refresh tăng dần
+
+    SUMMARY_FIELDS = (
+        'base_price', 'min_price', 'max_price', 'primary_image',
+        'review_count', 'available_stock', 'is_on_sale',
+    )
 
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        # Tự động tạo SKU nếu chưa có
-        if not self.sku:
-            self.sku = f"PRD-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Tự động tạo slug từ name nếu chưa có
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            # Đảm bảo slug là unique
-            while Product.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+        # Tự động tạo SKU/slug duy nhất nếu chưa có (cấp lại nếu writer khác vừa chiếm cùng slug)
+        if not self.sku or not self.slug:
+            from .services.code_allocator_service import CodeAllocatorService
+            CodeAllocatorService.write_with_retry([self], lambda: super(Product, self).save(*args, **kwargs))
+            return
         
         super().save(*args, **kwargs)
     
     def get_price(self):
-        """Lấy giá từ variant đầu tiên"""
-        first_variant = self.variants.first()
-        return first_variant.price if first_variant else 0
+        """Lấy giá từ variant đầu tiên (đọc từ dữ liệu tóm tắt)"""
+        return self.base_price
     
     def get_display_image(self):
-        """Lấy ảnh từ variant đầu tiên"""
-        first_variant = self.variants.first()
-        if first_variant:
-            first_image = first_variant.images.first()
-            if first_image and first_image.image:
-                try:
-                    return first_image.image.url
-                except ValueError:
-                    pass
-        return None
+        """Lấy ảnh đại diện (đọc từ dữ liệu tóm tắt)"""
+        return media_url(self.primary_image)
     
     def get_price_range(self):
-        """Lấy khoảng giá của tất cả variants (ưu tiên discount_price nếu có)"""
-        variants = self.variants.all()
-        if not variants:
-            return "0₫"
-        
-        # Lấy giá cuối cùng (discount_price nếu có, không thì price)
-        final_prices = []
-        for variant in variants:
-            if variant.discount_price:
-                final_prices.append(variant.discount_price)
-            else:
-                final_prices.append(variant.price)
-        
-        if final_prices:
-            min_price = min(final_prices)
-            max_price = max(final_prices)
-            if min_price == max_price:
-                return f"{int(min_price):,}₫"
-            return f"{int(min_price):,}₫ - {int(max_price):,}₫"
-        return "0₫"
+        """Khoảng giá của tất cả variants (ưu tiên discount_price nếu có)"""
+        return format_price_range(self.min_price, self.max_price)
     
     def update_avg_rating(self):
         """Cập nhật điểm đánh giá trung bình từ các review"""
@@ -140,9 +134,9 @@ class Product(models.Model):
         self.save(update_fields=['avg_rating'])
     
     def increment_view_count(self):
-        """Tăng lượt xem sản phẩm"""
-        self.view_count += 1
-        self.save(update_fields=['view_count'])
+        """Tăng lượt xem sản phẩm (ghi trễ theo lô, xem services/counter_service.py)"""
+        from .services.counter_service import product_view_counter
+        product_view_counter.increment(self.pk)
     
     def increment_sold_count(self, quantity=1):
         """Tăng số lượng đã bán"""
@@ -154,21 +148,23 @@ class Product(models.Model):
         """Kiểm tra có phải sản phẩm bán chạy không (đã bán > 100)"""
         return self.sold_count > 100
     
-    @property
-    def review_count(self):
-        """Số lượng đánh giá"""
-        return self.reviews.count()
-
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Phân trang keyset theo (created_at, id) / (sold_count, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['-sold_count', '-id'], name='product_sold_id_idx'),
+        ]
 
 
 
 def variant_image_path(instance, filename):
-    """Tạo đường dẫn upload ảnh variant (theo màu)"""
+    """
+    Đường dẫn upload ảnh variant - tên cuối cùng do ContentAddressedStorage đặt theo nội dung
+    (products/blobs/<xx>/<sha256>.<ext>), ở đây chỉ giữ phần mở rộng
+    """
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4().hex}.{ext}'
-    return os.path.join('products', str(instance.variant.product.id), 'variants', filename)
+    return os.path.join('products', 'variants', f'upload.{ext}')
 
 
 class ProductVariant(models.Model):
@@ -194,18 +190,13 @@ class ProductVariant(models.Model):
         return self.discount_price if self.discount_price else self.price
     
     def get_primary_image(self):
-        """Lấy ảnh chính của variant"""
-        primary = self.images.filter(is_primary=True).first()
-        if primary and primary.image:
-            try:
-                return primary.image.url
-            except ValueError:
-                pass
+        """Lấy ảnh chính của variant (dùng images.all() để tận dụng prefetch)"""
+        images = [image for image in self.images.all() if image.image]
         # Nếu không có ảnh primary, lấy ảnh đầu tiên
-        first_image = self.images.first()
-        if first_image and first_image.image:
+        primary = next((image for image in images if image.is_primary), images[0] if images else None)
+        if primary:
             try:
-                return first_image.image.url
+                return primary.image.url
             except ValueError:
                 pass
         return None
@@ -226,9 +217,11 @@ class ProductVariant(models.Model):
 class ProductVariantImage(models.Model):
     """Nhiều ảnh cho mỗi variant (màu)"""
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to=variant_image_path, verbose_name='Ảnh')
+    image = models.ImageField(upload_to=variant_image_path, storage=variant_image_storage, verbose_name='Ảnh')
     is_primary = models.BooleanField(default=False, verbose_name='Ảnh chính')
     order = models.PositiveIntegerField(default=0, verbose_name='Thứ tự hiển thị')
+    # Ảnh thu nhỏ {kích thước: {'width', 'webp', 'jpeg'}} - tạo nền bởi ImageRenditionService
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -264,10 +257,11 @@ class ProductSKU(models.Model):
         return f"{self.variant} - Size {self.size}"
     
     def save(self, *args, **kwargs):
-        # Auto-generate SKU nếu chưa có
+        # Auto-generate SKU duy nhất nếu chưa có
         if not self.sku:
-            product_sku = self.variant.product.sku if self.variant.product.sku else f"PRD-{self.variant.product.id}"
-            self.sku = f"{product_sku}-{self.variant.color}-{self.size}".upper().replace(' ', '-')
+            from .services.code_allocator_service import CodeAllocatorService
+            CodeAllocatorService.write_with_retry([self], lambda: super(ProductSKU, self).save(*args, **kwargs))
+            return
         super().save(*args, **kwargs)
     
     @property
@@ -331,6 +325,9 @@ class Order(models.Model):
     used_coupon = models.ForeignKey('UserCoupon', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders_used')
     discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     
+    # Đã được cộng vào thống kê mua kèm (ProductPairCount) hay chưa
+    co_purchase_indexed = models.BooleanField(default=False, db_index=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -343,6 +340,11 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Phân trang keyset theo (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_id_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -412,13 +414,11 @@ class CartItem(models.Model):
         """Giữ hàng khi bắt đầu checkout"""
         from django.utils import timezone
         from datetime import timedelta
-        
+        from .services import StockService
+
         if not self.is_reserved:
-            # Check availability
-            if self.product_sku.available_quantity >= self.quantity:
-                self.product_sku.reserved_quantity += self.quantity
-                self.product_sku.save()
-                
+            # Kiểm tra và giữ hàng trong cùng một câu UPDATE
+            if StockService.reserve(self.product_sku, self.quantity):
                 self.is_reserved = True
                 self.reserved_at = timezone.now()
                 self.reservation_expires_at = timezone.now() + timedelta(minutes=30)
@@ -428,10 +428,11 @@ class CartItem(models.Model):
     
     def release_reservation(self):
         """Hủy giữ hàng"""
+        from .services import StockService
+
         if self.is_reserved:
-            self.product_sku.reserved_quantity = max(0, self.product_sku.reserved_quantity - self.quantity)
-            self.product_sku.save()
-            
+            StockService.release(self.product_sku, self.quantity)
+
             self.is_reserved = False
             self.reserved_at = None
             self.reservation_expires_at = None
@@ -477,6 +478,10 @@ class StockHistory(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Stock Histories"
+        indexes = [
+            # Phân trang keyset theo (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='stockhistory_created_id_idx'),
+        ]
 
 
 class StockAlert(models.Model):
@@ -506,6 +511,32 @@ class StockAlert(models.Model):
         ordering = ['is_resolved', '-created_at']
 
 
+class StockSnapshot(models.Model):
+    """
+    Tồn kho cuối ngày của một SKU, dựng từ StockHistory (xem StockSnapshotService)
+    Chỉ có dòng cho ngày SKU có phát sinh, cộng một dòng mở đầu theo ngày tạo SKU
+    """
+    product_sku = models.ForeignKey('ProductSKU', on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()  # Ngày theo TIME_ZONE
+    quantity = models.PositiveIntegerField()  # Tồn kho cuối ngày
+    value = models.DecimalField(max_digits=14, decimal_places=2)  # quantity x giá vốn lúc dựng
+
+    # Chênh lệch so với snapshot trước của SKU (dòng đầu tiên: bằng quantity / value)
+    # -> tổng toàn kho tại ngày D = tổng chênh lệch của các dòng có date <= D
+    quantity_change = models.IntegerField()
+    value_change = models.DecimalField(max_digits=14, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.product_sku} - {self.date}: {self.quantity}"
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['product_sku', 'date']
+        indexes = [
+            models.Index(fields=['date'], name='stocksnapshot_date_idx'),
+        ]
+
+
 class Coupon(models.Model):
     """Mã giảm giá"""
     COUPON_TYPES = [
@@ -728,3 +759,59 @@ class ProductVoucher(models.Model):
         verbose_name_plural = 'Voucher sản phẩm'
 
 
+class ProductPairCount(models.Model):
+    """
+    Số đơn hàng (đã giao / đã thanh toán) chứa cả hai sản phẩm - ma trận đồng xuất hiện thưa,
+    chỉ lưu nửa trên (product_a <= product_b). Đường chéo (product_a = product_b) là số đơn chứa sản phẩm
+    """
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0, verbose_name='Số đơn')
+
+    class Meta:
+        unique_together = ['product_a', 'product_b']
+        indexes = [
+            models.Index(fields=['product_b'], name='pair_product_b_idx'),
+        ]
+
+
+class ProductBoughtTogether(models.Model):
+    """Top-K sản phẩm thường được mua kèm (xếp theo lift) - dựng bởi CoPurchaseService"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together')
+    related_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together_of')
+    rank = models.PositiveSmallIntegerField(verbose_name='Thứ hạng')
+    lift = models.FloatField(verbose_name='Lift')
+    orders = models.PositiveIntegerField(verbose_name='Số đơn mua kèm')
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'related_product']
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='bought_together_rank_idx'),
+        ]
+
+
+class UserRecommendation(models.Model):
+    """Top-N sản phẩm gợi ý cho từng user ("dành cho bạn") - dựng offline bởi RecommendationService"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_to')
+    rank = models.PositiveSmallIntegerField(verbose_name='Thứ hạng')
+    score = models.FloatField(verbose_name='Điểm')
+    computed_at = models.DateTimeField(verbose_name='Thời điểm tính')
+
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ['user', 'product']
+        indexes = [
+            models.Index(fields=['user', 'rank'], name='recommendation_rank_idx'),
+        ]
+
+
+class MediaBlob(models.Model):
+    """Số tham chiếu của một file ảnh content-addressed (xem shop/storage.py, MediaBlobService)"""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Đường dẫn file')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Số tham chiếu')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
@@ -1,6 +1,137 @@
 # shop/pagination.py - Custom pagination classes
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPaginationMixin:
+    """
+    Phân trang keyset (cursor) cho bảng lớn: WHERE (sort_key, id) < (giá trị, id) thay cho
+    OFFSET, và không chạy COUNT(*) trừ khi client gửi ?count=1
+
+    Bật theo từng request bằng ?pagination=cursor (trang đầu) hoặc ?cursor=<token>.
+    Khóa sắp xếp lấy từ ordering của queryset (ví dụ -created_at, hoặc ?ordering= của
+    OrderingFilter) + id. Ordering theo biểu thức hoặc field quan hệ/nullable thì
+    tự quay về phân trang theo số trang như cũ
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor không hợp lệ'
+    keyset = False
+
+    def use_keyset(self, request):
+        return bool(request.query_params.get(self.cursor_query_param)) or \
+            request.query_params.get('pagination') == 'cursor'
+
+    @staticmethod
+    def get_keyset_ordering(queryset):
+        """
+        Returns:
+            List [(attname, descending)] kết thúc bằng pk, hoặc None nếu ordering không dùng keyset được
+        """
+        opts = queryset.model._meta
+        keys = []
+        for item in list(queryset.query.order_by) or list(opts.ordering):
+            if not isinstance(item, str) or item == '?':
+                return None
+            name = item.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation or field.null:
+                return None
+            keys.append((field.attname, item.startswith('-')))
+            if field.primary_key:
+                return keys
+        keys.append((opts.pk.attname, keys[0][1] if keys else True))
+        return keys
+
+    @staticmethod
+    def keyset_filter(keys, position):
+        """(k1, k2, ..., id) đứng sau position theo thứ tự keys (mỗi key có chiều riêng)"""
+        condition = Q()
+        for index, (name, descending) in enumerate(keys):
+            term = Q(**{f"{name}__{'lt' if descending else 'gt'}": position[index]})
+            for previous_index, (previous_name, _) in enumerate(keys[:index]):
+                term &= Q(**{previous_name: position[previous_index]})
+            condition |= term
+        return condition
+
+    def encode_cursor(self, row, reverse):
+        # row là model instance hoặc dict (queryset .values())
+        position = [row[name] if isinstance(row, dict) else getattr(row, name) for name, _ in self.keys]
+        data = json.dumps({'p': position, 'r': reverse}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, model, keys):
+        token = self.request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values = data['p']
+            if len(values) != len(keys):
+                raise ValueError
+            position = [
+                model._meta.get_field(name).to_python(value) for (name, _), value in zip(keys, values)
+            ]
+            return position, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = False
+        keys = self.get_keyset_ordering(queryset) if self.use_keyset(request) else None
+        if keys is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        self.keys = keys
+        self.keyset_page_size = page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(queryset.model, keys)
+        self.count = queryset.count() if request.query_params.get('count') in ('1', 'true') else None
+
+        # Trang trước: đảo chiều sắp xếp, lấy các dòng đứng trước position rồi đảo lại
+        order_keys = [(name, descending != reverse) for name, descending in keys]
+        queryset = queryset.order_by(*[('-' if descending else '') + name for name, descending in order_keys])
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(order_keys, position))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.rows = rows
+        return rows
+
+    def get_cursor_link(self, row, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_keyset_response(self, data):
+        next_link = self.get_cursor_link(self.rows[-1], False) if self.has_next and self.rows else None
+        previous_link = self.get_cursor_link(self.rows[0], True) if self.has_previous and self.rows else None
+        return Response({
+            'links': {
+                'next': next_link,
+                'previous': previous_link
+            },
+            'count': self.count,  # None nếu không gửi ?count=1
+            'page_size': self.keyset_page_size,
+            'results': data
+        })
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
@@ -20,12 +151,14 @@ class StandardResultsSetPagination(PageNumberPagination):
             'results': data
         })
 
-class ProductPagination(PageNumberPagination):
+class ProductPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 12  # Số sản phẩm phù hợp cho grid layout
     page_size_query_param = 'page_size'
     max_page_size = 200  # Tăng từ 50 lên 200 cho FE
     
     def get_paginated_response(self, data):
+        if self.keyset:
+            return self.get_keyset_response(data)
         return Response({
             'links': {
                 'next': self.get_next_link(),
@@ -38,12 +171,14 @@ class ProductPagination(PageNumberPagination):
             'results': data
         })
 
-class OrderPagination(PageNumberPagination):
+class OrderPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 100
     
     def get_paginated_response(self, data):
+        if self.keyset:
+            return self.get_keyset_response(data)
         return Response({
             'links': {
                 'next': self.get_next_link(),
@@ -56,12 +191,14 @@ class OrderPagination(PageNumberPagination):
             'results': data
         })
 
-class AdminPagination(PageNumberPagination):
+class AdminPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 50  # Admin có thể xem nhiều hơn
     page_size_query_param = 'page_size'
     max_page_size = 200
     
     def get_paginated_response(self, data):
+        if self.keyset:
+            return self.get_keyset_response(data)
         return Response({
             'links': {
                 'next': self.get_next_link(),
@@ -8,6 +8,45 @@ from .models import (
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
 from django.utils import timezone 
+from django.db import transaction
+from .utils import format_price_range, media_url
+from .services import StockService
+
+
+def _split_query_param(request, name):
+    """Tập giá trị của tham số dạng 'a,b,c' (None nếu request không gửi tham số)"""
+    value = request.query_params.get(name) if request is not None else None
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets cho serializer gốc của response:
+    - ?fields=id,name,price: chỉ trả các field được liệt kê
+    - ?expand=variants,brand: chỉ kèm các quan hệ lồng nhau (Meta.expandable_fields) được liệt kê
+    Không gửi cả hai thì trả đầy đủ như cũ. Serializer lồng bên trong không bị ảnh hưởng
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.root is not self and getattr(self.root, 'child', None) is not self:
+            return fields
+        request = self.context.get('request')
+        only = _split_query_param(request, 'fields')
+        expand = _split_query_param(request, 'expand')
+        if only is None and expand is None:
+            return fields
+        expandable = set(getattr(getattr(self, 'Meta', None), 'expandable_fields', ()))
+        for name in list(fields):
+            if name in expandable:
+                keep = name in (expand or ()) or name in (only or ())
+            else:
+                keep = only is None or name in only
+            if not keep:
+                fields.pop(name)
+        return fields
 
 # User serializer để đăng ký
 class RegisterSerializer(serializers.ModelSerializer):
@@ -55,9 +94,18 @@ class CategorySerializer(serializers.ModelSerializer):
             return CategorySerializer(children, many=True, context={'skip_children': True}).data
         return []
     
+    def validate_parent(self, value):
+        # Không cho tạo vòng lặp trong cây danh mục
+        if value and self.instance and f'/{self.instance.pk}/' in value.path:
+            raise serializers.ValidationError('Không thể chọn chính danh mục này hoặc danh mục con của nó làm danh mục cha')
+        return value
+    
     def get_product_count(self, obj):
+        # Gồm cả sản phẩm của danh mục con
         # Dùng annotated field từ queryset nếu có, nếu không thì query
-        return getattr(obj, 'active_product_count', obj.products.filter(is_active=True).count())
+        if hasattr(obj, 'active_product_count'):
+            return obj.active_product_count
+        return Product.objects.filter(is_active=True, category__path__startswith=obj.path).count()
 
 # Brand serializer
 class BrandSerializer(serializers.ModelSerializer):
@@ -70,10 +118,11 @@ class BrandSerializer(serializers.ModelSerializer):
 # ProductVariantImage Serializer
 class ProductVariantImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductVariantImage
-        fields = ['id', 'image', 'image_url', 'is_primary', 'order']
+        fields = ['id', 'image', 'image_url', 'renditions', 'is_primary', 'order']
         read_only_fields = ['id']
     
     def get_image_url(self, obj):
@@ -83,6 +132,17 @@ class ProductVariantImageSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
             return obj.image.url
         return None
+    
+    def get_renditions(self, obj):
+        # {thumbnail|card|detail|zoom: {width, height, webp, jpeg}} - rỗng khi ảnh thu nhỏ chưa tạo xong
+        request = self.context.get('request')
+        renditions = {}
+        for name, rendition in (obj.renditions or {}).items():
+            urls = {fmt: media_url(rendition.get(fmt)) for fmt in ('webp', 'jpeg')}
+            if request:
+                urls = {fmt: request.build_absolute_uri(url) if url else None for fmt, url in urls.items()}
+            renditions[name] = {'width': rendition.get('width'), 'height': rendition.get('height'), **urls}
+        return renditions
 
 # ProductSKU Serializer
 class ProductSKUSerializer(serializers.ModelSerializer):
@@ -148,7 +208,7 @@ class ProductVoucherSerializer(serializers.ModelSerializer):
         valid, message = obj.is_valid()
         return valid
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     variants = ProductVariantSerializer(many=True, read_only=True)
     vouchers = ProductVoucherSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
@@ -162,6 +222,7 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        expandable_fields = ['variants', 'vouchers', 'category', 'brand']
     
     def get_price(self, obj):
         return obj.get_price()
@@ -177,6 +238,48 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_price_range(self, obj):
         return obj.get_price_range()
 
+
+class ProductCardSerializer(SparseFieldsMixin, serializers.Serializer):
+    """
+    Serializer nhẹ cho grid sản phẩm: đọc từ dòng .values() (dict) thay vì model instance,
+    chỉ dùng dữ liệu tóm tắt trên Product nên không cần prefetch quan hệ nào
+    """
+    VALUES = (
+        'id', 'name', 'slug', 'base_price', 'min_price', 'max_price', 'primary_image',
+        'is_new', 'is_featured', 'is_on_sale', 'sold_count', 'avg_rating', 'review_count',
+        'available_stock', 'brand__name', 'category_id', 'created_at',
+    )
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    price = serializers.DecimalField(source='base_price', max_digits=10, decimal_places=2)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price_range = serializers.SerializerMethodField()
+    display_image = serializers.SerializerMethodField()
+    is_new = serializers.BooleanField()
+    is_featured = serializers.BooleanField()
+    is_on_sale = serializers.BooleanField()
+    sold_count = serializers.IntegerField()
+    avg_rating = serializers.DecimalField(max_digits=3, decimal_places=2)
+    review_count = serializers.IntegerField()
+    available_stock = serializers.IntegerField()
+    brand_name = serializers.CharField(source='brand__name', allow_null=True)
+    category = serializers.IntegerField(source='category_id')
+    created_at = serializers.DateTimeField()
+
+    def get_price_range(self, obj):
+        return format_price_range(obj['min_price'], obj['max_price'])
+
+    def get_display_image(self, obj):
+        image_url = media_url(obj['primary_image'])
+        if image_url:
+            request = self.context.get('request')
+            if request:
+                return request.build_absolute_uri(image_url)
+        return None
+
 # Admin nested serializers for create/update
 class AdminProductSKUSerializer(serializers.ModelSerializer):
     """Serializer cho việc tạo/cập nhật SKU trong Admin"""
@@ -234,6 +337,7 @@ class AdminProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        read_only_fields = Product.SUMMARY_FIELDS
     
     def create(self, validated_data):
         variants_data = validated_data.pop('variants', [])
@@ -375,7 +479,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return obj.get_total_price()
 
 # Order serializer cho việc hiển thị
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
     user_email = serializers.CharField(source='user.email', read_only=True)
@@ -393,6 +497,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'discount_amount', 'coupon_info'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        expandable_fields = ['items']
     
     def get_user(self, obj):
         if obj.user:
@@ -442,9 +547,11 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         
         return attrs
     
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
         cart = Cart.objects.get(user=user)
+        cart_items = list(cart.items.select_related('product_sku__variant__product'))
         
         # Extract coupon code and payment method if provided
         coupon_code = validated_data.pop('coupon_code', None)
@@ -452,7 +559,7 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         
         # Calculate total price - dùng ProductSKU
         total_price = 0
-        for cart_item in cart.items.all():
+        for cart_item in cart_items:
             # Lấy giá từ variant (vì ProductSKU không có price riêng)
             item_price = cart_item.product_sku.get_final_price()
             total_price += item_price * cart_item.quantity
@@ -518,23 +625,29 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             used_coupon.save()
         
         # Create order items from cart - dùng ProductSKU
-        for cart_item in cart.items.all():
-            item_price = cart_item.product_sku.get_final_price()
-            
+        order_items = []
+        for cart_item in cart_items:
             # Release reservation before creating OrderItem
             # This will restore reserved_quantity back to available
             if cart_item.is_reserved:
                 cart_item.release_reservation()
             
-            OrderItem.objects.create(
+            order_items.append(OrderItem(
                 order=order,
                 product_sku=cart_item.product_sku,  # Dùng product_sku thay vì product_variant
                 quantity=cart_item.quantity,
-                price_per_item=item_price
+                price_per_item=cart_item.product_sku.get_final_price()
+            ))
+        
+        # bulk_create không gửi signal - xuất kho cả đơn trong một lần
+        OrderItem.objects.bulk_create(order_items)
+        try:
+            StockService.export_stock_many(
+                order, [(item.product_sku, item.quantity) for item in order_items],
+                notes=f"Order #{order.id} - Customer checkout", user=user
             )
-            
-            # Stock will be exported automatically by post_save signal
-            # Signal will handle the actual stock export (reduce stock_quantity)
+        except ValueError as e:
+            raise serializers.ValidationError({'stock': str(e)})
         
         # Clear cart after creating order
         cart.items.all().delete()
@@ -598,23 +711,13 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at']
     
     def get_product_image(self, obj):
-        """Get the primary image of the product's first variant"""
-        try:
-            # Get first variant of the product
-            variant = obj.product.variants.first()
-            if variant:
-                # Get primary image or first image
-                primary_image = variant.images.filter(is_primary=True).first()
-                if not primary_image:
-                    primary_image = variant.images.first()
-                
-                if primary_image and primary_image.image:
-                    request = self.context.get('request')
-                    if request:
-                        return request.build_absolute_uri(primary_image.image.url)
-                    return primary_image.image.url
-        except Exception as e:
-            pass
+        """Get the product's display image (từ dữ liệu tóm tắt của Product)"""
+        image_url = obj.product.get_display_image()
+        if image_url:
+            request = self.context.get('request')
+            if request:
+                return request.build_absolute_uri(image_url)
+            return image_url
         return None
     
     def validate_rating(self, value):
@@ -664,7 +767,7 @@ class WishlistSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 # Wishlist item serializer (để hiển thị đầy đủ thông tin)
-class WishlistItemSerializer(serializers.ModelSerializer):
+class WishlistItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)  # Trả về full product object
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.SerializerMethodField()  # Lấy từ variant
@@ -677,15 +780,16 @@ class WishlistItemSerializer(serializers.ModelSerializer):
             'id', 'product', 'product_name', 'product_price', 
             'product_discount_price', 'product_main_image', 'created_at'
         ]
+        expandable_fields = ['product']
     
     def get_product_price(self, obj):
         # Lấy giá từ variant đầu tiên
         return obj.product.get_price()
     
     def get_product_discount_price(self, obj):
-        # Kiểm tra variant đầu tiên có discount không
-        if obj.product.variants.exists():
-            first_variant = obj.product.variants.first()
+        # Kiểm tra variant đầu tiên có discount không (dùng variants đã prefetch nếu có)
+        first_variant = next(iter(obj.product.variants.all()), None)
+        if first_variant:
             return first_variant.discount_price
         return None
     
@@ -3,5 +3,6 @@ Services package for shop app
 """
 
 from .stock_service import StockService
+from .product_summary_service import ProductSummaryService
 
-__all__ = ['StockService']
+__all__ = ['StockService', 'ProductSummaryService']
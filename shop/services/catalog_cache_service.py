@@ -0,0 +1,166 @@
+"""
+Catalog Cache Service
+Cache response của các API catalog công khai (danh mục, thương hiệu, danh sách/chi tiết sản phẩm)
+
+Key = catalog version + path + query string đã chuẩn hóa. Khi dữ liệu catalog thay đổi chỉ cần
+tăng version (signals), các key cũ tự hết hạn. Backend cấu hình ở settings.CACHES['catalog']
+(locmem / file / redis)
+
+Version (và thời điểm sửa) nằm ở settings.CACHES['catalog_versions'] - store dùng chung giữa
+các worker (file / redis) kể cả khi response được cache locmem riêng từng process: worker này
+ghi thì mọi worker khác thấy version mới ngay (key cache và ETag cùng đổi)
+"""
+
+import hashlib
+import logging
+import time
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'catalog'
+VERSION_ALIAS = 'catalog_versions'
+CATALOG_SCOPE = 'catalog'
+
+# Coalescing: chỉ một worker build key đang miss, các worker khác chờ tối đa LOCK_WAIT giây
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL = 0.05
+
+
+class CatalogCacheService:
+    """Service quản lý catalog version và cache response"""
+
+    @staticmethod
+    def cache():
+        return caches[CACHE_ALIAS]
+
+    @staticmethod
+    def versions():
+        """Store version dùng chung giữa các worker"""
+        return caches[VERSION_ALIAS]
+
+    @staticmethod
+    def get_version(scope=CATALOG_SCOPE):
+        """
+        Version hiện tại của một phạm vi dữ liệu (mặc định: catalog; ví dụ khác: giỏ hàng của user)
+
+        Giá trị khởi tạo theo thời gian (ms) để nếu key version bị evict thì version mới
+        vẫn khác mọi version cũ
+        """
+        cache = CatalogCacheService.versions()
+        key = f"{scope}:version"
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def bump_version(scope=CATALOG_SCOPE):
+        """
+        Tăng version - mọi response/ETag dựa trên version cũ trở nên vô hiệu
+
+        Version mới = max(version cũ + 1, thời gian hiện tại (ms)): incr của file backend không
+        nguyên tử, hai worker tăng cùng lúc vẫn ra version khác version cũ
+        """
+        cache = CatalogCacheService.versions()
+        key = f"{scope}:version"
+        version = max((cache.get(key) or 0) + 1, int(time.time() * 1000))
+        cache.set_many({key: version, f"{scope}:modified": timezone.now()}, timeout=None)
+        return version
+
+    @staticmethod
+    def cart_scope(user_id):
+        """Phạm vi version giỏ hàng của một user"""
+        return f"cart:{user_id}"
+
+    @staticmethod
+    def get_last_modified(scope=CATALOG_SCOPE):
+        """Thời điểm version được tăng gần nhất (None nếu chưa biết)"""
+        return CatalogCacheService.versions().get(f"{scope}:modified")
+
+    @staticmethod
+    def request_digest(request):
+        """Hash của host + path + query string chuẩn hóa (bỏ tham số rỗng, sắp xếp theo tên và giá trị)"""
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values if value != ''
+        )
+        raw = f"{request.get_host()}|{request.path}|{params}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    @staticmethod
+    def build_key(request):
+        """Key cache cho request: catalog version + request_digest"""
+        return f"catalog:{CatalogCacheService.get_version()}:{CatalogCacheService.request_digest(request)}"
+
+    @staticmethod
+    def get_etag(request, *scopes):
+        """
+        ETag tính từ version (không cần serialize response)
+
+        Version đọc từ store dùng chung (VERSION_ALIAS), không phải bộ đếm riêng của worker:
+        mọi worker trả cùng ETag cho cùng nội dung và cùng đổi ETag khi dữ liệu đổi
+
+        Args:
+            request: Request
+            scopes: Các phạm vi version tạo nên response (mặc định: catalog)
+        """
+        versions = '-'.join(str(CatalogCacheService.get_version(scope)) for scope in scopes or (CATALOG_SCOPE,))
+        return f"{versions}-{CatalogCacheService.request_digest(request)[:16]}"
+
+    @staticmethod
+    def _wait_for(cache, key):
+        """Chờ worker khác build xong key (None nếu hết thời gian chờ)"""
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return None
+
+    @staticmethod
+    def get_or_build(request, builder, timeout=DEFAULT_TIMEOUT):
+        """
+        Lấy giá trị từ cache, nếu miss thì build (gộp các miss đồng thời)
+
+        Args:
+            request: Request (dùng để tạo key, xem build_key)
+            builder: Hàm trả về (giá trị, có_cache_được)
+            timeout: TTL (mặc định TIMEOUT của backend)
+
+        Returns:
+            Giá trị đã cache hoặc vừa build
+        """
+        cache = CatalogCacheService.cache()
+        try:
+            key = CatalogCacheService.build_key(request)
+            lock_key = f"{key}:lock"
+            value = cache.get(key)
+            if value is not None:
+                return value
+            acquired = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        except Exception as e:
+            # Cache lỗi (ví dụ Redis down) thì vẫn phục vụ request, chỉ không cache
+            logger.warning(f"Catalog cache unavailable: {e}")
+            return builder()[0]
+
+        if not acquired:
+            # Worker khác đang build - chờ kết quả thay vì cùng query DB
+            value = CatalogCacheService._wait_for(cache, key)
+            if value is not None:
+                return value
+            return builder()[0]
+
+        try:
+            value, cacheable = builder()
+            if cacheable:
+                cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
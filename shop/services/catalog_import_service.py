@@ -0,0 +1,523 @@
+"""
+Catalog Import Service
+Nhập catalog của nhà cung cấp (sản phẩm -> màu -> size) từ file CSV hoặc NDJSON theo luồng
+
+- CSV: mỗi dòng một SKU (cột xem COLUMNS), ô trống = giữ nguyên giá trị hiện có, tags ngăn cách bằng "|"
+- NDJSON: mỗi dòng một SKU phẳng như CSV, hoặc một sản phẩm lồng nhau
+  {"sku", "name", ..., "variants": [{"color", "price", ..., "sizes": [{"size", "stock_quantity", ...}]}]}
+- Khóa upsert: Product.sku (mã sản phẩm của nhà cung cấp), (sản phẩm, màu), (màu, size)
+- Đọc và xử lý theo lô CHUNK_SIZE dòng: kiểm tra trong bộ nhớ, ghi bằng bulk_create/bulk_update
+  trong một transaction mỗi lô; dòng lỗi được bỏ qua và báo lại theo số dòng
+- SKU đã có: chỉ ghi các cột dòng thay đổi; SKU được khóa khi nạp, tồn kho ghi qua
+  StockService.adjust_stock_many (delta so với giá trị trong DB) để không ghi đè số bán đồng thời
+"""
+
+import csv
+import io
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from ..models import Brand, Category, Product, ProductSKU, ProductVariant, StockHistory
+from .catalog_cache_service import CatalogCacheService
+from .code_allocator_service import CodeAllocatorService
+from .fuzzy_search_service import fuzzy_search_index
+from .product_summary_service import ProductSummaryService
+from .search_service import ProductSearchService
+from .stock_alert_service import StockAlertService
+from .stock_availability_service import StockAvailabilityService
+from .stock_service import StockService
+from .suggestion_service import suggestion_index
+
+logger = logging.getLogger(__name__)
+
+# Số dòng (SKU) mỗi transaction
+CHUNK_SIZE = 2000
+# Số lỗi giữ lại chi tiết trong báo cáo
+MAX_ERRORS = 1000
+# File upload qua API lớn hơn mức này phải nhập bằng lệnh import_catalog (request chạy đồng bộ)
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+
+# Cột của một dòng phẳng
+PRODUCT_COLUMNS = (
+    'product_sku', 'name', 'category', 'brand', 'description', 'short_description',
+    'material', 'tags', 'is_active', 'is_featured', 'is_new',
+)
+VARIANT_COLUMNS = ('color', 'price', 'discount_price', 'variant_is_active')
+SKU_COLUMNS = ('size', 'sku', 'stock_quantity', 'minimum_stock', 'reorder_point', 'cost_price', 'sku_is_active')
+COLUMNS = PRODUCT_COLUMNS + VARIANT_COLUMNS + SKU_COLUMNS
+
+# Cột -> field của model
+PRODUCT_FIELDS = {
+    'name': 'name', 'category': 'category_id', 'brand': 'brand_id', 'description': 'description',
+    'short_description': 'short_description', 'material': 'material', 'tags': 'tags',
+    'is_active': 'is_active', 'is_featured': 'is_featured', 'is_new': 'is_new',
+}
+VARIANT_FIELDS = {'price': 'price', 'discount_price': 'discount_price', 'variant_is_active': 'is_active'}
+SKU_FIELDS = {
+    'sku': 'sku', 'stock_quantity': 'stock_quantity', 'minimum_stock': 'minimum_stock',
+    'reorder_point': 'reorder_point', 'cost_price': 'cost_price', 'sku_is_active': 'is_active',
+}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'có', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'không', ''}
+MAX_MONEY = Decimal('99999999.99')
+
+
+def detect_format(filename):
+    """'csv' hoặc 'ndjson' theo phần mở rộng của file"""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    raise ValueError("Chỉ hỗ trợ file .csv, .ndjson hoặc .jsonl")
+
+
+def _text(stream):
+    """Bọc file nhị phân (file mở 'rb' hoặc file upload) thành luồng văn bản UTF-8"""
+    stream = getattr(stream, 'file', stream)
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def _flatten(product):
+    """Tách một sản phẩm NDJSON lồng nhau thành các dòng phẳng (một dòng mỗi size)"""
+    base = {key: value for key, value in product.items() if key not in ('sku', 'variants')}
+    base['product_sku'] = product.get('sku')
+    variants = product.get('variants')
+    if not isinstance(variants, list) or not variants:
+        raise ValueError("Sản phẩm phải có danh sách variants")
+    for variant in variants:
+        if not isinstance(variant, dict):
+            raise ValueError("Mỗi variant phải là object")
+        variant_row = dict(base, color=variant.get('color'))
+        for key in ('price', 'discount_price'):
+            if key in variant:
+                variant_row[key] = variant[key]
+        if 'is_active' in variant:
+            variant_row['variant_is_active'] = variant['is_active']
+        sizes = variant.get('sizes')
+        if not isinstance(sizes, list) or not sizes:
+            raise ValueError(f"Variant {variant.get('color')!r} phải có danh sách sizes")
+        for size in sizes:
+            if not isinstance(size, dict):
+                raise ValueError("Mỗi size phải là object")
+            row = dict(variant_row, size=size.get('size', size.get('name')))
+            for key in ('sku', 'stock_quantity', 'minimum_stock', 'reorder_point', 'cost_price'):
+                if key in size:
+                    row[key] = size[key]
+            if 'is_active' in size:
+                row['sku_is_active'] = size['is_active']
+            yield row
+
+
+def read_rows(stream, fmt):
+    """
+    Đọc file theo luồng
+
+    Yields:
+        (số dòng, dict dòng phẳng) hoặc (số dòng, ValueError) nếu dòng không đọc được
+    """
+    text = _text(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Ô trống = không cập nhật
+            yield reader.line_num, {
+                key.strip(): value.strip() for key, value in row.items()
+                if key and isinstance(value, str) and value.strip() != ''
+            }
+        return
+
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            data = json.loads(raw)
+            if not isinstance(data, dict):
+                raise ValueError("Mỗi dòng phải là một object JSON")
+            # Sản phẩm lồng nhau: tách hết trước để lỗi ở một size không nhập nửa sản phẩm
+            flat = list(_flatten(data)) if 'variants' in data else [data]
+        except json.JSONDecodeError as e:
+            yield line, ValueError(f"JSON không hợp lệ: {str(e)}")
+        except ValueError as e:
+            yield line, e
+        else:
+            for row in flat:
+                yield line, row
+
+
+def _string(value, column, max_length=None):
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f"{column} dài quá {max_length} ký tự")
+    return value
+
+
+def _money(value, column, nullable=False):
+    if value is None and nullable:
+        return None
+    try:
+        amount = Decimal(str(value).replace(',', '')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"{column} không phải là số")
+    if amount < 0 or amount > MAX_MONEY:
+        raise ValueError(f"{column} phải trong khoảng 0 - {MAX_MONEY}")
+    return amount
+
+
+def _quantity(value, column):
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{column} phải là số nguyên")
+    if number < 0:
+        raise ValueError(f"{column} không được âm")
+    return number
+
+
+def _boolean(value, column):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"{column} phải là true/false")
+
+
+def _tags(value):
+    if isinstance(value, list):
+        return [str(tag).strip() for tag in value if str(tag).strip()]
+    return [tag.strip() for tag in str(value).split('|') if tag.strip()]
+
+
+def clean_row(raw):
+    """
+    Kiểm tra và chuyển kiểu một dòng phẳng (chỉ giữ các cột có trong dòng)
+
+    Raises:
+        ValueError: Dòng không hợp lệ
+    """
+    unknown = set(raw) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Cột không hỗ trợ: {', '.join(sorted(unknown))}")
+    for column in ('product_sku', 'color', 'size'):
+        if raw.get(column) in (None, ''):
+            raise ValueError(f"Thiếu {column}")
+
+    row = {}
+    lengths = {
+        'product_sku': 50, 'name': 200, 'short_description': 500, 'material': 100,
+        'color': 30, 'size': 10, 'sku': 50, 'category': None, 'brand': 100, 'description': None,
+    }
+    for column, max_length in lengths.items():
+        if column in raw and raw[column] is not None:
+            row[column] = _string(raw[column], column, max_length)
+    for column in ('price', 'cost_price'):
+        if column in raw:
+            row[column] = _money(raw[column], column)
+    if 'discount_price' in raw:
+        row['discount_price'] = _money(raw['discount_price'], 'discount_price', nullable=True)
+    for column in ('stock_quantity', 'minimum_stock', 'reorder_point'):
+        if column in raw:
+            row[column] = _quantity(raw[column], column)
+    for column in ('is_active', 'is_featured', 'is_new', 'variant_is_active', 'sku_is_active'):
+        if column in raw:
+            row[column] = _boolean(raw[column], column)
+    if 'tags' in raw:
+        row['tags'] = _tags(raw['tags'])
+    if row.get('name') == '':
+        raise ValueError("name không được để trống")
+    return row
+
+
+def _assign(obj, fields, row):
+    """Gán các cột có trong dòng vào object, trả về list field có giá trị thay đổi"""
+    changed = []
+    for column, field in fields.items():
+        if column in row and getattr(obj, field) != row[column]:
+            setattr(obj, field, row[column])
+            changed.append(field)
+    return changed
+
+
+class CatalogImporter:
+    """
+    Nhập catalog theo lô - giữ cache danh mục/thương hiệu và báo cáo giữa các lô
+
+    Args:
+        chunk_size: Số dòng mỗi transaction
+        user: User thực hiện (ghi vào StockHistory)
+        reference: Mã phiếu nhập ghi vào StockHistory
+        progress: Hàm gọi sau mỗi lô với báo cáo hiện tại
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, user=None, reference='', progress=None):
+        self.chunk_size = max(1, chunk_size)
+        self.user = user
+        self.reference = reference or f"IMPORT-{timezone.now():%Y%m%d%H%M%S}"
+        self.progress = progress
+        self.categories = None
+        self.brands = None
+        self.report = {
+            'rows': 0, 'imported': 0,
+            'products_created': 0, 'products_updated': 0,
+            'variants_created': 0, 'variants_updated': 0,
+            'skus_created': 0, 'skus_updated': 0,
+            'error_count': 0, 'errors': [],
+        }
+
+    # ----- Báo cáo -----
+
+    def error(self, line, message):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < MAX_ERRORS:
+            self.report['errors'].append({'line': line, 'error': message})
+
+    # ----- Danh mục / thương hiệu -----
+
+    def load_lookups(self):
+        """Nạp danh mục (theo ID và tên) và thương hiệu (theo tên) một lần"""
+        self.categories = {}
+        for pk, name in Category.objects.values_list('pk', 'name'):
+            self.categories[str(pk)] = [pk]
+            self.categories.setdefault(name.strip().lower(), []).append(pk)
+        self.brands = {name.strip().lower(): pk for pk, name in Brand.objects.values_list('pk', 'name')}
+
+    def resolve_category(self, value):
+        matches = self.categories.get(value.strip().lower(), [])
+        if not matches:
+            raise ValueError(f"Danh mục {value!r} không tồn tại")
+        if len(matches) > 1:
+            raise ValueError(f"Có nhiều danh mục tên {value!r} - dùng ID danh mục")
+        return matches[0]
+
+    def resolve_brands(self, rows):
+        """Tạo các thương hiệu chưa có (trong transaction của lô)"""
+        for _, row in rows:
+            name = row.get('brand')
+            if name and name.lower() not in self.brands:
+                brand, _ = Brand.objects.get_or_create(name=name)
+                self.brands[name.lower()] = brand.pk
+
+    # ----- Nhập -----
+
+    def run(self, rows):
+        """
+        Nhập các dòng (iterable (số dòng, dict hoặc ValueError)) theo lô
+
+        Returns:
+            Báo cáo (dict)
+        """
+        self.load_lookups()
+        chunk = []
+        for line, raw in rows:
+            self.report['rows'] += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                chunk.append((line, clean_row(raw)))
+            except ValueError as e:
+                self.error(line, str(e))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        if self.report['imported']:
+            CatalogCacheService.bump_version()
+        return self.report
+
+    def import_chunk(self, rows):
+        """Ghi một lô trong một transaction (lỗi DB thì cả lô bị bỏ qua và báo lỗi từng dòng)"""
+        try:
+            with transaction.atomic():
+                touched_products, touched_skus = self.write_chunk(rows)
+        except DatabaseError as e:
+            logger.warning(f"Catalog import chunk failed: {str(e)}")
+            for line, _ in rows:
+                self.error(line, f"Lỗi ghi dữ liệu: {str(e)}")
+            # Thương hiệu tạo trong lô đã bị rollback
+            self.load_lookups()
+        else:
+            transaction.on_commit(lambda: self.refresh_indexes(touched_products, touched_skus))
+        if self.progress:
+            self.progress(self.report)
+
+    def write_chunk(self, rows):
+        """
+        Upsert sản phẩm -> variant -> SKU cho một lô
+
+        Returns:
+            (tập product_id, list sku_id đã cập nhật)
+        """
+        now = timezone.now()
+        self.resolve_brands(rows)
+
+        # Bản ghi hiện có: một query mỗi cấp
+        codes = {row['product_sku'] for _, row in rows}
+        products = {product.sku: product for product in Product.objects.filter(sku__in=codes)}
+        codes_by_pk = {product.pk: code for code, product in products.items()}
+        variants = {}
+        for variant in ProductVariant.objects.filter(product_id__in=codes_by_pk):
+            # Gắn sẵn sản phẩm (cấp mã SKU cần product.sku)
+            variant.product = products[codes_by_pk[variant.product_id]]
+            variants[(variant.product.sku, variant.color)] = variant
+        # Khóa SKU trong transaction của lô: tồn kho trước khi nhập là giá trị thật trong DB
+        skus = {
+            (codes_by_pk[sku.variant.product_id], sku.variant.color, sku.size): sku
+            for sku in ProductSKU.objects.select_for_update(of=('self',)).filter(
+                variant__product_id__in=codes_by_pk
+            ).select_related('variant')
+        }
+        stock_before = {key: sku.stock_quantity for key, sku in skus.items() if sku.pk}
+        # Mã SKU ghi rõ trong file: đang thuộc SKU nào trong DB, và dòng nào trong lô đã nhận
+        supplied = {row['sku'] for _, row in rows if row.get('sku')}
+        sku_owners = dict(ProductSKU.objects.filter(sku__in=supplied).values_list('sku', 'pk'))
+        claimed = {}
+
+        new_products, new_variants, new_skus = [], [], []
+        changed_products, changed_variants, changed_skus = {}, {}, {}
+        changed_sku_fields = {}
+        imported = 0
+        for line, row in rows:
+            code, color, size = row['product_sku'], row['color'], row['size']
+            product = products.get(code)
+            variant = variants.get((code, color))
+            sku = skus.get((code, color, size))
+            try:
+                if product is None and ('name' not in row or 'category' not in row):
+                    raise ValueError("Sản phẩm mới cần name và category")
+                if variant is None and 'price' not in row:
+                    raise ValueError("Màu mới cần price")
+                if 'category' in row:
+                    row['category'] = self.resolve_category(row['category'])
+                if 'brand' in row:
+                    row['brand'] = self.brands.get(row['brand'].lower())
+                if row.get('sku'):
+                    owner = sku_owners.get(row['sku'])
+                    if owner is not None and owner != (sku.pk if sku else None):
+                        raise ValueError(f"Mã SKU {row['sku']!r} đã thuộc SKU khác")
+                    if claimed.setdefault(row['sku'], (code, color, size)) != (code, color, size):
+                        raise ValueError(f"Mã SKU {row['sku']!r} bị lặp trong file")
+            except ValueError as e:
+                self.error(line, str(e))
+                continue
+
+            if product is None:
+                product = products[code] = Product(sku=code)
+                new_products.append(product)
+            if _assign(product, PRODUCT_FIELDS, row) and product.pk:
+                changed_products[product.pk] = product
+
+            if variant is None:
+                variant = variants[(code, color)] = ProductVariant(product=product, color=color)
+                new_variants.append(variant)
+            if _assign(variant, VARIANT_FIELDS, row) and variant.pk:
+                changed_variants[variant.pk] = variant
+
+            if sku is None:
+                sku = skus[(code, color, size)] = ProductSKU(variant=variant, size=size)
+                new_skus.append(sku)
+            fields = _assign(sku, SKU_FIELDS, row)
+            if fields and sku.pk:
+                changed_skus[sku.pk] = sku
+                changed_sku_fields.setdefault(sku.pk, set()).update(fields)
+            imported += 1
+
+        # Sản phẩm: bulk_create kèm cấp slug theo lô
+        CodeAllocatorService.bulk_create(Product, new_products, batch_size=500)
+        for product in changed_products.values():
+            product.updated_at = now
+        Product.objects.bulk_update(
+            changed_products.values(), list(PRODUCT_FIELDS.values()) + ['updated_at'], batch_size=500
+        )
+
+        # product_id của variant mới được lấy từ sản phẩm vừa tạo khi bulk_create
+        ProductVariant.objects.bulk_create(new_variants, batch_size=500)
+        for variant in changed_variants.values():
+            variant.updated_at = now
+        ProductVariant.objects.bulk_update(
+            changed_variants.values(), list(VARIANT_FIELDS.values()) + ['updated_at'], batch_size=500
+        )
+
+        # SKU có mã ghi rõ được ghi trước, mã tự cấp sau (allocator mới thấy các mã đó trong DB)
+        # SKU đã có: một bulk_update cho mỗi nhóm cột thay đổi, không gồm tồn kho
+        groups = {}
+        for sku_id, fields in changed_sku_fields.items():
+            fields = frozenset(fields - {'stock_quantity'})
+            if fields:
+                changed_skus[sku_id].updated_at = now
+                groups.setdefault(fields, []).append(changed_skus[sku_id])
+        for fields, group in groups.items():
+            ProductSKU.objects.bulk_update(group, sorted(fields) + ['updated_at'], batch_size=500)
+        ProductSKU.objects.bulk_create([sku for sku in new_skus if sku.sku], batch_size=500)
+        CodeAllocatorService.bulk_create(ProductSKU, [sku for sku in new_skus if not sku.sku], batch_size=500)
+
+        # Tồn kho của SKU đã có: delta (giá trị trong file - giá trị đã khóa) cộng bằng F(),
+        # lịch sử điều chỉnh và cảnh báo của các SKU này do StockService ghi; tóm tắt refresh một lần bên dưới
+        stock_changes = [
+            (skus[key], skus[key].stock_quantity - before) for key, before in stock_before.items()
+            if skus[key].stock_quantity != before
+        ]
+        with ProductSummaryService.suspended():
+            StockService.adjust_stock_many(
+                stock_changes, notes='Nhập catalog', reference_number=self.reference, user=self.user
+            )
+        adjusted = {sku.pk for sku, _ in stock_changes}
+        StockAlertService.reconcile(
+            [sku_id for sku_id in changed_skus if sku_id not in adjusted] + [sku.pk for sku in new_skus],
+            user=self.user
+        )
+
+        # Lịch sử kho: tồn đầu của SKU mới
+        StockHistory.objects.bulk_create([
+            StockHistory(
+                product_sku=sku, transaction_type='import', quantity=sku.stock_quantity,
+                quantity_before=0, quantity_after=sku.stock_quantity, cost_per_item=sku.cost_price,
+                reference_number=self.reference, notes='Nhập catalog', created_by=self.user,
+            )
+            for sku in new_skus if sku.stock_quantity
+        ], batch_size=500)
+
+        touched_products = {products[row['product_sku']].pk for _, row in rows if row['product_sku'] in products}
+        touched_products.discard(None)
+        ProductSummaryService.refresh(touched_products)
+        ProductSearchService.index_products(touched_products)
+
+        report = self.report
+        report['imported'] += imported
+        report['products_created'] += len(new_products)
+        report['products_updated'] += len(changed_products)
+        report['variants_created'] += len(new_variants)
+        report['variants_updated'] += len(changed_variants)
+        report['skus_created'] += len(new_skus)
+        report['skus_updated'] += len(changed_skus)
+        return touched_products, list(changed_skus)
+
+    @staticmethod
+    def refresh_indexes(product_ids, sku_ids):
+        """Sau khi lô commit: làm mới index trong bộ nhớ và cache tồn kho"""
+        fuzzy_search_index.refresh(product_ids)
+        suggestion_index.refresh(product_ids)
+        StockAvailabilityService.invalidate(sku_ids)
+
+
+class CatalogImportService:
+    """Service nhập catalog từ file"""
+
+    @staticmethod
+    def import_file(stream, fmt, chunk_size=CHUNK_SIZE, user=None, reference='', progress=None):
+        """
+        Nhập catalog từ file CSV / NDJSON (file nhị phân hoặc file upload)
+
+        Returns:
+            Báo cáo {'rows', 'imported', '<cấp>_created/_updated', 'error_count', 'errors': [{'line', 'error'}]}
+        """
+        importer = CatalogImporter(chunk_size, user, reference, progress)
+        return importer.run(read_rows(stream, fmt))
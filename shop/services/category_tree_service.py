@@ -0,0 +1,173 @@
+"""
+Category Tree Service
+Materialized path cho cây danh mục: Category.path = "/<id gốc>/.../<id>/"
+
+- Lọc "danh mục và mọi danh mục con" bằng path__startswith (một điều kiện LIKE có index)
+- Đếm sản phẩm gộp cả danh mục con
+- Cây lồng nhau đầy đủ cho mega menu, nhóm theo display_group
+"""
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
+from ..models import Category, Product
+
+
+def _depth(path):
+    return path.count('/') - 2
+
+
+def active_product_count():
+    """Subquery đếm sản phẩm đang bán của danh mục và mọi danh mục con (dùng trong annotate)"""
+    subquery = Product.objects.filter(
+        is_active=True, category__path__startswith=OuterRef('path')
+    ).order_by().annotate(total=Func(F('pk'), function='COUNT')).values('total')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+class CategoryTreeService:
+    """Service duy trì và truy vấn materialized path của Category"""
+
+    @staticmethod
+    def parent_path(parent_id):
+        """Path của danh mục cha ("/" nếu là danh mục gốc)"""
+        if not parent_id:
+            return '/'
+        return Category.objects.filter(pk=parent_id).values_list('path', flat=True).first() or '/'
+
+    @staticmethod
+    def validate_parent(category, parent_path):
+        """Không cho chọn chính nó hoặc danh mục con của nó làm danh mục cha"""
+        if category.pk and f'/{category.pk}/' in parent_path:
+            raise ValidationError('Không thể chọn chính danh mục này hoặc danh mục con của nó làm danh mục cha')
+
+    @staticmethod
+    def move(category, parent_path):
+        """
+        Cập nhật path/depth của danh mục sau khi lưu, và path của toàn bộ cây con nếu đổi cha
+
+        Args:
+            category: Category đã có pk
+            parent_path: Path của danh mục cha tại thời điểm lưu
+        """
+        new_path = f'{parent_path}{category.pk}/'
+        old_path = Category.objects.filter(pk=category.pk).values_list('path', flat=True).first()
+        if old_path != new_path:
+            Category.objects.filter(pk=category.pk).update(path=new_path, depth=_depth(new_path))
+            if old_path:
+                # Thay prefix path cũ bằng path mới cho mọi danh mục con (một câu UPDATE)
+                Category.objects.filter(path__startswith=old_path).exclude(pk=category.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (_depth(new_path) - _depth(old_path)),
+                )
+        category.path = new_path
+        category.depth = _depth(new_path)
+
+    @staticmethod
+    def rebuild():
+        """
+        Tính lại path cho toàn bộ danh mục từ parent (dùng cho migration và khi xóa danh mục cha)
+
+        Returns:
+            Số danh mục được cập nhật
+        """
+        rows = {pk: (parent_id, path) for pk, parent_id, path in Category.objects.values_list('id', 'parent_id', 'path')}
+        paths = {}
+
+        def build(pk, seen=()):
+            if pk not in paths:
+                parent_id = rows[pk][0]
+                if parent_id in rows and parent_id not in seen:
+                    paths[pk] = f'{build(parent_id, seen + (pk,))}{pk}/'
+                else:
+                    paths[pk] = f'/{pk}/'
+            return paths[pk]
+
+        changed = []
+        for pk in rows:
+            path = build(pk)
+            if rows[pk][1] != path:
+                changed.append(Category(pk=pk, path=path, depth=_depth(path)))
+        Category.objects.bulk_update(changed, ['path', 'depth'], batch_size=500)
+        return len(changed)
+
+    @staticmethod
+    def category_map():
+        """{id: (name, path)} của toàn bộ danh mục (bảng nhỏ, một query)"""
+        return {pk: (name, path) for pk, name, path in Category.objects.values_list('id', 'name', 'path')}
+
+    @staticmethod
+    def descendants_q(category_ids, prefix='category__'):
+        """
+        Điều kiện Q: thuộc một trong các danh mục hoặc danh mục con của chúng
+
+        Args:
+            category_ids: ID danh mục đã chọn
+            prefix: Đường dẫn tới Category từ model đang lọc (mặc định từ Product)
+        """
+        paths = Category.objects.filter(pk__in=category_ids).values_list('path', flat=True)
+        conditions = [Q(**{f'{prefix}path__startswith': path}) for path in paths if path]
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(or_, conditions)
+
+    @staticmethod
+    def tree():
+        """
+        Cây danh mục lồng nhau đầy đủ, nhóm theo display_group của danh mục gốc
+
+        Dùng 2 query (danh mục, số sản phẩm theo danh mục), số sản phẩm được cộng dồn lên các cấp cha
+
+        Returns:
+            List [{'display_group', 'label', 'categories': [node...]}] theo thứ tự DISPLAY_GROUP_CHOICES
+        """
+        direct_counts = dict(
+            Product.objects.filter(is_active=True).order_by().values('category_id').annotate(
+                total=Count('pk')
+            ).values_list('category_id', 'total')
+        )
+
+        nodes = {}
+        children = defaultdict(list)
+        categories = Category.objects.order_by('name', 'id').values('id', 'name', 'parent_id', 'display_group', 'path')
+        for category in categories:
+            nodes[category['id']] = {
+                'id': category['id'],
+                'name': category['name'],
+                'display_group': category['display_group'],
+                'product_count': 0,
+                'children': [],
+                'path': category['path'],
+            }
+            children[category['parent_id']].append(category['id'])
+
+        # Cộng số sản phẩm của mỗi danh mục cho chính nó và mọi danh mục cha trong path
+        for category_id, total in direct_counts.items():
+            node = nodes.get(category_id)
+            if not node:
+                continue
+            for ancestor_id in filter(None, node['path'].split('/')):
+                ancestor = nodes.get(int(ancestor_id))
+                if ancestor:
+                    ancestor['product_count'] += total
+
+        for parent_id, child_ids in children.items():
+            if parent_id in nodes:
+                nodes[parent_id]['children'] = [nodes[pk] for pk in child_ids]
+        for node in nodes.values():
+            node.pop('path')
+
+        # Danh mục gốc (kể cả danh mục có parent không tồn tại)
+        roots = sorted(
+            (nodes[pk] for parent_id, child_ids in children.items() if parent_id not in nodes for pk in child_ids),
+            key=lambda node: (node['name'], node['id'])
+        )
+        groups = []
+        for value, label in Category.DISPLAY_GROUP_CHOICES:
+            group_roots = [node for node in roots if node['display_group'] == value]
+            if group_roots:
+                groups.append({'display_group': value, 'label': label, 'categories': group_roots})
+        return groups
@@ -0,0 +1,193 @@
+"""
+Co-purchase Service
+"Thường được mua cùng": thống kê sản phẩm xuất hiện chung trong đơn hàng đã giao / đã thanh toán
+
+- ProductPairCount: ma trận đồng xuất hiện thưa (số đơn chứa cả hai sản phẩm), cộng dồn theo lô
+  đơn hàng mới (Order.co_purchase_indexed)
+- ProductBoughtTogether: top-K láng giềng của mỗi sản phẩm, xếp theo lift
+  lift(a, b) = N * đơn(a, b) / (đơn(a) * đơn(b)), N = tổng số đơn đã thống kê
+"""
+
+import logging
+from collections import Counter, defaultdict
+from itertools import combinations
+from django.db import transaction
+from django.db.models import F, Q
+from ..models import Order, OrderItem, ProductBoughtTogether, ProductPairCount
+
+logger = logging.getLogger(__name__)
+
+# Số láng giềng giữ lại cho mỗi sản phẩm
+TOP_K = 12
+# Số đơn mua chung tối thiểu (lift của cặp chỉ xuất hiện 1 lần rất nhiễu)
+MIN_SUPPORT = 2
+# Số đơn hàng mỗi transaction khi cộng dồn
+ORDER_CHUNK = 1000
+# Số ID trong một điều kiện IN
+ID_CHUNK = 500
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CoPurchaseService:
+    """Service dựng và tra cứu chỉ mục mua kèm"""
+
+    @staticmethod
+    def eligible_orders():
+        """Đơn hàng dùng để thống kê: đã giao hoặc đã thanh toán (trừ đơn hủy / hoàn tiền)"""
+        return Order.objects.filter(
+            Q(status='delivered') | Q(payment_status='paid')
+        ).exclude(status='cancelled').exclude(payment_status='refunded')
+
+    @staticmethod
+    def _baskets(order_ids):
+        """{order_id: tập product_id} của các đơn (một query)"""
+        baskets = defaultdict(set)
+        rows = OrderItem.objects.filter(
+            order_id__in=order_ids, product_sku__isnull=False
+        ).values_list('order_id', 'product_sku__variant__product_id')
+        for order_id, product_id in rows:
+            baskets[order_id].add(product_id)
+        return baskets
+
+    @staticmethod
+    def _apply_counts(deltas):
+        """Cộng dồn {(a, b): số đơn} vào ProductPairCount (đọc một lần, bulk_update + bulk_create)"""
+        products = {product_id for pair in deltas for product_id in pair}
+        existing = {}
+        for ids in _chunks(products, ID_CHUNK):
+            for row in ProductPairCount.objects.filter(product_a__in=ids, product_b__in=products):
+                existing[(row.product_a_id, row.product_b_id)] = row
+
+        changed, created = [], []
+        for (a, b), count in deltas.items():
+            row = existing.get((a, b))
+            if row:
+                row.orders += count
+                changed.append(row)
+            else:
+                created.append(ProductPairCount(product_a_id=a, product_b_id=b, orders=count))
+        ProductPairCount.objects.bulk_update(changed, ['orders'], batch_size=ID_CHUNK)
+        ProductPairCount.objects.bulk_create(created, batch_size=ID_CHUNK)
+
+    @staticmethod
+    def index_new_orders():
+        """
+        Cộng các đơn hợp lệ chưa thống kê vào ma trận đồng xuất hiện (mỗi lô một transaction)
+
+        Returns:
+            Tập product_id có số liệu thay đổi
+        """
+        touched = set()
+        while True:
+            with transaction.atomic():
+                order_ids = list(
+                    CoPurchaseService.eligible_orders().filter(co_purchase_indexed=False)
+                    .select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)[:ORDER_CHUNK]
+                )
+                if not order_ids:
+                    break
+
+                deltas = Counter()
+                for basket in CoPurchaseService._baskets(order_ids).values():
+                    products = sorted(basket)
+                    for product_id in products:
+                        deltas[(product_id, product_id)] += 1
+                    for pair in combinations(products, 2):
+                        deltas[pair] += 1
+                    touched.update(products)
+
+                CoPurchaseService._apply_counts(deltas)
+                Order.objects.filter(id__in=order_ids).update(co_purchase_indexed=True)
+        return touched
+
+    @staticmethod
+    def _neighbours(product_ids):
+        """Những sản phẩm có cặp chung với product_ids (lift của chúng đổi khi đơn(product) đổi)"""
+        neighbours = set()
+        for ids in _chunks(product_ids, ID_CHUNK):
+            pairs = ProductPairCount.objects.filter(Q(product_a__in=ids) | Q(product_b__in=ids))
+            for a, b in pairs.values_list('product_a_id', 'product_b_id'):
+                neighbours.update((a, b))
+        return neighbours
+
+    @staticmethod
+    def rebuild_neighbours(product_ids, top_k=TOP_K, min_support=MIN_SUPPORT):
+        """
+        Tính lại top-K theo lift cho các sản phẩm chỉ định
+
+        Returns:
+            Số dòng ProductBoughtTogether được ghi
+        """
+        total = Order.objects.filter(co_purchase_indexed=True).count()
+        written = 0
+        for ids in _chunks(sorted(product_ids), ID_CHUNK):
+            ids = set(ids)
+            pairs = list(
+                ProductPairCount.objects.filter(Q(product_a__in=ids) | Q(product_b__in=ids))
+                .exclude(product_a=F('product_b')).filter(orders__gte=min_support)
+                .values_list('product_a_id', 'product_b_id', 'orders')
+            )
+            involved = {product_id for a, b, _ in pairs for product_id in (a, b)}
+            support = {}
+            for chunk in _chunks(involved, ID_CHUNK):
+                support.update(
+                    ProductPairCount.objects.filter(product_a__in=chunk, product_b=F('product_a'))
+                    .values_list('product_a_id', 'orders')
+                )
+
+            candidates = defaultdict(list)
+            for a, b, orders in pairs:
+                if not support.get(a) or not support.get(b):
+                    continue
+                lift = total * orders / (support[a] * support[b])
+                if a in ids:
+                    candidates[a].append((lift, orders, b))
+                if b in ids:
+                    candidates[b].append((lift, orders, a))
+
+            rows = []
+            for product_id, neighbours in candidates.items():
+                neighbours.sort(key=lambda item: (-item[0], -item[1], item[2]))
+                rows.extend(
+                    ProductBoughtTogether(
+                        product_id=product_id, related_product_id=related_id,
+                        rank=rank, lift=round(lift, 4), orders=orders,
+                    )
+                    for rank, (lift, orders, related_id) in enumerate(neighbours[:top_k], start=1)
+                )
+            with transaction.atomic():
+                ProductBoughtTogether.objects.filter(product_id__in=ids).delete()
+                ProductBoughtTogether.objects.bulk_create(rows, batch_size=ID_CHUNK)
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def update(top_k=TOP_K, min_support=MIN_SUPPORT):
+        """
+        Cập nhật tăng dần: cộng các đơn mới rồi tính lại top-K cho sản phẩm bị ảnh hưởng
+        (sản phẩm có trong đơn mới và các láng giềng của chúng)
+
+        Returns:
+            (số sản phẩm được tính lại, số dòng ProductBoughtTogether được ghi)
+        """
+        touched = CoPurchaseService.index_new_orders()
+        if not touched:
+            return 0, 0
+        affected = touched | CoPurchaseService._neighbours(touched)
+        written = CoPurchaseService.rebuild_neighbours(affected, top_k, min_support)
+        logger.info(f"Bought-together index updated: {len(affected)} products, {written} rows")
+        return len(affected), written
+
+    @staticmethod
+    def rebuild(top_k=TOP_K, min_support=MIN_SUPPORT):
+        """Xây lại toàn bộ từ đầu (sau khi đổi TOP_K/MIN_SUPPORT hoặc có đơn bị hủy sau khi đã thống kê)"""
+        with transaction.atomic():
+            ProductBoughtTogether.objects.all().delete()
+            ProductPairCount.objects.all().delete()
+            Order.objects.filter(co_purchase_indexed=True).update(co_purchase_indexed=False)
+        return CoPurchaseService.update(top_k, min_support)
@@ -0,0 +1,218 @@
+"""
+Code Allocator Service
+Cấp slug (Product.slug) và mã SKU (Product.sku, ProductSKU.sku) duy nhất cho cả một lô đối tượng
+
+Mỗi lô chỉ cần vài query: tra IN các gốc, rồi lấy base-1, base-2... của các gốc đã bị chiếm
+(truy vấn khoảng theo index unique), hậu tố chống trùng được tính trong bộ nhớ.
+Unique constraint của DB vẫn là chốt chặn cuối: nếu writer khác chiếm mã giữa lúc cấp và lúc ghi thì cấp lại và ghi lại (write_with_retry)
+"""
+
+import re
+import uuid
+from collections import Counter
+from functools import reduce
+from operator import or_
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+from ..models import Product, ProductSKU
+
+# Chừa chỗ cho hậu tố "-<số>" khi cắt gốc theo max_length
+SUFFIX_ROOM = 6
+# Số gốc tối đa trong một query lấy giá trị đang có
+QUERY_CHUNK = 200
+# Số lần cấp lại khi đụng unique constraint
+ALLOCATE_ATTEMPTS = 3
+# Slug trùng đường dẫn cố định products/<...>/ (route products/<slug>/ không bao giờ tới được)
+RESERVED_SLUGS = frozenset({'facets'})
+
+
+def _base(value, max_length, fallback):
+    base = value[:max_length - SUFFIX_ROOM].rstrip('-')
+    return base or fallback
+
+
+def _sku_base(product_sku, color, size):
+    """Mã SKU gốc của một size: <mã sản phẩm>-<màu>-<size>"""
+    return f"{product_sku}-{color}-{size}".upper().replace(' ', '-')
+
+
+class CodeAllocatorService:
+    """Service cấp slug/SKU duy nhất theo lô"""
+
+    @staticmethod
+    def _lookup(model, field, bases, exclude_pks=(), suffixed=False):
+        """
+        Giá trị đang có trong DB bằng base (IN, dùng index unique), hoặc suffixed=True:
+        có dạng base-<số> (khoảng [base-, base.) cũng dùng được index, lọc lại hậu tố số trong bộ nhớ)
+        Một query mỗi QUERY_CHUNK gốc
+        """
+        taken = set()
+        for start in range(0, len(bases), QUERY_CHUNK):
+            chunk = bases[start:start + QUERY_CHUNK]
+            if suffixed:
+                # '-' < '.' liền kề: mọi giá trị bắt đầu bằng "base-" nằm trong [base-, base.)
+                conditions = reduce(or_, [
+                    Q(**{f'{field}__gte': f'{base}-', f'{field}__lt': f'{base}.'}) for base in chunk
+                ])
+            else:
+                conditions = Q(**{f'{field}__in': chunk})
+            queryset = model.objects.filter(conditions).order_by()
+            if exclude_pks:
+                queryset = queryset.exclude(pk__in=exclude_pks)
+            values = queryset.values_list(field, flat=True)
+            if suffixed:
+                pattern = re.compile(rf"(?:{'|'.join(map(re.escape, chunk))})-\d+")
+                values = [value for value in values if pattern.fullmatch(value)]
+            taken.update(values)
+        return taken
+
+    @staticmethod
+    def _taken(model, field, bases, exclude_pks=(), reserved=()):
+        """
+        Tập giá trị đang có trong DB có dạng base hoặc base-<số>
+
+        Tra IN theo index trước; chỉ tra khoảng base-<số> cho các gốc cần hậu tố
+        (đã bị chiếm, bị giữ chỗ hoặc lặp lại trong lô), không kéo về các mã khác chỉ trùng tiền tố
+        """
+        distinct = sorted(set(bases))
+        taken = CodeAllocatorService._lookup(model, field, distinct, exclude_pks) | set(reserved)
+        counts = Counter(bases)
+        crowded = [base for base in distinct if counts[base] > 1 or base in taken]
+        if crowded:
+            taken |= CodeAllocatorService._lookup(model, field, crowded, exclude_pks, suffixed=True)
+        return taken
+
+    @staticmethod
+    def allocate(model, field, bases, exclude_pks=(), reserved=()):
+        """
+        Cấp giá trị duy nhất cho từng gốc (giữ thứ tự): base, base-1, base-2...
+
+        Args:
+            model: Model có cột unique
+            field: Tên cột unique
+            bases: List giá trị gốc (có thể lặp lại trong lô)
+            exclude_pks: Bỏ qua giá trị của các dòng này (khi lưu lại chính dòng đó)
+            reserved: Giá trị không được cấp (coi như đã bị chiếm)
+
+        Returns:
+            List giá trị tương ứng với bases
+        """
+        taken = CodeAllocatorService._taken(model, field, bases, exclude_pks, reserved)
+        next_suffix = {}
+        values = []
+        for base in bases:
+            value = base
+            if value in taken:
+                counter = next_suffix.get(base, 1)
+                while f"{base}-{counter}" in taken:
+                    counter += 1
+                next_suffix[base] = counter + 1
+                value = f"{base}-{counter}"
+            taken.add(value)
+            values.append(value)
+        return values
+
+    @staticmethod
+    def allocate_slugs(names, exclude_pks=()):
+        """
+        Slug duy nhất cho một lô tên sản phẩm
+
+        Không cấp RESERVED_SLUGS và slug toàn chữ số (products/<int:pk>/ bắt trước products/<slug>/)
+        """
+        max_length = Product._meta.get_field('slug').max_length
+        bases = [_base(slugify(name or ''), max_length, 'san-pham') for name in names]
+        reserved = RESERVED_SLUGS | {base for base in bases if base.isdigit()}
+        return CodeAllocatorService.allocate(Product, 'slug', bases, exclude_pks, reserved)
+
+    @staticmethod
+    def allocate_skus(bases, exclude_pks=()):
+        """Mã ProductSKU duy nhất cho một lô mã gốc (xem _sku_base)"""
+        max_length = ProductSKU._meta.get_field('sku').max_length
+        bases = [_base(base, max_length, 'SKU') for base in bases]
+        return CodeAllocatorService.allocate(ProductSKU, 'sku', bases, exclude_pks)
+
+    @staticmethod
+    def assign(objs):
+        """
+        Điền slug/sku còn trống cho một lô Product hoặc ProductSKU chưa lưu (hoặc đang lưu lại)
+
+        Các cột được điền tự động được ghi nhớ trong obj._allocated_fields để reset() khi cần cấp lại
+        """
+        products = [obj for obj in objs if isinstance(obj, Product)]
+        skus = [obj for obj in objs if isinstance(obj, ProductSKU)]
+
+        for product in products:
+            product._allocated_fields = []
+            if not product.sku:
+                product.sku = f"PRD-{uuid.uuid4().hex[:8].upper()}"
+                product._allocated_fields.append('sku')
+        pending = [product for product in products if not product.slug]
+        if pending:
+            slugs = CodeAllocatorService.allocate_slugs(
+                [product.name for product in pending],
+                exclude_pks=[product.pk for product in pending if product.pk]
+            )
+            for product, slug in zip(pending, slugs):
+                product.slug = slug
+                product._allocated_fields.append('slug')
+
+        pending = [sku for sku in skus if not sku.sku]
+        for sku in skus:
+            sku._allocated_fields = []
+        if pending:
+            bases = []
+            for sku in pending:
+                product = sku.variant.product
+                bases.append(_sku_base(product.sku or f"PRD-{product.id}", sku.variant.color, sku.size))
+            codes = CodeAllocatorService.allocate_skus(bases, exclude_pks=[sku.pk for sku in pending if sku.pk])
+            for sku, code in zip(pending, codes):
+                sku.sku = code
+                sku._allocated_fields.append('sku')
+        return objs
+
+    @staticmethod
+    def reset(objs):
+        """Xóa các giá trị đã được assign() điền tự động"""
+        for obj in objs:
+            for field in getattr(obj, '_allocated_fields', ()):
+                setattr(obj, field, '')
+            obj._allocated_fields = []
+
+    @staticmethod
+    def write_with_retry(objs, write, attempts=ALLOCATE_ATTEMPTS):
+        """
+        Cấp mã cho objs rồi gọi write() trong một savepoint; nếu đụng unique constraint
+        (writer khác vừa chiếm cùng mã) thì cấp lại và ghi lại
+
+        Args:
+            objs: Lô Product/ProductSKU
+            write: Hàm ghi lô xuống DB (save / bulk_create)
+
+        Returns:
+            Kết quả của write()
+        """
+        states = [(obj.pk, obj._state.adding) for obj in objs]
+        for attempt in range(attempts):
+            CodeAllocatorService.assign(objs)
+            allocated = any(getattr(obj, '_allocated_fields', None) for obj in objs)
+            try:
+                with transaction.atomic():
+                    return write()
+            except IntegrityError:
+                # Chỉ thử lại khi có mã được cấp tự động (lỗi khác thì không cấp lại được)
+                if not allocated or attempt == attempts - 1:
+                    raise
+                CodeAllocatorService.reset(objs)
+                # bulk_create có thể đã gán pk trước khi rollback
+                for obj, (pk, adding) in zip(objs, states):
+                    obj.pk = pk
+                    obj._state.adding = adding
+
+    @staticmethod
+    def bulk_create(model, objs, batch_size=500):
+        """bulk_create một lô Product hoặc ProductSKU kèm cấp slug/SKU theo lô"""
+        objs = list(objs)
+        return CodeAllocatorService.write_with_retry(
+            objs, lambda: model.objects.bulk_create(objs, batch_size=batch_size)
+        )
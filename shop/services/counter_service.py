@@ -0,0 +1,186 @@
+"""
+Counter Service
+Bộ đếm ghi trễ (write-behind) cho các cột đếm "nóng" như Product.view_count
+
+Mỗi process gom số tăng trong bộ nhớ, định kỳ ghi xuống DB bằng UPDATE ... SET f = f + n
+(gom các dòng có cùng n vào một câu UPDATE), thay cho read-modify-write save() mỗi lần xem
+
+- increment() chỉ cộng vào buffer; việc ghi do một thread nền (daemon) của process đảm nhận,
+  request không bao giờ phải trả chi phí UPDATE
+- Thread nền khởi động khi có increment đầu tiên (sau fork cũng vậy), flush theo flush_interval
+  hoặc sớm hơn khi buffer vượt max_pending; atexit flush phần còn lại
+- stop_flusher() / reset_all() cho test: tắt thread nền và bỏ số đếm đang chờ
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import F
+from ..models import Product
+
+logger = logging.getLogger(__name__)
+
+# Số ID tối đa trong một câu UPDATE
+BATCH_SIZE = 500
+
+# Tất cả bộ đếm đã tạo (để flush_all khi tắt process)
+_counters = []
+
+# Thread nền flush bộ đếm: (pid, thread) - thread không sống qua fork nên kiểm tra pid
+_flusher = None
+_flusher_enabled = True
+_flusher_lock = threading.Lock()
+_wake = threading.Event()
+
+
+class BufferedCounter:
+    """
+    Bộ đếm ghi trễ cho một cột số nguyên của model
+
+    Args:
+        model: Model chứa cột đếm
+        field: Tên cột đếm
+        flush_interval: Ghi xuống DB sau tối đa bấy nhiêu giây (tính từ lần flush trước)
+        max_pending: Hoặc sớm hơn khi số dòng đang chờ vượt ngưỡng này
+    """
+
+    def __init__(self, model, field, flush_interval=10, max_pending=500):
+        self.model = model
+        self.field = field
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _counters.append(self)
+
+    def increment(self, pk, amount=1):
+        """Cộng amount cho dòng pk (thread nền ghi xuống DB ở lần flush tiếp theo)"""
+        with self._lock:
+            self._pending[pk] += amount
+            full = len(self._pending) >= self.max_pending
+        _ensure_flusher()
+        if full:
+            _wake.set()
+
+    def due(self):
+        """Đã đến lúc flush (quá flush_interval hoặc buffer vượt max_pending)"""
+        with self._lock:
+            return bool(self._pending) and (
+                len(self._pending) >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def pending(self, pk):
+        """Số tăng chưa ghi xuống DB của dòng pk"""
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def flush(self):
+        """
+        Ghi toàn bộ số tăng đang chờ xuống DB
+
+        Returns:
+            Số dòng đã cập nhật
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        by_amount = defaultdict(list)
+        for pk, amount in pending.items():
+            by_amount[amount].append(pk)
+        try:
+            updated = 0
+            with transaction.atomic():
+                for amount, pks in by_amount.items():
+                    for start in range(0, len(pks), BATCH_SIZE):
+                        updated += self.model.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(
+                            **{self.field: F(self.field) + amount}
+                        )
+            return updated
+        except Exception as e:
+            # Ghi lỗi thì trả lại số đếm vào buffer để lần sau ghi tiếp
+            logger.error(f"Flush {self.model.__name__}.{self.field} failed: {str(e)}")
+            with self._lock:
+                for pk, amount in pending.items():
+                    self._pending[pk] += amount
+            return 0
+
+    def reset(self):
+        """Bỏ toàn bộ số tăng đang chờ (không ghi xuống DB)"""
+        with self._lock:
+            self._pending = defaultdict(int)
+            self._last_flush = time.monotonic()
+
+
+def flush_all():
+    """Flush mọi bộ đếm (gọi khi tắt process hoặc trước khi cần số liệu chính xác)"""
+    for counter in _counters:
+        counter.flush()
+
+
+def reset_all():
+    """Bỏ số đếm đang chờ của mọi bộ đếm (dọn trạng thái giữa các test)"""
+    for counter in _counters:
+        counter.reset()
+
+
+def _run_flusher():
+    while True:
+        interval = min((counter.flush_interval for counter in _counters), default=10)
+        _wake.wait(min(interval, 1))
+        _wake.clear()
+        if not _flusher_enabled:
+            return
+        due = [counter for counter in _counters if counter.due()]
+        if not due:
+            continue
+        try:
+            for counter in due:
+                counter.flush()
+        finally:
+            # Thread nền giữ connection riêng - đóng để không giữ kết nối mở giữa các lần flush
+            connection.close()
+
+
+def _ensure_flusher():
+    """Khởi động thread nền flush bộ đếm của process hiện tại (nếu chưa chạy)"""
+    global _flusher
+    if not _flusher_enabled:
+        return
+    pid = os.getpid()
+    if _flusher is not None and _flusher[0] == pid and _flusher[1].is_alive():
+        return
+    with _flusher_lock:
+        if _flusher is None or _flusher[0] != pid or not _flusher[1].is_alive():
+            thread = threading.Thread(target=_run_flusher, name='buffered-counter-flush', daemon=True)
+            thread.start()
+            _flusher = (pid, thread)
+
+
+def stop_flusher():
+    """Tắt thread nền (test flush thủ công bằng flush_all)"""
+    global _flusher_enabled
+    _flusher_enabled = False
+    _wake.set()
+
+
+def start_flusher():
+    """Bật lại thread nền sau stop_flusher"""
+    global _flusher_enabled
+    _flusher_enabled = True
+    _ensure_flusher()
+
+
+atexit.register(flush_all)
+
+
+# Lượt xem sản phẩm
+product_view_counter = BufferedCounter(Product, 'view_count')
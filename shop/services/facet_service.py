@@ -0,0 +1,214 @@
+"""
+Product Facet Service
+Đếm facet (danh mục, thương hiệu, khoảng giá, màu, size, hàng mới/giảm giá) cho bộ lọc sản phẩm
+
+Facet được đếm theo kiểu disjunctive: số lượng của một facet tính theo tất cả bộ lọc
+đang chọn TRỪ chính facet đó, để người dùng thấy được các lựa chọn thay thế
+"""
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from django.db.models import Exists, OuterRef
+from ..models import ProductVariant, ProductSKU
+from .category_tree_service import CategoryTreeService
+
+
+FACETS = ('category', 'brand', 'price', 'color', 'size', 'is_new', 'on_sale')
+
+# Khoảng giá (VNĐ): (key, min, max) - max = None là không giới hạn
+PRICE_BUCKETS = (
+    ('under-200k', Decimal('0'), Decimal('200000')),
+    ('200k-500k', Decimal('200000'), Decimal('500000')),
+    ('500k-1m', Decimal('500000'), Decimal('1000000')),
+    ('over-1m', Decimal('1000000'), None),
+)
+
+
+def _split(value):
+    """Tách tham số dạng 'a,b,c' thành list (bỏ giá trị rỗng)"""
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def _in_price_range(min_price, max_price, low, high):
+    """Khoảng giá của sản phẩm giao với [low, high] (cùng điều kiện với bộ lọc min_price/max_price)"""
+    return (low is None or max_price >= low) and (high is None or min_price <= high)
+
+
+class ProductFacetService:
+    """Service parse/áp dụng bộ lọc facet và đếm facet cho danh sách sản phẩm"""
+
+    @staticmethod
+    def parse_selection(params):
+        """
+        Đọc các facet đang chọn từ query params
+
+        Hỗ trợ nhiều giá trị cách nhau bởi dấu phẩy: ?category=1,2&brand=3&color=Đỏ,Đen&size=M,L
+        Khoảng giá: ?min_price=...&max_price=...; cờ: ?is_new=1&on_sale=1
+
+        Returns:
+            Dict {facet: giá trị đã chọn} (giá trị rỗng/None = không lọc)
+        """
+        min_price = _decimal(params.get('min_price'))
+        max_price = _decimal(params.get('max_price'))
+        return {
+            'category': {int(pk) for pk in _split(params.get('category')) if pk.isdigit()},
+            'brand': {int(pk) for pk in _split(params.get('brand')) if pk.isdigit()},
+            'price': (min_price, max_price) if min_price is not None or max_price is not None else None,
+            'color': set(_split(params.get('color'))),
+            'size': set(_split(params.get('size'))),
+            'is_new': bool(params.get('is_new')),
+            'on_sale': bool(params.get('on_sale')),
+        }
+
+    @staticmethod
+    def apply_selection(queryset, selection):
+        """Lọc queryset Product theo các facet đang chọn"""
+        if selection['category']:
+            # Gồm cả sản phẩm thuộc danh mục con (materialized path)
+            queryset = queryset.filter(CategoryTreeService.descendants_q(selection['category']))
+        if selection['brand']:
+            queryset = queryset.filter(brand_id__in=selection['brand'])
+        if selection['price']:
+            # Dùng khoảng giá tóm tắt (min_price/max_price) thay vì join variants
+            low, high = selection['price']
+            if low is not None:
+                queryset = queryset.filter(max_price__gte=low)
+            if high is not None:
+                queryset = queryset.filter(min_price__lte=high)
+        if selection['color']:
+            queryset = queryset.filter(Exists(ProductVariant.objects.filter(
+                product=OuterRef('pk'), color__in=selection['color']
+            )))
+        if selection['size']:
+            queryset = queryset.filter(Exists(ProductSKU.objects.filter(
+                variant__product=OuterRef('pk'), size__in=selection['size']
+            )))
+        if selection['is_new']:
+            queryset = queryset.filter(is_new=True)
+        if selection['on_sale']:
+            queryset = queryset.filter(is_on_sale=True)
+        return queryset
+
+    @staticmethod
+    def facet_counts(queryset, selection):
+        """
+        Đếm tất cả facet trong một lượt duyệt
+
+        Chỉ dùng 4 query (danh mục, sản phẩm, màu, size) trên queryset gốc (đã áp dụng search,
+        chưa áp dụng facet), sau đó mỗi sản phẩm được xét một lần: sản phẩm khớp tất cả
+        facet được đếm vào mọi facet, sản phẩm chỉ trượt đúng một facet F được đếm vào F.
+        Sản phẩm được đếm cho danh mục của nó và mọi danh mục cha
+
+        Args:
+            queryset: Product queryset chưa áp dụng facet
+            selection: Kết quả parse_selection()
+
+        Returns:
+            Dict {'count': số sản phẩm khớp, <facet>: danh sách giá trị kèm count}
+        """
+        queryset = queryset.prefetch_related(None).order_by()
+        product_ids = queryset.values('pk')
+
+        colors = defaultdict(set)
+        for product_id, color in ProductVariant.objects.filter(
+            product__in=product_ids
+        ).order_by().values_list('product_id', 'color').distinct():
+            colors[product_id].add(color)
+
+        sizes = defaultdict(set)
+        for product_id, size in ProductSKU.objects.filter(
+            variant__product__in=product_ids
+        ).order_by().values_list('variant__product_id', 'size').distinct():
+            sizes[product_id].add(size)
+
+        categories = CategoryTreeService.category_map()
+        names = {'category': {}, 'brand': {}}
+        counts = {facet: defaultdict(int) for facet in FACETS}
+        total = 0
+        price = selection['price']
+
+        rows = queryset.values_list(
+            'pk', 'category__path', 'brand_id', 'brand__name',
+            'is_new', 'is_on_sale', 'min_price', 'max_price'
+        )
+        for pk, category_path, brand_id, brand_name, is_new, on_sale, min_price, max_price in rows:
+            category_ids = [int(category_id) for category_id in category_path.split('/') if category_id]
+            product_colors = colors.get(pk, ())
+            product_sizes = sizes.get(pk, ())
+            failed = [facet for facet, matched in (
+                ('category', not selection['category'] or not selection['category'].isdisjoint(category_ids)),
+                ('brand', not selection['brand'] or brand_id in selection['brand']),
+                ('price', not price or _in_price_range(min_price, max_price, *price)),
+                ('color', not selection['color'] or not selection['color'].isdisjoint(product_colors)),
+                ('size', not selection['size'] or not selection['size'].isdisjoint(product_sizes)),
+                ('is_new', not selection['is_new'] or is_new),
+                ('on_sale', not selection['on_sale'] or on_sale),
+            ) if not matched]
+            if len(failed) > 1:
+                continue
+            if not failed:
+                total += 1
+            # Facet duy nhất bị trượt (None = khớp tất cả)
+            only = failed[0] if failed else None
+
+            if only in (None, 'category'):
+                for category_id in category_ids:
+                    if category_id in categories:
+                        counts['category'][category_id] += 1
+                        names['category'][category_id] = categories[category_id][0]
+            if only in (None, 'brand') and brand_id is not None:
+                counts['brand'][brand_id] += 1
+                names['brand'][brand_id] = brand_name
+            if only in (None, 'price'):
+                for key, low, high in PRICE_BUCKETS:
+                    if (high is None or min_price < high) and max_price >= low:
+                        counts['price'][key] += 1
+            if only in (None, 'color'):
+                for color in product_colors:
+                    counts['color'][color] += 1
+            if only in (None, 'size'):
+                for size in product_sizes:
+                    counts['size'][size] += 1
+            if only in (None, 'is_new') and is_new:
+                counts['is_new'][True] += 1
+            if only in (None, 'on_sale') and on_sale:
+                counts['on_sale'][True] += 1
+
+        def ranked(facet):
+            return sorted(counts[facet].items(), key=lambda item: (-item[1], str(item[0])))
+
+        return {
+            'count': total,
+            'category': [
+                {'id': pk, 'name': names['category'][pk], 'count': count, 'selected': pk in selection['category']}
+                for pk, count in ranked('category')
+            ],
+            'brand': [
+                {'id': pk, 'name': names['brand'][pk], 'count': count, 'selected': pk in selection['brand']}
+                for pk, count in ranked('brand')
+            ],
+            'price': [
+                {
+                    'key': key, 'min': low, 'max': high, 'count': counts['price'][key],
+                    'selected': price == (low, high),
+                }
+                for key, low, high in PRICE_BUCKETS
+            ],
+            'color': [
+                {'value': value, 'count': count, 'selected': value in selection['color']}
+                for value, count in ranked('color')
+            ],
+            'size': [
+                {'value': value, 'count': count, 'selected': value in selection['size']}
+                for value, count in ranked('size')
+            ],
+            'is_new': {'count': counts['is_new'][True], 'selected': selection['is_new']},
+            'on_sale': {'count': counts['on_sale'][True], 'selected': selection['on_sale']},
+        }
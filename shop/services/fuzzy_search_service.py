@@ -0,0 +1,234 @@
+"""
+Fuzzy Search Service
+Index tìm kiếm trong bộ nhớ: không phân biệt dấu tiếng Việt, chịu được lỗi gõ 1-2 ký tự
+(trigram index trên từ vựng của tên sản phẩm, thương hiệu và danh mục)
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from ..models import Product
+from ..utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Trọng số theo nguồn của từ
+NAME_WEIGHT = 3
+BRAND_WEIGHT = 2
+CATEGORY_WEIGHT = 1
+
+
+def trigrams(term):
+    """Tập trigram của một từ (có đệm 2 ký tự đầu, 1 ký tự cuối)"""
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term):
+    """Số lỗi gõ cho phép theo độ dài từ"""
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Khoảng cách Damerau-Levenshtein (có hoán vị 2 ký tự liền kề), dừng sớm khi vượt limit
+
+    Returns:
+        Khoảng cách, hoặc limit + 1 nếu vượt ngưỡng
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class FuzzySearchIndex:
+    """
+    Index trong bộ nhớ của mỗi process
+
+    - terms: từ -> {product_id: trọng số}
+    - grams: trigram -> tập từ chứa trigram đó
+    Tải toàn bộ lần đầu, sau đó chỉ nạp các Product có updated_at mới hơn lần nạp trước
+    """
+
+    REFRESH_INTERVAL = 30  # giây
+    # Đọc lùi lại một chút để không bỏ sót transaction commit muộn (nạp lại là idempotent)
+    REFRESH_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.terms = defaultdict(dict)
+        self.grams = defaultdict(set)
+        self.product_terms = {}
+        self.sorted_terms = []
+        self.loaded = False
+        self.last_updated_at = None
+        self.last_refresh = 0
+
+    # ----- Xây dựng index -----
+
+    def _remove(self, product_id):
+        for term in self.product_terms.pop(product_id, ()):
+            products = self.terms.get(term)
+            if products is None:
+                continue
+            products.pop(product_id, None)
+            if not products:
+                del self.terms[term]
+                for gram in trigrams(term):
+                    self.grams[gram].discard(term)
+                index = bisect.bisect_left(self.sorted_terms, term)
+                if index < len(self.sorted_terms) and self.sorted_terms[index] == term:
+                    self.sorted_terms.pop(index)
+
+    def _add(self, product_id, name, brand, category):
+        product_terms = {}
+        for text, weight in ((category, CATEGORY_WEIGHT), (brand, BRAND_WEIGHT), (name, NAME_WEIGHT)):
+            for term in normalize_text(text).split():
+                product_terms[term] = max(weight, product_terms.get(term, 0))
+        for term, weight in product_terms.items():
+            if term not in self.terms:
+                for gram in trigrams(term):
+                    self.grams[gram].add(term)
+                bisect.insort(self.sorted_terms, term)
+            self.terms[term][product_id] = weight
+        self.product_terms[product_id] = set(product_terms)
+
+    def _load_rows(self, queryset):
+        rows = queryset.values_list('id', 'name', 'brand__name', 'category__name', 'is_active', 'updated_at')
+        for product_id, name, brand, category, is_active, updated_at in rows.iterator(chunk_size=2000):
+            self._remove(product_id)
+            if is_active:
+                self._add(product_id, name, brand, category)
+            if self.last_updated_at is None or updated_at > self.last_updated_at:
+                self.last_updated_at = updated_at
+
+    def load(self):
+        """Nạp toàn bộ sản phẩm vào index"""
+        with self._lock:
+            self._reset()
+            self._load_rows(Product.objects.filter(is_active=True))
+            self.loaded = True
+            self.last_refresh = time.monotonic()
+            logger.info(f"Fuzzy search index loaded: {len(self.product_terms)} products, {len(self.terms)} terms")
+
+    def refresh(self, product_ids=None):
+        """
+        Nạp lại các sản phẩm thay đổi kể từ lần nạp trước (theo updated_at),
+        hoặc các sản phẩm chỉ định (ví dụ khi đổi tên Brand/Category)
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            if product_ids is not None:
+                self._load_rows(Product.objects.filter(pk__in=list(product_ids)))
+            elif self.last_updated_at is not None:
+                self._load_rows(Product.objects.filter(updated_at__gt=self.last_updated_at - self.REFRESH_OVERLAP))
+            else:
+                self._load_rows(Product.objects.all())
+            self.last_refresh = time.monotonic()
+
+    def remove(self, product_id):
+        """Gỡ sản phẩm khỏi index (khi bị xóa)"""
+        with self._lock:
+            self._remove(product_id)
+
+    def ensure_fresh(self):
+        """Nạp lần đầu hoặc refresh nếu đã quá REFRESH_INTERVAL"""
+        if not self.loaded:
+            self.load()
+        elif time.monotonic() - self.last_refresh > self.REFRESH_INTERVAL:
+            self.refresh()
+
+    # ----- Tra cứu -----
+
+    def _match_term(self, query_term, allow_prefix):
+        """
+        Tìm các từ trong index khớp với từ truy vấn
+
+        Returns:
+            Dict {term: độ tương đồng 0..1}
+        """
+        limit = max_edits(query_term)
+        matches = {}
+        if query_term in self.terms:
+            matches[query_term] = 1.0
+        if allow_prefix:
+            index = bisect.bisect_left(self.sorted_terms, query_term)
+            while index < len(self.sorted_terms) and self.sorted_terms[index].startswith(query_term):
+                matches.setdefault(self.sorted_terms[index], 0.9)
+                index += 1
+        if limit == 0:
+            return matches
+
+        # Ứng viên phải chung đủ trigram (mỗi lỗi gõ làm mất tối đa 3 trigram)
+        query_grams = trigrams(query_term)
+        required = max(1, len(query_grams) - 3 * limit)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for term in self.grams.get(gram, ()):
+                shared[term] += 1
+        for term, count in shared.items():
+            if count < required or term in matches:
+                continue
+            distance = edit_distance(query_term, term, limit)
+            if distance <= limit:
+                matches[term] = 1.0 - distance / (len(query_term) + 1)
+        return matches
+
+    def search(self, text, limit=1000):
+        """
+        Tìm sản phẩm (mọi từ trong truy vấn đều phải khớp)
+
+        Returns:
+            List ID sản phẩm sắp xếp theo điểm giảm dần
+        """
+        query_terms = normalize_text(text).split()
+        if not query_terms:
+            return []
+        self.ensure_fresh()
+
+        with self._lock:
+            scores = None
+            for position, query_term in enumerate(query_terms):
+                term_scores = {}
+                allow_prefix = position == len(query_terms) - 1
+                for term, similarity in self._match_term(query_term, allow_prefix).items():
+                    for product_id, weight in self.terms[term].items():
+                        score = similarity * weight
+                        if score > term_scores.get(product_id, 0):
+                            term_scores[product_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: scores[pk] + score for pk, score in term_scores.items() if pk in scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+# Index dùng chung trong process
+fuzzy_search_index = FuzzySearchIndex()
@@ -0,0 +1,62 @@
+"""
+Home Page Service
+Dữ liệu trang chủ (sản phẩm nổi bật, hàng mới, bán chạy, từng display_group, menu danh mục)
+trong một lần build với số query cố định - mỗi sản phẩm chỉ được đọc một lần dù xuất hiện ở nhiều mục
+"""
+
+from ..models import Category, Product
+from .category_tree_service import CategoryTreeService
+from .recommendation_service import RecommendationService
+
+# Số sản phẩm mỗi mục
+SECTION_SIZE = 12
+
+
+class HomePageService:
+    """Service dựng dữ liệu trang chủ"""
+
+    @staticmethod
+    def section_ids(section_size=SECTION_SIZE):
+        """
+        ID sản phẩm của từng mục (mỗi mục một query values_list, các display_group lấy từ cache bán chạy)
+
+        Returns:
+            Dict {'featured', 'new', 'best_sellers': [id...], 'groups': {display_group: [id...]}}
+        """
+        active = Product.objects.filter(is_active=True)
+        return {
+            'featured': list(
+                active.filter(is_featured=True).order_by('-sold_count', '-id').values_list('pk', flat=True)[:section_size]
+            ),
+            'new': list(
+                active.filter(is_new=True).order_by('-created_at', '-id').values_list('pk', flat=True)[:section_size]
+            ),
+            'best_sellers': list(
+                active.order_by('-sold_count', '-id').values_list('pk', flat=True)[:section_size]
+            ),
+            'groups': RecommendationService.best_sellers(section_size),
+        }
+
+    @staticmethod
+    def build(card_values, section_size=SECTION_SIZE):
+        """
+        Dữ liệu trang chủ
+
+        Args:
+            card_values: Các field .values() của product card (ProductCardSerializer.VALUES)
+            section_size: Số sản phẩm mỗi mục
+
+        Returns:
+            (dict {product_id: dòng card}, dict các mục chứa list ID, cây danh mục)
+        """
+        sections = HomePageService.section_ids(section_size)
+        product_ids = set(sections['featured']) | set(sections['new']) | set(sections['best_sellers'])
+        for ids in sections['groups'].values():
+            product_ids.update(ids)
+        # Một query cho toàn bộ product card của mọi mục
+        cards = {row['id']: row for row in Product.objects.filter(pk__in=product_ids).values(*card_values)}
+        sections['groups'] = [
+            {'display_group': value, 'label': label, 'products': sections['groups'][value]}
+            for value, label in Category.DISPLAY_GROUP_CHOICES if sections['groups'].get(value)
+        ]
+        return cards, sections, CategoryTreeService.tree()
@@ -0,0 +1,184 @@
+"""
+Image Rendition Service
+Tạo ảnh thu nhỏ (thumbnail, card, detail, zoom) dạng WebP và JPEG cho ProductVariantImage
+
+Ảnh gốc được resize trên thread pool (không chặn request upload), kết quả lưu cạnh blob gốc:
+  products/blobs/<xx>/renditions/<sha256>/<kích thước>.<webp|jpg>
+và được ghi vào ProductVariantImage.renditions để serializer trả URL
+- Ảnh thu nhỏ thuộc về blob, không thuộc về ảnh: mọi ProductVariantImage cùng blob dùng chung
+  (ảnh mới trỏ tới blob đã có ảnh thu nhỏ thì chép renditions, không resize lại)
+- Thư mục ảnh thu nhỏ bị xóa cùng blob khi tham chiếu cuối cùng bị xóa (MediaBlobService)
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from ..models import ProductVariantImage
+from .catalog_cache_service import CatalogCacheService
+
+logger = logging.getLogger(__name__)
+
+# Kích thước: cạnh dài tối đa (px) - không phóng to ảnh nhỏ hơn
+RENDITION_SIZES = (
+    ('thumbnail', 160),
+    ('card', 480),
+    ('detail', 960),
+    ('zoom', 1600),
+)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2), thread_name_prefix='rendition'
+            )
+        return _executor
+
+
+def rendition_dir(image_name):
+    """Thư mục chứa ảnh thu nhỏ của một ảnh gốc"""
+    directory, filename = os.path.split(image_name)
+    return os.path.join(directory, 'renditions', os.path.splitext(filename)[0])
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode != 'RGB':
+            # JPEG không có kênh alpha - ghép lên nền trắng
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def _save(path, content):
+    # Tên cố định theo ảnh gốc - ghi đè kết quả cũ
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    return default_storage.save(path, content)
+
+
+class ImageRenditionService:
+    """Service tạo / xóa ảnh thu nhỏ"""
+
+    @staticmethod
+    def render(image_name):
+        """
+        Tạo mọi kích thước cho một ảnh gốc trong storage
+
+        Returns:
+            Dict {kích thước: {'width', 'height', 'webp', 'jpeg'}} (đường dẫn trong storage)
+        """
+        directory = rendition_dir(image_name)
+        storage = ProductVariantImage._meta.get_field('image').storage
+        with storage.open(image_name, 'rb') as source:
+            original = ImageOps.exif_transpose(Image.open(source))
+            original.load()
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info or 'A' in original.getbands() else 'RGB')
+
+        renditions = {}
+        # Resize từ lớn đến nhỏ, mỗi lần dùng kết quả trước làm nguồn (nhanh hơn resize từ ảnh gốc)
+        source = original
+        for name, max_edge in reversed(RENDITION_SIZES):
+            resized = source.copy()
+            resized.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            renditions[name] = {
+                'width': resized.width,
+                'height': resized.height,
+                'webp': _save(os.path.join(directory, f'{name}.webp'), _encode(resized, 'webp')),
+                'jpeg': _save(os.path.join(directory, f'{name}.jpg'), _encode(resized, 'jpeg')),
+            }
+            source = resized
+        return {name: renditions[name] for name, _ in RENDITION_SIZES}
+
+    @staticmethod
+    def generate(image_id, bump_version=True):
+        """
+        Tạo ảnh thu nhỏ cho ProductVariantImage và lưu vào cột renditions
+
+        Args:
+            image_id: ID ProductVariantImage
+            bump_version: Tăng catalog version ngay (backfill thì tăng một lần khi xong)
+
+        Returns:
+            True nếu thành công
+        """
+        image_name = ProductVariantImage.objects.filter(pk=image_id).values_list('image', flat=True).first()
+        if not image_name:
+            return False
+        try:
+            renditions = ImageRenditionService.render(image_name)
+        except Exception as e:
+            logger.error(f"Rendition failed for image #{image_id} ({image_name}): {str(e)}")
+            return False
+        # update() để không kích hoạt lại signal post_save
+        updated = ProductVariantImage.objects.filter(pk=image_id, image=image_name).update(renditions=renditions)
+        if updated and bump_version:
+            # Response catalog đã cache đang trỏ vào ảnh gốc
+            CatalogCacheService.bump_version()
+        return bool(updated)
+
+    @staticmethod
+    def run(image_id, bump_version=True):
+        """generate() trên thread của pool (đóng connection DB của thread khi xong)"""
+        try:
+            return ImageRenditionService.generate(image_id, bump_version)
+        finally:
+            # Mỗi thread của pool có connection riêng - đóng sau mỗi việc
+            connection.close()
+
+    @staticmethod
+    def is_current(image):
+        """Ảnh thu nhỏ đã lưu có thuộc về file ảnh hiện tại không"""
+        if not image.image or not image.renditions:
+            return False
+        directory = rendition_dir(image.image.name)
+        return all(
+            formats.get('webp', '').startswith(directory) for formats in image.renditions.values()
+        )
+
+    @staticmethod
+    def schedule(image_id):
+        """Tạo ảnh thu nhỏ trên thread pool sau khi transaction hiện tại commit"""
+        transaction.on_commit(lambda: _pool().submit(ImageRenditionService.run, image_id))
+
+    @staticmethod
+    def delete_for(image_name):
+        """Xóa mọi ảnh thu nhỏ của một file ảnh gốc (đường dẫn suy ra từ tên file)"""
+        directory = rendition_dir(image_name)
+        ImageRenditionService.delete({
+            name: {'webp': os.path.join(directory, f'{name}.webp'), 'jpeg': os.path.join(directory, f'{name}.jpg')}
+            for name, _ in RENDITION_SIZES
+        })
+
+    @staticmethod
+    def delete(renditions):
+        """Xóa các file ảnh thu nhỏ"""
+        for formats in (renditions or {}).values():
+            for fmt in ('webp', 'jpeg'):
+                path = formats.get(fmt)
+                if path:
+                    try:
+                        if default_storage.exists(path):
+                            default_storage.delete(path)
+                    except Exception as e:
+                        logger.warning(f"Failed to delete rendition {path}: {str(e)}")
@@ -0,0 +1,88 @@
+"""
+Media Blob Service
+Đếm tham chiếu cho file ảnh content-addressed (shop/storage.py)
+
+Mỗi ProductVariantImage trỏ vào một blob là một tham chiếu. File (và ảnh thu nhỏ của nó)
+chỉ bị xóa khi tham chiếu cuối cùng mất đi. File cũ (tên uuid, trước khi dùng content-addressed)
+không được đếm và không bị xóa
+"""
+
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from ..models import MediaBlob, ProductVariantImage
+from ..storage import BLOB_PREFIX, is_blob
+from .image_rendition_service import ImageRenditionService
+
+logger = logging.getLogger(__name__)
+
+
+def image_storage():
+    return ProductVariantImage._meta.get_field('image').storage
+
+
+class MediaBlobService:
+    """Service tăng/giảm số tham chiếu và dọn file không còn dùng"""
+
+    @staticmethod
+    def acquire(name):
+        """Thêm một tham chiếu tới blob"""
+        if not is_blob(name):
+            return
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, ref_count=1)
+        except IntegrityError:
+            # Request khác vừa tạo cùng blob
+            MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+    @staticmethod
+    def release(name):
+        """Bỏ một tham chiếu; blob hết tham chiếu thì xóa file sau khi transaction commit"""
+        if not is_blob(name):
+            return
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        if MediaBlob.objects.filter(name=name, ref_count=0).delete()[0]:
+            transaction.on_commit(lambda: MediaBlobService.delete_file(name))
+
+    @staticmethod
+    def delete_file(name):
+        """Xóa file blob và ảnh thu nhỏ của nó (bỏ qua nếu blob vừa được dùng lại)"""
+        if MediaBlob.objects.filter(name=name).exists():
+            return
+        try:
+            image_storage().delete(name)
+        except Exception as e:
+            logger.warning(f"Failed to delete media blob {name}: {str(e)}")
+        ImageRenditionService.delete_for(name)
+
+    @staticmethod
+    def rebuild_counts():
+        """
+        Đếm lại tham chiếu từ ProductVariantImage (sau khi cập nhật hàng loạt bằng update())
+
+        Returns:
+            Số blob đang được dùng
+        """
+        counts = dict(
+            ProductVariantImage.objects.filter(image__startswith=BLOB_PREFIX).order_by()
+            .values('image').annotate(total=Count('pk')).values_list('image', 'total')
+        )
+        with transaction.atomic():
+            existing = {blob.name: blob for blob in MediaBlob.objects.all()}
+            changed = []
+            for name, total in counts.items():
+                blob = existing.pop(name, None)
+                if blob is None:
+                    MediaBlob.objects.create(name=name, ref_count=total)
+                elif blob.ref_count != total:
+                    blob.ref_count = total
+                    changed.append(blob)
+            MediaBlob.objects.bulk_update(changed, ['ref_count'], batch_size=500)
+            # Blob không còn ProductVariantImage nào dùng
+            for name in existing:
+                MediaBlob.objects.filter(name=name).delete()
+                transaction.on_commit(lambda name=name: MediaBlobService.delete_file(name))
+        return len(counts)
@@ -0,0 +1,111 @@
+"""
+Product Summary Service
+Tính và lưu dữ liệu tóm tắt (giá, ảnh, tồn kho, đánh giá) trực tiếp trên Product
+để danh sách sản phẩm không phải query variants/images/skus/reviews cho từng card
+"""
+
+import threading
+from contextlib import contextmanager
+from django.db.models import (
+    OuterRef, Subquery, Exists, Min, Max, Sum, Count, F, Value,
+    IntegerField, DecimalField, CharField,
+)
+from django.db.models.functions import Coalesce, Greatest
+from ..models import Product, ProductVariant, ProductVariantImage, ProductSKU, Review
+
+
+def _product_aggregate(queryset, lookup, expression, output_field, default):
+    """Subquery tính aggregate của các dòng con theo từng product (dùng trong UPDATE)"""
+    subquery = queryset.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup).annotate(
+        value=expression
+    ).values('value')[:1]
+    return Coalesce(Subquery(subquery, output_field=output_field), Value(default), output_field=output_field)
+
+
+_state = threading.local()
+
+
+class ProductSummaryService:
+    """Service duy trì các field tóm tắt của Product (xem Product.SUMMARY_FIELDS)"""
+
+    @staticmethod
+    @contextmanager
+    def suspended():
+        """
+        Bỏ qua refresh theo từng object trong khối (signal update_product_summary) -
+        caller tự gọi refresh()/refresh_product() một lần sau khi ghi xong cả lô
+        """
+        previous = getattr(_state, 'suspended', False)
+        _state.suspended = True
+        try:
+            yield
+        finally:
+            _state.suspended = previous
+
+    @staticmethod
+    def is_suspended():
+        return getattr(_state, 'suspended', False)
+
+    @staticmethod
+    def summary_expressions():
+        """
+        Các biểu thức SQL cho từng field tóm tắt, dùng trực tiếp trong queryset.update()
+
+        Returns:
+            Dict {field_name: expression}
+        """
+        money = DecimalField(max_digits=10, decimal_places=2)
+        final_price = Coalesce('discount_price', 'price', output_field=money)
+
+        # Giá của variant đầu tiên (theo thứ tự mặc định của ProductVariant)
+        first_variant_price = ProductVariant.objects.filter(
+            product=OuterRef('pk')
+        ).order_by('color', 'id').values('price')[:1]
+
+        # Ảnh đầu tiên của variant đầu tiên có ảnh
+        first_image = ProductVariantImage.objects.filter(
+            variant__product=OuterRef('pk')
+        ).exclude(image='').order_by('variant__color', 'variant_id', 'order', 'id').values('image')[:1]
+
+        return {
+            'base_price': Coalesce(Subquery(first_variant_price, output_field=money), Value(0), output_field=money),
+            'min_price': _product_aggregate(ProductVariant.objects.all(), 'product', Min(final_price), money, 0),
+            'max_price': _product_aggregate(ProductVariant.objects.all(), 'product', Max(final_price), money, 0),
+            'is_on_sale': Exists(ProductVariant.objects.filter(product=OuterRef('pk'), discount_price__isnull=False)),
+            'primary_image': Coalesce(Subquery(first_image, output_field=CharField()), Value(''), output_field=CharField()),
+            'available_stock': _product_aggregate(
+                ProductSKU.objects.all(), 'variant__product',
+                Sum(Greatest(F('stock_quantity') - F('reserved_quantity'), Value(0))),
+                IntegerField(), 0
+            ),
+            'review_count': _product_aggregate(Review.objects.all(), 'product', Count('id'), IntegerField(), 0),
+        }
+
+    @staticmethod
+    def refresh(product_ids=None):
+        """
+        Tính lại dữ liệu tóm tắt bằng một câu UPDATE duy nhất
+
+        Args:
+            product_ids: Danh sách ID sản phẩm (None = tất cả)
+
+        Returns:
+            Số sản phẩm được cập nhật
+        """
+        queryset = Product.objects.all()
+        if product_ids is not None:
+            queryset = queryset.filter(pk__in=list(product_ids))
+        return queryset.update(**ProductSummaryService.summary_expressions())
+
+    @staticmethod
+    def refresh_product(product):
+        """
+        Tính lại dữ liệu tóm tắt cho một sản phẩm và cập nhật luôn object trong bộ nhớ
+
+        Args:
+            product: Product object
+        """
+        if product is None or product.pk is None:
+            return
+        if ProductSummaryService.refresh([product.pk]):
+            product.refresh_from_db(fields=Product.SUMMARY_FIELDS)
@@ -0,0 +1,298 @@
+"""
+Product Write Service
+Cập nhật cây variant -> ảnh / SKU và voucher của một sản phẩm (admin sửa sản phẩm) theo diff
+
+- Cây hiện có được nạp một lần (tree_queryset: sản phẩm + 4 query prefetch)
+- So sánh với dữ liệu gửi lên trong bộ nhớ, chỉ ghi những dòng thay đổi:
+  một delete mỗi bảng, bulk_update, bulk_create - trong một transaction
+- Cache prefetch của sản phẩm được thay bằng cây sau khi ghi để trả response không cần query lại
+- Tồn kho của SKU đã có không ghi đè bằng bulk_update: phần admin sửa (mới - cũ) được cộng bằng F() qua
+  StockService.adjust_stock_many để không mất số bán đồng thời; lịch sử lấy trước/sau từ DB
+- Tồn đầu của SKU mới được ghi vào StockHistory (import) như nhập catalog
+"""
+
+import json
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from ..models import Product, ProductSKU, ProductVariant, ProductVariantImage, ProductVoucher, StockHistory
+from .catalog_cache_service import CatalogCacheService
+from .code_allocator_service import CodeAllocatorService
+from .product_summary_service import ProductSummaryService
+from .stock_alert_service import StockAlertService
+from .stock_availability_service import StockAvailabilityService
+from .stock_service import StockService
+
+VARIANT_FIELDS = ('color', 'price', 'discount_price', 'is_active')
+SKU_FIELDS = ('size', 'stock_quantity', 'minimum_stock', 'reorder_point', 'cost_price')
+# stock_quantity đi qua StockService (delta), không nằm trong bulk_update
+SKU_WRITE_FIELDS = tuple(name for name in SKU_FIELDS if name != 'stock_quantity')
+VOUCHER_FIELDS = (
+    'code', 'name', 'description', 'discount_type', 'discount_value',
+    'max_discount_amount', 'max_uses', 'valid_from', 'valid_to', 'is_active',
+)
+
+
+def tree_queryset():
+    """Sản phẩm kèm toàn bộ variant (ảnh, SKU) và voucher"""
+    return Product.objects.select_related('category', 'brand').prefetch_related(
+        'variants__images', 'variants__skus', 'vouchers'
+    )
+
+
+def _clean(model, values):
+    """Chuyển giá trị JSON sang kiểu của field (Decimal, datetime...) để so sánh với giá trị đang có"""
+    cleaned = {}
+    for name, value in values.items():
+        field = model._meta.get_field(name)
+        value = field.to_python(value) if value is not None else None
+        if value is None and not field.null:
+            raise ValidationError({name: 'Không được để trống'})
+        if hasattr(value, 'tzinfo') and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        cleaned[name] = value
+    return cleaned
+
+
+def _assign(obj, values):
+    """Gán giá trị, trả về True nếu có field thay đổi"""
+    changed = False
+    for name, value in values.items():
+        if getattr(obj, name) != value:
+            setattr(obj, name, value)
+            changed = True
+    return changed
+
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _uploads(files, color):
+    """Ảnh upload cho một màu: variant_image_<màu>, variant_image_<màu>_1, ..."""
+    uploads = []
+    while True:
+        key = f'variant_image_{color}_{len(uploads)}' if uploads else f'variant_image_{color}'
+        upload = files.get(key)
+        if not upload:
+            return uploads
+        uploads.append(upload)
+
+
+class ProductWriteService:
+    """Service ghi cây variant / SKU / voucher của sản phẩm theo lô"""
+
+    @staticmethod
+    def parse_json(raw):
+        """
+        Dữ liệu lồng nhau gửi lên dạng chuỗi JSON (FormData) hoặc list (JSON body)
+
+        Returns:
+            List hoặc None nếu không gửi
+
+        Raises:
+            ValueError: JSON không hợp lệ
+        """
+        if raw in (None, ''):
+            return None
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"JSON không hợp lệ: {str(e)}")
+        if not isinstance(raw, list) or not all(isinstance(item, dict) for item in raw):
+            raise ValueError("Dữ liệu phải là danh sách object")
+        return raw
+
+    @staticmethod
+    def apply(product, variants_data=None, vouchers_data=None, files=None, user=None):
+        """
+        Đồng bộ variant (kèm ảnh, SKU) và voucher của sản phẩm với dữ liệu gửi lên
+
+        - Variant / SKU / voucher không có trong dữ liệu (theo id) bị xóa, có id thì cập nhật, không id thì tạo mới
+        - Màu có ảnh upload (variant_image_<màu>...) thì thay toàn bộ ảnh cũ
+        - product cần được nạp bằng tree_queryset(); cache prefetch được cập nhật theo kết quả
+        - Tồn kho của SKU đã có: cộng phần chênh (mới - giá trị đã nạp) vào giá trị hiện tại trong DB
+        - user: User thực hiện (ghi vào StockHistory)
+
+        Raises:
+            ValidationError: Giá trị không hợp lệ
+        """
+        files = files or {}
+        variants = list(product.variants.all())
+        vouchers = list(product.vouchers.all())
+
+        deleted = {'variants': [], 'skus': [], 'images': [], 'vouchers': []}
+        changed = {'variants': [], 'skus': [], 'vouchers': []}
+        created = {'variants': [], 'skus': [], 'vouchers': []}
+        uploads = []
+        stock_changes = []
+
+        if variants_data is not None:
+            by_id = {variant.pk: variant for variant in variants}
+            incoming = {_int(data.get('id')) for data in variants_data} - {None}
+            deleted['variants'] = [variant for variant in variants if variant.pk not in incoming]
+            kept = []
+
+            for data in variants_data:
+                values = _clean(ProductVariant, {
+                    'color': data.get('color', ''),
+                    'price': data.get('price', 0),
+                    'discount_price': data.get('discount_price'),
+                    'is_active': data.get('is_active', True),
+                })
+                variant = by_id.get(_int(data.get('id')))
+                images = _uploads(files, values['color'])
+                if variant is None:
+                    variant = ProductVariant(product=product, **values)
+                    variant._prefetched_objects_cache = {'images': [], 'skus': []}
+                    created['variants'].append(variant)
+                else:
+                    if _assign(variant, values):
+                        changed['variants'].append(variant)
+                    current_images = list(variant.images.all())
+                    if images:
+                        # Có ảnh mới: thay toàn bộ ảnh cũ
+                        deleted['images'].extend(current_images)
+                        current_images = []
+                    variant._prefetched_objects_cache['images'] = current_images
+                kept.append(variant)
+                uploads.extend((variant, index, image) for index, image in enumerate(images))
+
+                skus = list(variant.skus.all()) if variant.pk else []
+                skus_by_id = {sku.pk: sku for sku in skus}
+                sizes_data = data.get('sizes') or []
+                incoming_skus = {_int(size.get('id')) for size in sizes_data} - {None}
+                deleted['skus'].extend(sku for sku in skus if sku.pk not in incoming_skus)
+                kept_skus = []
+                for size in sizes_data:
+                    sku = skus_by_id.get(_int(size.get('id')))
+                    if sku is None:
+                        sku = ProductSKU(variant=variant, **_clean(ProductSKU, {
+                            'size': size.get('name', ''),
+                            'stock_quantity': size.get('stock_quantity', 0),
+                            'minimum_stock': size.get('minimum_stock', 5),
+                            'reorder_point': size.get('reorder_point', 10),
+                            'cost_price': size.get('cost_price', 0),
+                        }))
+                        created['skus'].append(sku)
+                    else:
+                        values = _clean(ProductSKU, {
+                            'size': size.get('name', sku.size),
+                            **{name: size.get(name, getattr(sku, name)) for name in SKU_FIELDS[1:]},
+                        })
+                        # Tồn kho: phần admin sửa so với giá trị đã nạp, cộng vào DB bằng delta
+                        stock_quantity = values.pop('stock_quantity')
+                        if stock_quantity != sku.stock_quantity:
+                            stock_changes.append((sku, stock_quantity - sku.stock_quantity))
+                        if _assign(sku, values):
+                            changed['skus'].append(sku)
+                    kept_skus.append(sku)
+                variant._prefetched_objects_cache['skus'] = kept_skus
+            variants = kept
+
+        if vouchers_data is not None:
+            by_id = {voucher.pk: voucher for voucher in vouchers}
+            incoming = {_int(data.get('id')) for data in vouchers_data} - {None}
+            deleted['vouchers'] = [voucher for voucher in vouchers if voucher.pk not in incoming]
+            kept = []
+            for data in vouchers_data:
+                voucher_id = _int(data.get('id'))
+                if voucher_id:
+                    voucher = by_id.get(voucher_id)
+                    if voucher is None:
+                        continue
+                    values = _clean(ProductVoucher, {
+                        **{name: data.get(name, getattr(voucher, name)) for name in VOUCHER_FIELDS},
+                        'description': data.get('description', ''),
+                        'max_discount_amount': data.get('max_discount_amount'),
+                        'max_uses': data.get('max_uses'),
+                    })
+                    if _assign(voucher, values):
+                        changed['vouchers'].append(voucher)
+                else:
+                    voucher = ProductVoucher(product=product, current_uses=data.get('current_uses', 0), **_clean(
+                        ProductVoucher, {
+                            'code': data.get('code', ''), 'name': data.get('name', ''),
+                            'description': data.get('description', ''),
+                            'discount_type': data.get('discount_type', 'percentage'),
+                            'discount_value': data.get('discount_value', 0),
+                            'max_discount_amount': data.get('max_discount_amount'),
+                            'max_uses': data.get('max_uses'),
+                            'valid_from': data.get('valid_from'), 'valid_to': data.get('valid_to'),
+                            'is_active': data.get('is_active', True),
+                        }
+                    ))
+                    created['vouchers'].append(voucher)
+                kept.append(voucher)
+            vouchers = kept
+
+        adjusted = {sku.pk for sku, _ in stock_changes}
+
+        with transaction.atomic(), ProductSummaryService.suspended():
+            ProductWriteService._write(deleted, changed, created, uploads)
+            StockService.adjust_stock_many(stock_changes, notes='Admin sửa tồn kho', user=user)
+            # SKU không đổi tồn kho (đổi ngưỡng) và SKU mới: đồng bộ cảnh báo (SKU đã điều chỉnh được đồng bộ ở trên)
+            StockAlertService.reconcile([
+                sku.pk for sku in changed['skus'] + created['skus'] if sku.pk not in adjusted
+            ])
+            ProductWriteService._record_initial_stock(created['skus'], user)
+            ProductSummaryService.refresh_product(product)
+
+        sku_ids = [sku.pk for sku in changed['skus']] + list(adjusted)
+        transaction.on_commit(lambda: StockAvailabilityService.invalidate(sku_ids))
+        # bulk_create/bulk_update không gửi signal - tăng catalog version một lần cho cả lô
+        CatalogCacheService.bump_version()
+        transaction.on_commit(CatalogCacheService.bump_version)
+
+        # Response đọc từ cây trong bộ nhớ
+        if variants_data is not None:
+            for variant in variants:
+                variant._prefetched_objects_cache['images'].sort(key=lambda image: (image.order, image.pk))
+                variant._prefetched_objects_cache['skus'].sort(key=lambda sku: (sku.size, sku.pk))
+            product._prefetched_objects_cache['variants'] = sorted(variants, key=lambda variant: (variant.color, variant.pk))
+        product._prefetched_objects_cache['vouchers'] = vouchers
+        return product
+
+    @staticmethod
+    def _record_initial_stock(created_skus, user):
+        """Lịch sử kho cho tồn đầu của SKU admin thêm mới (một bulk_create)"""
+        StockHistory.objects.bulk_create([
+            StockHistory(
+                product_sku=sku, transaction_type='import', quantity=sku.stock_quantity,
+                quantity_before=0, quantity_after=sku.stock_quantity, cost_per_item=sku.cost_price,
+                notes='Tồn đầu khi admin thêm size', created_by=user,
+            )
+            for sku in created_skus if sku.stock_quantity
+        ])
+
+    @staticmethod
+    def _write(deleted, changed, created, uploads):
+        """Một delete mỗi bảng, rồi bulk_update, bulk_create và lưu ảnh upload"""
+        now = timezone.now()
+        for model, key in (
+            (ProductVariantImage, 'images'), (ProductSKU, 'skus'),
+            (ProductVariant, 'variants'), (ProductVoucher, 'vouchers'),
+        ):
+            if deleted[key]:
+                model.objects.filter(pk__in=[obj.pk for obj in deleted[key]]).delete()
+
+        for model, key, fields in (
+            (ProductVariant, 'variants', VARIANT_FIELDS), (ProductSKU, 'skus', SKU_WRITE_FIELDS),
+            (ProductVoucher, 'vouchers', VOUCHER_FIELDS),
+        ):
+            for obj in changed[key]:
+                obj.updated_at = now
+            model.objects.bulk_update(changed[key], list(fields) + ['updated_at'])
+
+        ProductVariant.objects.bulk_create(created['variants'])
+        CodeAllocatorService.bulk_create(ProductSKU, created['skus'])
+        ProductVoucher.objects.bulk_create(created['vouchers'])
+
+        # Ảnh: lưu file từng ảnh (signal đếm tham chiếu blob và tạo ảnh thu nhỏ)
+        for variant, index, upload in uploads:
+            image = ProductVariantImage.objects.create(variant=variant, image=upload, is_primary=index == 0, order=index)
+            variant._prefetched_objects_cache['images'].append(image)
@@ -0,0 +1,179 @@
+"""
+Recommendation Service
+Gợi ý "dành cho bạn" theo item-item collaborative filtering
+
+- Tín hiệu user x sản phẩm: wishlist, sản phẩm đã đặt (đơn chưa hủy), review (theo số sao)
+- Độ tương đồng cosine giữa các sản phẩm trên ma trận tương tác thưa, giữ MAX_NEIGHBOURS láng giềng
+- Điểm gợi ý của user = tổng trọng số tương tác x độ tương đồng, tính theo lô user và lưu top-N
+  vào UserRecommendation
+- User chưa có gợi ý (cold start): sản phẩm bán chạy theo display_group
+"""
+
+import logging
+import math
+from collections import defaultdict
+from functools import reduce
+from heapq import nlargest
+from itertools import combinations
+from operator import or_
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import Category, OrderItem, Product, Review, UserRecommendation, Wishlist
+from .catalog_cache_service import CatalogCacheService
+
+logger = logging.getLogger(__name__)
+
+# Trọng số tín hiệu
+WISHLIST_WEIGHT = 1.0
+ORDER_WEIGHT = 2.0
+REVIEW_WEIGHTS = {5: 1.5, 4: 1.0, 3: 0.3}  # 1-2 sao: không dùng làm tín hiệu tích cực
+
+# Số sản phẩm gợi ý lưu cho mỗi user
+TOP_N = 20
+# Số láng giềng giữ lại cho mỗi sản phẩm
+MAX_NEIGHBOURS = 50
+# Chỉ dùng các tương tác mạnh nhất của mỗi user khi tính độ tương đồng (giới hạn số cặp)
+MAX_PROFILE = 50
+# Số user mỗi lô khi tính điểm và ghi kết quả
+USER_CHUNK = 500
+
+
+class RecommendationService:
+    """Service dựng và tra cứu gợi ý cá nhân hóa"""
+
+    @staticmethod
+    def interactions():
+        """
+        Ma trận tương tác thưa {user_id: {product_id: trọng số}} (3 query)
+        """
+        matrix = defaultdict(lambda: defaultdict(float))
+        for user_id, product_id in Wishlist.objects.values_list('user_id', 'product_id'):
+            matrix[user_id][product_id] += WISHLIST_WEIGHT
+
+        ordered = OrderItem.objects.filter(product_sku__isnull=False).exclude(
+            order__status='cancelled'
+        ).values_list('order__user_id', 'product_sku__variant__product_id').distinct()
+        for user_id, product_id in ordered:
+            matrix[user_id][product_id] += ORDER_WEIGHT
+
+        for user_id, product_id, rating in Review.objects.values_list('user_id', 'product_id', 'rating'):
+            weight = REVIEW_WEIGHTS.get(rating)
+            if weight:
+                matrix[user_id][product_id] += weight
+        return matrix
+
+    @staticmethod
+    def item_neighbours(matrix, max_neighbours=MAX_NEIGHBOURS):
+        """
+        Độ tương đồng cosine giữa các sản phẩm được tương tác bởi cùng user
+
+        Returns:
+            {product_id: [(product_id láng giềng, độ tương đồng)...]}
+        """
+        dots = defaultdict(float)
+        norms = defaultdict(float)
+        for profile in matrix.values():
+            items = sorted(nlargest(MAX_PROFILE, profile.items(), key=lambda item: (item[1], -item[0])))
+            for product_id, weight in items:
+                norms[product_id] += weight * weight
+            for (a, weight_a), (b, weight_b) in combinations(items, 2):
+                dots[(a, b)] += weight_a * weight_b
+
+        candidates = defaultdict(list)
+        for (a, b), dot in dots.items():
+            similarity = dot / math.sqrt(norms[a] * norms[b])
+            candidates[a].append((b, similarity))
+            candidates[b].append((a, similarity))
+        return {
+            product_id: nlargest(max_neighbours, neighbours, key=lambda item: (item[1], -item[0]))
+            for product_id, neighbours in candidates.items()
+        }
+
+    @staticmethod
+    def score_user(profile, neighbours, active_ids, top_n=TOP_N):
+        """Top-N (product_id, điểm) cho một user, bỏ sản phẩm đã tương tác và sản phẩm ngừng bán"""
+        scores = defaultdict(float)
+        for product_id, weight in profile.items():
+            for neighbour_id, similarity in neighbours.get(product_id, ()):
+                if neighbour_id not in profile and neighbour_id in active_ids:
+                    scores[neighbour_id] += weight * similarity
+        return nlargest(top_n, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    @staticmethod
+    def rebuild(top_n=TOP_N, chunk_size=USER_CHUNK):
+        """
+        Tính lại gợi ý cho mọi user có tương tác (mỗi lô user một transaction),
+        xóa gợi ý cũ của user không còn tương tác
+
+        Returns:
+            (số user có gợi ý, số dòng UserRecommendation được ghi)
+        """
+        started_at = timezone.now()
+        matrix = RecommendationService.interactions()
+        neighbours = RecommendationService.item_neighbours(matrix)
+        active_ids = set(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+
+        user_ids = sorted(matrix)
+        users = written = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            rows = []
+            for user_id in chunk:
+                ranked = RecommendationService.score_user(matrix[user_id], neighbours, active_ids, top_n)
+                users += bool(ranked)
+                rows.extend(
+                    UserRecommendation(
+                        user_id=user_id, product_id=product_id, rank=rank,
+                        score=round(score, 4), computed_at=started_at,
+                    )
+                    for rank, (product_id, score) in enumerate(ranked, start=1)
+                )
+            with transaction.atomic():
+                UserRecommendation.objects.filter(user_id__in=chunk).delete()
+                UserRecommendation.objects.bulk_create(rows, batch_size=1000)
+            written += len(rows)
+
+        UserRecommendation.objects.filter(computed_at__lt=started_at).delete()
+        logger.info(f"Recommendations rebuilt: {users} users, {written} rows")
+        return users, written
+
+    @staticmethod
+    def best_sellers(limit=TOP_N):
+        """
+        Sản phẩm bán chạy theo display_group của danh mục gốc (cache theo catalog version)
+
+        Returns:
+            {display_group: [product_id...]}
+        """
+        cache = CatalogCacheService.cache()
+        key = f"best-sellers:{CatalogCacheService.get_version()}:{limit}"
+        groups = cache.get(key)
+        if groups is not None:
+            return groups
+
+        # Path của danh mục gốc theo nhóm - sản phẩm thuộc nhóm nếu category__path bắt đầu bằng một trong số đó
+        roots = defaultdict(list)
+        for display_group, path in Category.objects.filter(parent__isnull=True).values_list('display_group', 'path'):
+            if path:
+                roots[display_group].append(Q(category__path__startswith=path))
+        groups = {}
+        for display_group, conditions in roots.items():
+            groups[display_group] = list(
+                Product.objects.filter(reduce(or_, conditions), is_active=True)
+                .order_by('-sold_count', '-id').values_list('pk', flat=True)[:limit]
+            )
+        cache.set(key, groups)
+        return groups
+
+    @staticmethod
+    def cold_start(display_group=None, limit=TOP_N):
+        """Danh sách ID cho user chưa có gợi ý: bán chạy của một nhóm, hoặc xen kẽ các nhóm"""
+        groups = RecommendationService.best_sellers(limit)
+        if display_group:
+            return groups.get(display_group, [])[:limit]
+        ordered = [groups[value] for value, _ in Category.DISPLAY_GROUP_CHOICES if groups.get(value)]
+        product_ids = []
+        for position in range(limit):
+            product_ids.extend(ids[position] for ids in ordered if position < len(ids))
+        return product_ids[:limit]
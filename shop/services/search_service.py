@@ -0,0 +1,143 @@
+"""
+Product Search Service
+Full-text index cho sản phẩm dùng SQLite FTS5 (xếp hạng theo BM25)
+"""
+
+import re
+from django.db import connection
+from ..models import Product, Brand, Category
+
+
+FTS_TABLE = 'shop_product_fts'
+
+# Trọng số BM25 theo thứ tự cột: name, short_description, tags, brand, category
+FTS_RANK = 'bm25(10.0, 2.0, 4.0, 5.0, 3.0)'
+
+# Số ID tối đa trong một câu lệnh (giới hạn biến của SQLite)
+BATCH_SIZE = 500
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, short_description, tags, brand, category, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+
+def _select_documents_sql(where):
+    """Câu SELECT tạo document FTS từ Product + Brand + Category (tags JSON được tách bằng json_each)"""
+    return (
+        f"SELECT p.id, p.name, p.short_description, "
+        f"COALESCE((SELECT group_concat(j.value, ' ') FROM json_each(p.tags) j), ''), "
+        f"COALESCE(b.name, ''), COALESCE(c.name, '') "
+        f"FROM {Product._meta.db_table} p "
+        f"LEFT JOIN {Brand._meta.db_table} b ON b.id = p.brand_id "
+        f"LEFT JOIN {Category._meta.db_table} c ON c.id = p.category_id "
+        f"WHERE p.is_active AND {where}"
+    )
+
+
+class ProductSearchService:
+    """Service quản lý và truy vấn full-text index của sản phẩm"""
+
+    MAX_RESULTS = 1000
+
+    @staticmethod
+    def is_available():
+        """FTS5 chỉ có trên SQLite - các backend khác dùng search icontains"""
+        return connection.vendor == 'sqlite'
+
+    @staticmethod
+    def build_match_query(text):
+        """
+        Chuyển chuỗi người dùng nhập thành biểu thức MATCH của FTS5
+
+        Mỗi từ được đặt trong dấu nháy kép (tránh cú pháp FTS), từ cuối cùng
+        match theo prefix để hỗ trợ gõ tới đâu tìm tới đó
+
+        Returns:
+            Chuỗi MATCH hoặc None nếu không có từ nào
+        """
+        tokens = re.findall(r'\w+', text or '')
+        if not tokens:
+            return None
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    @staticmethod
+    def search(text, limit=None):
+        """
+        Tìm sản phẩm theo full-text index
+
+        Args:
+            text: Chuỗi tìm kiếm
+            limit: Số kết quả tối đa (mặc định MAX_RESULTS)
+
+        Returns:
+            List ID sản phẩm đã xếp hạng theo BM25 (tốt nhất trước)
+        """
+        match = ProductSearchService.build_match_query(text)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [match, limit or ProductSearchService.MAX_RESULTS]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def index_products(product_ids):
+        """
+        Cập nhật index cho các sản phẩm (sản phẩm inactive hoặc đã xóa sẽ bị gỡ khỏi index)
+
+        Args:
+            product_ids: Danh sách ID sản phẩm
+        """
+        product_ids = [int(pk) for pk in product_ids]
+        if not product_ids or not ProductSearchService.is_available():
+            return
+        with connection.cursor() as cursor:
+            for start in range(0, len(product_ids), BATCH_SIZE):
+                batch = product_ids[start:start + BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, name, short_description, tags, brand, category) "
+                    + _select_documents_sql(f"p.id IN ({placeholders})"),
+                    batch
+                )
+
+    @staticmethod
+    def remove_products(product_ids):
+        """Gỡ sản phẩm khỏi index"""
+        product_ids = [int(pk) for pk in product_ids]
+        if not product_ids or not ProductSearchService.is_available():
+            return
+        with connection.cursor() as cursor:
+            for start in range(0, len(product_ids), BATCH_SIZE):
+                batch = product_ids[start:start + BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+    @staticmethod
+    def rebuild():
+        """
+        Xây lại toàn bộ index bằng một câu INSERT ... SELECT
+
+        Returns:
+            Số document trong index
+        """
+        if not ProductSearchService.is_available():
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_FTS_SQL)
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, short_description, tags, brand, category) "
+                + _select_documents_sql('1')
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', %s)", [FTS_RANK])
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+            return cursor.fetchone()[0]
@@ -0,0 +1,145 @@
+"""
+Stock Alert Service
+Đồng bộ cảnh báo tồn kho (StockAlert) với tồn kho hiện tại theo lô SKU hoặc toàn bộ
+
+- available = stock_quantity - reserved_quantity (không âm), so với minimum_stock / reorder_point
+- Cảnh báo đang mở bị resolve khi điều kiện của nó không còn đúng:
+  out_of_stock khi available > 0, low_stock khi available > minimum_stock, reorder_needed khi available > reorder_point
+- SKU cần cảnh báo mà chưa có: tạo loại nặng nhất (hết hàng > tồn kho thấp > cần đặt hàng)
+- Mỗi bước là một câu SQL trên cả lô (UPDATE có subquery, INSERT ... SELECT), không query theo từng SKU
+"""
+
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from ..models import ProductSKU, StockAlert
+
+# Số SKU mỗi lần lọc theo ID
+ID_CHUNK = 1000
+
+# Cột StockAlert -> annotation tương ứng trong câu SELECT tạo cảnh báo
+INSERT_COLUMNS = {
+    'product_sku': 'alert_sku',
+    'alert_type': 'alert_kind',
+    'current_quantity': 'alert_quantity',
+    'threshold': 'alert_threshold',
+    'is_resolved': 'alert_resolved',
+    'created_at': 'alert_created_at',
+}
+
+
+def _available(prefix=''):
+    """Biểu thức tồn kho khả dụng (prefix 'product_sku__' khi query từ StockAlert)"""
+    return Greatest(
+        F(f'{prefix}stock_quantity') - F(f'{prefix}reserved_quantity'), Value(0), output_field=IntegerField()
+    )
+
+
+def _threshold(prefix=''):
+    """Ngưỡng theo loại cảnh báo (dùng trên StockAlert)"""
+    return Case(
+        When(alert_type='low_stock', then=F(f'{prefix}minimum_stock')),
+        When(alert_type='reorder_needed', then=F(f'{prefix}reorder_point')),
+        default=Value(0), output_field=IntegerField()
+    )
+
+
+def _sku_value(expression):
+    """Giá trị của SKU tương ứng trong UPDATE StockAlert (UPDATE không JOIN được bảng khác)"""
+    return Subquery(
+        ProductSKU.objects.filter(pk=OuterRef('product_sku_id')).values(value=expression)[:1],
+        output_field=IntegerField()
+    )
+
+
+def _cleared():
+    """Điều kiện cảnh báo đang mở không còn đúng (query từ StockAlert)"""
+    available = _available('product_sku__')
+    return (
+        Q(alert_type='out_of_stock', product_sku__stock_quantity__gt=F('product_sku__reserved_quantity'))
+        | (Q(alert_type='low_stock') & Q(product_sku__minimum_stock__lt=available))
+        | (Q(alert_type='reorder_needed') & Q(product_sku__reorder_point__lt=available))
+    )
+
+
+class StockAlertService:
+    """Service tính và đồng bộ cảnh báo tồn kho theo tập hợp"""
+
+    @staticmethod
+    def reconcile(sku_ids=None, user=None, resolve=True):
+        """
+        Đồng bộ cảnh báo của các SKU với tồn kho hiện tại
+
+        Args:
+            sku_ids: Danh sách ID SKU (None = tất cả)
+            user: User ghi vào resolved_by
+            resolve: False = chỉ tạo cảnh báo còn thiếu (tồn kho vừa giảm, không có gì để resolve)
+
+        Returns:
+            Dict {'created', 'resolved', 'updated'}
+        """
+        counts = {'created': 0, 'resolved': 0, 'updated': 0}
+        if sku_ids is None:
+            StockAlertService._reconcile(ProductSKU.objects.all(), None, user, resolve, counts)
+            return counts
+        sku_ids = list(dict.fromkeys(sku_ids))
+        for start in range(0, len(sku_ids), ID_CHUNK):
+            chunk = sku_ids[start:start + ID_CHUNK]
+            StockAlertService._reconcile(ProductSKU.objects.filter(pk__in=chunk), chunk, user, resolve, counts)
+        return counts
+
+    @staticmethod
+    @transaction.atomic(savepoint=False)
+    def _reconcile(skus, sku_ids, user, resolve, counts):
+        alerts = StockAlert.objects.filter(is_resolved=False)
+        if sku_ids is not None:
+            alerts = alerts.filter(product_sku_id__in=sku_ids)
+
+        if resolve:
+            counts['resolved'] += alerts.filter(_cleared()).update(
+                is_resolved=True, resolved_at=timezone.now(), resolved_by=user,
+                current_quantity=_sku_value(_available())
+            )
+            # Cảnh báo còn mở: cập nhật số lượng / ngưỡng hiện tại
+            counts['updated'] += alerts.exclude(
+                current_quantity=_available('product_sku__'), threshold=_threshold('product_sku__')
+            ).update(
+                current_quantity=_sku_value(_available()),
+                threshold=Case(
+                    When(alert_type='low_stock', then=_sku_value(F('minimum_stock'))),
+                    When(alert_type='reorder_needed', then=_sku_value(F('reorder_point'))),
+                    default=Value(0), output_field=IntegerField()
+                )
+            )
+
+        # SKU cần cảnh báo (loại nặng nhất) mà chưa có cảnh báo mở cùng loại:
+        # INSERT ... SELECT trên DB, không tạo object Python cho từng dòng
+        available = _available()
+        missing = skus.annotate(
+            alert_sku=F('pk'),
+            alert_kind=Case(
+                When(stock_quantity__lte=F('reserved_quantity'), then=Value('out_of_stock')),
+                When(minimum_stock__gte=available, then=Value('low_stock')),
+                When(reorder_point__gte=available, then=Value('reorder_needed')),
+                default=Value(''),
+            ),
+            alert_quantity=available,
+            alert_threshold=Case(
+                When(stock_quantity__lte=F('reserved_quantity'), then=Value(0)),
+                When(minimum_stock__gte=available, then=F('minimum_stock')),
+                default=F('reorder_point'), output_field=IntegerField()
+            ),
+            alert_resolved=Value(False),
+            alert_created_at=Value(timezone.now(), output_field=DateTimeField()),
+        ).exclude(alert_kind='').exclude(Exists(
+            StockAlert.objects.filter(product_sku=OuterRef('pk'), alert_type=OuterRef('alert_kind'), is_resolved=False)
+        )).order_by().values_list(*INSERT_COLUMNS.values())
+
+        sql, params = missing.query.sql_with_params()
+        columns = ', '.join(
+            connection.ops.quote_name(StockAlert._meta.get_field(name).column) for name in INSERT_COLUMNS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {connection.ops.quote_name(StockAlert._meta.db_table)} ({columns}) {sql}', params)
+            counts['created'] += cursor.rowcount
@@ -0,0 +1,79 @@
+"""
+Stock Availability Service
+Tra cứu tồn kho hàng loạt cho giỏ hàng / checkout / trang chi tiết (badge còn hàng)
+
+- Một query theo khóa chính cho các SKU chưa có trong cache
+- Cache từng SKU với TTL ngắn (settings.STOCK_AVAILABILITY_TTL), xóa ngay khi ProductSKU được lưu
+"""
+
+from django.conf import settings
+from ..models import ProductSKU
+from .catalog_cache_service import CatalogCacheService
+
+# Số SKU tối đa mỗi lần tra cứu
+MAX_SKUS = 5000
+
+
+def _key(sku_id):
+    return f"stock:{sku_id}"
+
+
+class StockAvailabilityService:
+    """Service tra cứu tồn kho khả dụng theo lô"""
+
+    @staticmethod
+    def parse_ids(raw):
+        """
+        Chuẩn hóa danh sách ID (chuỗi "1,2,3" hoặc list), bỏ trùng và giữ thứ tự
+
+        Raises:
+            ValueError: ID không hợp lệ hoặc quá MAX_SKUS
+        """
+        if isinstance(raw, str):
+            raw = [part for part in raw.split(',') if part.strip()]
+        if not isinstance(raw, (list, tuple)):
+            raise ValueError("sku_ids phải là danh sách ID")
+        try:
+            ids = list(dict.fromkeys(int(value) for value in raw))
+        except (TypeError, ValueError):
+            raise ValueError("sku_ids chỉ được chứa số nguyên")
+        if len(ids) > MAX_SKUS:
+            raise ValueError(f"Tối đa {MAX_SKUS} SKU mỗi lần tra cứu")
+        return ids
+
+    @staticmethod
+    def availability(sku_ids):
+        """
+        Tồn kho của các SKU (SKU không tồn tại bị bỏ qua)
+
+        Returns:
+            {sku_id: {'available_quantity', 'stock_quantity', 'reserved_quantity', 'is_low_stock', 'is_active'}}
+        """
+        cache = CatalogCacheService.cache()
+        cached = cache.get_many([_key(sku_id) for sku_id in sku_ids])
+        results = {sku_id: cached[_key(sku_id)] for sku_id in sku_ids if _key(sku_id) in cached}
+
+        missing = [sku_id for sku_id in sku_ids if sku_id not in results]
+        if missing:
+            rows = ProductSKU.objects.filter(pk__in=missing).values_list(
+                'pk', 'stock_quantity', 'reserved_quantity', 'minimum_stock', 'is_active',
+                'variant__is_active', 'variant__product__is_active'
+            )
+            fresh = {}
+            for sku_id, stock, reserved, minimum, active, variant_active, product_active in rows:
+                available = max(0, stock - reserved)
+                fresh[sku_id] = {
+                    'available_quantity': available,
+                    'stock_quantity': stock,
+                    'reserved_quantity': reserved,
+                    'is_low_stock': available <= minimum,
+                    'is_active': active and variant_active and product_active,
+                }
+            cache.set_many({_key(sku_id): data for sku_id, data in fresh.items()}, settings.STOCK_AVAILABILITY_TTL)
+            results.update(fresh)
+        return {sku_id: results[sku_id] for sku_id in sku_ids if sku_id in results}
+
+    @staticmethod
+    def invalidate(sku_ids):
+        """Xóa cache tồn kho của các SKU (sau khi số lượng thay đổi)"""
+        CatalogCacheService.cache().delete_many([_key(sku_id) for sku_id in sku_ids])
@@ -1,12 +1,72 @@
 """
 Stock Management Service
 Xử lý các tác vụ liên quan đến kho hàng - ProductSKU based
+
+- Nhập / xuất / hoàn trả / hàng hỏng / giữ hàng là một câu UPDATE có điều kiện trên DB
+  (stock_quantity = stock_quantity - n WHERE stock_quantity - reserved_quantity >= n),
+  không đọc-sửa-save() trong Python: nhiều worker đồng thời không bán vượt tồn kho, không mất lượt ghi
+- Số lượng trước/sau trong StockHistory lấy từ giá trị DB ngay sau câu UPDATE
+- Xuất kho cả đơn hàng (export_stock_many): một UPDATE cho mọi SKU, một bulk_create lịch sử,
+  cảnh báo của các SKU được tính trên một lần đọc
+- Cảnh báo tồn kho được đồng bộ theo tập hợp bởi StockAlertService
 """
 
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Count, F, Q
+from django.db.models import Sum, Count, F, Q, Value, Case, When, IntegerField
+from django.db.models.functions import Greatest
 from ..models import ProductSKU, StockHistory, StockAlert
+from .catalog_cache_service import CatalogCacheService
+from .product_summary_service import ProductSummaryService
+from .stock_alert_service import StockAlertService
+from .stock_availability_service import StockAvailabilityService
+
+
+def _apply_delta(product_sku, stock=0, reserved=0, condition=None, **fields):
+    """
+    Cộng thay đổi vào tồn kho của SKU bằng một câu UPDATE có điều kiện rồi đọc lại giá trị mới
+
+    - Điều kiện (vd. còn đủ hàng) được DB kiểm tra cùng lúc với lệnh ghi
+    - UPDATE khóa dòng SKU đến hết transaction nên giá trị đọc lại là kết quả của chính lệnh này
+    - product_sku trong bộ nhớ được cập nhật theo DB
+
+    Returns:
+        stock_quantity trước khi ghi, hoặc None nếu điều kiện không thỏa
+    """
+    queryset = ProductSKU.objects.filter(pk=product_sku.pk)
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    values = {'updated_at': timezone.now(), **fields}
+    if stock:
+        values['stock_quantity'] = F('stock_quantity') + stock
+    if reserved:
+        values['reserved_quantity'] = Greatest(F('reserved_quantity') + reserved, Value(0))
+    if not queryset.update(**values):
+        return None
+
+    product_sku.stock_quantity, product_sku.reserved_quantity, product_sku.updated_at = (
+        ProductSKU.objects.filter(pk=product_sku.pk)
+        .values_list('stock_quantity', 'reserved_quantity', 'updated_at').get()
+    )
+    for name, value in fields.items():
+        setattr(product_sku, name, value)
+    _stock_changed(product_sku)
+    return product_sku.stock_quantity - stock
+
+
+def _stock_changed(product_sku):
+    _stocks_changed([product_sku.pk], [product_sku.variant.product_id])
+
+
+def _stocks_changed(sku_ids, product_ids):
+    """update() không gửi signal: xóa cache tồn kho, tính lại tóm tắt sản phẩm, tăng catalog version"""
+    sku_ids = list(sku_ids)
+    StockAvailabilityService.invalidate(sku_ids)
+    transaction.on_commit(lambda: StockAvailabilityService.invalidate(sku_ids))
+    if not ProductSummaryService.is_suspended():
+        ProductSummaryService.refresh(set(product_ids))
+    CatalogCacheService.bump_version()
+    transaction.on_commit(CatalogCacheService.bump_version)
 
 
 class StockService:
@@ -32,15 +92,13 @@ class StockService:
         if quantity <= 0:
             raise ValueError("Số lượng nhập phải lớn hơn 0")
         
-        # Update stock
-        old_quantity = product_sku.stock_quantity
-        product_sku.stock_quantity += quantity
-        
-        # Update cost price if provided
+        # Update stock (và giá vốn nếu có)
+        fields = {}
         if cost_per_item is not None and cost_per_item > 0:
-            product_sku.cost_price = cost_per_item
-        
-        product_sku.save()
+            fields['cost_price'] = cost_per_item
+        old_quantity = _apply_delta(product_sku, stock=quantity, **fields)
+        if old_quantity is None:
+            raise ValueError("SKU không tồn tại")
         
         # Create history record
         StockHistory.objects.create(
@@ -55,47 +113,8 @@ class StockService:
             created_by=user
         )
         
-        # Resolve alerts based on available quantity
-        available = product_sku.available_quantity
-        
-        # Resolve out_of_stock alert nếu có hàng trở lại
-        if available > 0:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='out_of_stock',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
-        
-        # Resolve low_stock alert nếu vượt minimum_stock
-        if available > product_sku.minimum_stock:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='low_stock',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
-        
-        # Resolve reorder_needed alert nếu vượt reorder_point
-        if available > product_sku.reorder_point:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='reorder_needed',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
+        # Resolve / tạo cảnh báo theo tồn kho khả dụng mới
+        StockAlertService.reconcile([product_sku.pk], user=user)
         
         return product_sku
     
@@ -118,17 +137,18 @@ class StockService:
         if quantity <= 0:
             raise ValueError("Số lượng xuất phải lớn hơn 0")
         
-        if product_sku.available_quantity < quantity:
+        # Update stock - chỉ khi còn đủ hàng khả dụng tại thời điểm ghi
+        old_quantity = _apply_delta(
+            product_sku, stock=-quantity,
+            condition=Q(stock_quantity__gte=F('reserved_quantity') + quantity)
+        )
+        if old_quantity is None:
+            product_sku.refresh_from_db(fields=['stock_quantity', 'reserved_quantity'])
             raise ValueError(
                 f"Không đủ hàng trong kho. Có thể bán: {product_sku.available_quantity}, "
                 f"Yêu cầu: {quantity}"
             )
         
-        # Update stock
-        old_quantity = product_sku.stock_quantity
-        product_sku.stock_quantity -= quantity
-        product_sku.save()
-        
         # Create history record
         StockHistory.objects.create(
             product_sku=product_sku,
@@ -146,6 +166,88 @@ class StockService:
         
         return product_sku
     
+    @staticmethod
+    @transaction.atomic
+    def export_stock_many(order, lines, notes='', user=None):
+        """
+        Xuất kho cho nhiều SKU của một đơn hàng
+
+        - Một câu UPDATE có điều kiện cho mọi SKU: thiếu hàng ở bất kỳ SKU nào thì không xuất gì
+        - Một bulk_create StockHistory (mỗi dòng đơn một bản ghi)
+        - Cảnh báo của các SKU được tính từ một lần đọc, tạo bằng một bulk_create
+
+        Args:
+            order: Order liên quan
+            lines: List (ProductSKU, số lượng) - một SKU có thể xuất hiện nhiều lần
+            notes: Ghi chú
+            user: User thực hiện
+
+        Returns:
+            List StockHistory đã tạo
+
+        Raises:
+            ValueError: Số lượng không hợp lệ hoặc không đủ hàng
+        """
+        lines = [(sku, quantity) for sku, quantity in lines]
+        if not lines:
+            return []
+        if any(quantity <= 0 for _, quantity in lines):
+            raise ValueError("Số lượng xuất phải lớn hơn 0")
+
+        totals = {}
+        for sku, quantity in lines:
+            totals[sku.pk] = totals.get(sku.pk, 0) + quantity
+        requested = Case(
+            *[When(pk=sku_id, then=Value(total)) for sku_id, total in totals.items()],
+            output_field=IntegerField()
+        )
+
+        # Update stock - chỉ SKU còn đủ hàng khả dụng mới được trừ
+        updated = ProductSKU.objects.filter(
+            pk__in=list(totals), stock_quantity__gte=F('reserved_quantity') + requested
+        ).update(stock_quantity=F('stock_quantity') - requested, updated_at=timezone.now())
+
+        rows = {
+            row['pk']: row for row in ProductSKU.objects.filter(pk__in=list(totals)).values(
+                'pk', 'stock_quantity', 'reserved_quantity', 'variant__product_id'
+            )
+        }
+        if updated != len(totals):
+            # Thiếu hàng: rollback toàn bộ (raise trong atomic), báo các SKU thiếu theo giá trị hiện tại
+            skus = {sku.pk: sku for sku, _ in lines}
+            short = [
+                f"{skus[sku_id]} (có thể bán: "
+                f"{max(0, rows[sku_id]['stock_quantity'] - rows[sku_id]['reserved_quantity']) if sku_id in rows else 0}, "
+                f"yêu cầu: {total})"
+                for sku_id, total in totals.items()
+                if sku_id not in rows or rows[sku_id]['stock_quantity'] - rows[sku_id]['reserved_quantity'] < total
+            ]
+            raise ValueError(f"Không đủ hàng trong kho: {', '.join(short)}")
+
+        # Lịch sử: số lượng trước/sau tính ngược từ giá trị sau UPDATE, theo thứ tự dòng đơn
+        running = {sku_id: rows[sku_id]['stock_quantity'] + total for sku_id, total in totals.items()}
+        history = []
+        for sku, quantity in lines:
+            before = running[sku.pk]
+            running[sku.pk] = before - quantity
+            history.append(StockHistory(
+                product_sku=sku,
+                transaction_type='export',
+                quantity=-quantity,
+                quantity_before=before,
+                quantity_after=before - quantity,
+                order=order,
+                notes=notes,
+                created_by=user
+            ))
+            sku.stock_quantity = rows[sku.pk]['stock_quantity']
+            sku.reserved_quantity = rows[sku.pk]['reserved_quantity']
+        StockHistory.objects.bulk_create(history)
+
+        StockAlertService.reconcile(list(totals), resolve=False)
+        _stocks_changed(totals, [row['variant__product_id'] for row in rows.values()])
+        return history
+
     @staticmethod
     @transaction.atomic
     def return_stock(product_sku, quantity, order=None, notes='', user=None):
@@ -166,9 +268,9 @@ class StockService:
             raise ValueError("Số lượng hoàn trả phải lớn hơn 0")
         
         # Update stock
-        old_quantity = product_sku.stock_quantity
-        product_sku.stock_quantity += quantity
-        product_sku.save()
+        old_quantity = _apply_delta(product_sku, stock=quantity)
+        if old_quantity is None:
+            raise ValueError("SKU không tồn tại")
         
         # Create history record
         StockHistory.objects.create(
@@ -182,47 +284,8 @@ class StockService:
             created_by=user
         )
         
-        # Resolve alerts based on available quantity (same logic as import_stock)
-        available = product_sku.available_quantity
-        
-        # Resolve out_of_stock alert nếu có hàng trở lại
-        if available > 0:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='out_of_stock',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
-        
-        # Resolve low_stock alert nếu vượt minimum_stock
-        if available > product_sku.minimum_stock:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='low_stock',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
-        
-        # Resolve reorder_needed alert nếu vượt reorder_point
-        if available > product_sku.reorder_point:
-            StockAlert.objects.filter(
-                product_sku=product_sku,
-                alert_type='reorder_needed',
-                is_resolved=False
-            ).update(
-                is_resolved=True,
-                resolved_at=timezone.now(),
-                resolved_by=user,
-                current_quantity=available
-            )
+        # Resolve / tạo cảnh báo theo tồn kho khả dụng mới
+        StockAlertService.reconcile([product_sku.pk], user=user)
         
         return product_sku
     
@@ -244,11 +307,12 @@ class StockService:
         if new_quantity < 0:
             raise ValueError("Số lượng mới không thể âm")
         
-        old_quantity = product_sku.stock_quantity
+        # Khóa dòng SKU để số lượng trước điều chỉnh là giá trị thật trong DB
+        old_quantity = ProductSKU.objects.select_for_update().filter(
+            pk=product_sku.pk
+        ).values_list('stock_quantity', flat=True).get()
         difference = new_quantity - old_quantity
-        
-        product_sku.stock_quantity = new_quantity
-        product_sku.save()
+        _apply_delta(product_sku, stock=difference)
         
         # Create history record
         StockHistory.objects.create(
@@ -261,10 +325,77 @@ class StockService:
             created_by=user
         )
         
-        # Check and create alerts
-        StockService.check_and_create_alerts(product_sku)
+        # Điều chỉnh có thể tăng hoặc giảm: resolve / tạo cảnh báo
+        StockAlertService.reconcile([product_sku.pk], user=user)
         
         return product_sku
+
+    @staticmethod
+    def adjust_stock_many(changes, transaction_type='adjustment', notes='', reference_number='', user=None):
+        """
+        Cộng/trừ tồn kho cho nhiều SKU theo delta (admin sửa sản phẩm, nhập catalog)
+
+        - Khóa và đọc lại tồn kho hiện tại: số lượng trước là giá trị thật trong DB
+        - Một câu UPDATE với F() + delta: không ghi đè số bán/nhập đồng thời, không xuống dưới 0
+        - Một bulk_create StockHistory, cảnh báo đồng bộ một lần
+
+        Args:
+            changes: List (ProductSKU, delta) - SKU đã có trong DB, đã select_related variant
+            transaction_type: Loại giao dịch ghi vào lịch sử
+            notes: Ghi chú
+            reference_number: Số tham chiếu
+            user: User thực hiện
+
+        Returns:
+            List StockHistory đã tạo
+        """
+        deltas = {}
+        skus = {}
+        for sku, delta in changes:
+            if delta:
+                deltas[sku.pk] = deltas.get(sku.pk, 0) + delta
+                skus[sku.pk] = sku
+        if not deltas:
+            return []
+
+        before = dict(
+            ProductSKU.objects.select_for_update().filter(pk__in=list(deltas))
+            .values_list('pk', 'stock_quantity')
+        )
+        delta = Case(
+            *[When(pk=sku_id, then=Value(value)) for sku_id, value in deltas.items()],
+            output_field=IntegerField()
+        )
+        ProductSKU.objects.filter(pk__in=list(before)).update(
+            stock_quantity=Greatest(F('stock_quantity') + delta, 0), updated_at=timezone.now()
+        )
+        rows = ProductSKU.objects.filter(pk__in=list(before)).values_list(
+            'pk', 'stock_quantity', 'reserved_quantity', 'updated_at'
+        )
+
+        history = []
+        for sku_id, stock_quantity, reserved_quantity, updated_at in rows:
+            sku = skus[sku_id]
+            sku.stock_quantity = stock_quantity
+            sku.reserved_quantity = reserved_quantity
+            sku.updated_at = updated_at
+            if stock_quantity == before[sku_id]:
+                continue
+            history.append(StockHistory(
+                product_sku=sku,
+                transaction_type=transaction_type,
+                quantity=stock_quantity - before[sku_id],
+                quantity_before=before[sku_id],
+                quantity_after=stock_quantity,
+                reference_number=reference_number,
+                notes=notes,
+                created_by=user
+            ))
+        StockHistory.objects.bulk_create(history)
+
+        StockAlertService.reconcile(list(before), user=user)
+        _stocks_changed(list(before), {skus[sku_id].variant.product_id for sku_id in before})
+        return history
     
     @staticmethod
     @transaction.atomic
@@ -284,16 +415,14 @@ class StockService:
         if quantity <= 0:
             raise ValueError("Số lượng hàng hỏng phải lớn hơn 0")
         
-        if product_sku.stock_quantity < quantity:
+        # Update stock - không để tồn kho âm
+        old_quantity = _apply_delta(product_sku, stock=-quantity, condition=Q(stock_quantity__gte=quantity))
+        if old_quantity is None:
+            product_sku.refresh_from_db(fields=['stock_quantity', 'reserved_quantity'])
             raise ValueError(
                 f"Số lượng hàng hỏng vượt quá tồn kho. Tồn kho hiện tại: {product_sku.stock_quantity}"
             )
         
-        # Update stock
-        old_quantity = product_sku.stock_quantity
-        product_sku.stock_quantity -= quantity
-        product_sku.save()
-        
         # Create history record
         StockHistory.objects.create(
             product_sku=product_sku,
@@ -309,50 +438,37 @@ class StockService:
         StockService.check_and_create_alerts(product_sku)
         
         return product_sku
-    
+
+    @staticmethod
+    def reserve(product_sku, quantity):
+        """
+        Giữ hàng (tăng reserved_quantity) nếu còn đủ hàng khả dụng
+
+        Returns:
+            True nếu giữ được
+        """
+        if quantity <= 0:
+            return False
+        return _apply_delta(
+            product_sku, reserved=quantity,
+            condition=Q(stock_quantity__gte=F('reserved_quantity') + quantity)
+        ) is not None
+
+    @staticmethod
+    def release(product_sku, quantity):
+        """Hủy giữ hàng (reserved_quantity không xuống dưới 0)"""
+        if quantity > 0:
+            _apply_delta(product_sku, reserved=-quantity)
+
     @staticmethod
     def check_and_create_alerts(product_sku):
         """
-        Kiểm tra và tạo cảnh báo tồn kho
+        Kiểm tra và tạo cảnh báo tồn kho (sau khi tồn kho giảm)
         
         Args:
             product_sku: ProductSKU object
         """
-        available = product_sku.available_quantity
-        
-        # Out of stock alert
-        if available == 0:
-            StockAlert.objects.get_or_create(
-                product_sku=product_sku,
-                alert_type='out_of_stock',
-                is_resolved=False,
-                defaults={
-                    'current_quantity': available,
-                    'threshold': 0
-                }
-            )
-        # Low stock alert
-        elif available <= product_sku.minimum_stock:
-            StockAlert.objects.get_or_create(
-                product_sku=product_sku,
-                alert_type='low_stock',
-                is_resolved=False,
-                defaults={
-                    'current_quantity': available,
-                    'threshold': product_sku.minimum_stock
-                }
-            )
-        # Reorder needed alert
-        elif available <= product_sku.reorder_point:
-            StockAlert.objects.get_or_create(
-                product_sku=product_sku,
-                alert_type='reorder_needed',
-                is_resolved=False,
-                defaults={
-                    'current_quantity': available,
-                    'threshold': product_sku.reorder_point
-                }
-            )
+        StockAlertService.reconcile([product_sku.pk], resolve=False)
     
     @staticmethod
     def resolve_alerts(product_sku, user=None):
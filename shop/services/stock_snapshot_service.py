@@ -0,0 +1,348 @@
+"""
+Stock Snapshot Service
+Tồn kho tại thời điểm bất kỳ = snapshot cuối ngày gần nhất + phát lại một đoạn ngắn của StockHistory
+
+- build(): dựng snapshot cho các ngày đã kết thúc kể từ lần dựng trước (chỉ đọc StockHistory của các ngày đó)
+  mỗi SKU có phát sinh trong ngày: một dòng = quantity_after của giao dịch cuối cùng trong ngày;
+  SKU chưa có snapshot: thêm dòng mở đầu theo ngày tạo SKU (tồn kho trước giao dịch đầu tiên)
+- Tra cứu tại thời điểm T: snapshot đến hết ngày trước T (hoặc ngày cuối đã dựng) + giao dịch từ đó đến T
+  -> chỉ phát lại tối đa một ngày cộng số ngày chưa dựng, không quét toàn bộ sổ kho
+- Tổng toàn kho / biểu đồ theo ngày: cộng dồn quantity_change / value_change trên bảng snapshot;
+  biểu đồ phát lại phần sổ kho sau ngày dựng cuối đúng một lần và cần có snapshot trước
+- Giá trị = số lượng x giá vốn hiện tại của SKU (lúc dựng snapshot, hoặc lúc tra cứu với phần phát lại)
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Exists, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import ProductSKU, StockHistory, StockSnapshot
+
+# Số SKU mỗi lần ghi snapshot khi dựng
+SKU_CHUNK = 1000
+BATCH_SIZE = 1000
+# Số ngày tối đa của một biểu đồ
+MAX_SERIES_DAYS = 366
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+
+def day_start(day):
+    """Thời điểm bắt đầu ngày theo TIME_ZONE"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_end(day):
+    return day_start(day + timedelta(days=1)) - timedelta(microseconds=1)
+
+
+def _value(quantity, cost_price):
+    return (Decimal(quantity) * (cost_price or ZERO)).quantize(CENT)
+
+
+def _replay(since, at, sku_ids=None):
+    """
+    Giao dịch trong [since, at] (since=None: từ đầu sổ kho)
+
+    Returns:
+        {sku_id: (quantity_before của giao dịch đầu, quantity_after của giao dịch cuối)}
+    """
+    rows = StockHistory.objects.filter(created_at__lte=at)
+    if since is not None:
+        rows = rows.filter(created_at__gte=since)
+    if sku_ids is not None:
+        rows = rows.filter(product_sku_id__in=sku_ids)
+    replay = {}
+    for sku_id, before, after in rows.order_by('created_at', 'id').values_list(
+        'product_sku_id', 'quantity_before', 'quantity_after'
+    ).iterator(chunk_size=2000):
+        first = replay.get(sku_id)
+        replay[sku_id] = (first[0] if first else before, after)
+    return replay
+
+
+def _with_opening(skus, **after):
+    """
+    Tồn kho của SKU trước giao dịch đầu tiên thỏa điều kiện after (vd. created_at__gt=T):
+    quantity_before của giao dịch đó, không có giao dịch thì tồn kho hiện tại
+    """
+    first_after = StockHistory.objects.filter(product_sku=OuterRef('pk'), **after).order_by(
+        'created_at', 'id'
+    ).values('quantity_before')[:1]
+    return skus.annotate(opening=Coalesce(Subquery(first_after), 'stock_quantity'))
+
+
+class StockSnapshotService:
+    """Service dựng snapshot tồn kho cuối ngày và tra cứu tồn kho theo thời điểm"""
+
+    @staticmethod
+    def watermark():
+        """Ngày cuối cùng đã có snapshot (None nếu chưa dựng)"""
+        return StockSnapshot.objects.aggregate(last=Max('date'))['last']
+
+    @staticmethod
+    @transaction.atomic
+    def build(until=None):
+        """
+        Dựng snapshot cho các ngày sau lần dựng trước đến hết ngày until
+
+        Args:
+            until: Ngày cuối (mặc định: hôm qua - chỉ dựng ngày đã kết thúc)
+
+        Returns:
+            Số dòng snapshot được tạo
+        """
+        until = until or timezone.localdate() - timedelta(days=1)
+        last = StockSnapshotService.watermark()
+        if last is not None and last >= until:
+            return 0
+        end = day_start(until + timedelta(days=1))
+
+        rows = StockHistory.objects.filter(created_at__lt=end)
+        if last is not None:
+            rows = rows.filter(created_at__gte=day_start(last + timedelta(days=1)))
+        rows = rows.order_by('product_sku_id', 'created_at', 'id').values_list(
+            'product_sku_id', 'created_at', 'quantity_before', 'quantity_after'
+        )
+
+        # Gom theo SKU: (tồn kho trước giao dịch đầu, {ngày: tồn kho cuối ngày})
+        created = 0
+        pending = {}
+        for sku_id, created_at, before, after in rows.iterator(chunk_size=2000):
+            if sku_id not in pending:
+                if len(pending) >= SKU_CHUNK:
+                    created += StockSnapshotService._write(pending)
+                    pending = {}
+                pending[sku_id] = (before, {})
+            pending[sku_id][1][timezone.localdate(created_at)] = after
+        if pending:
+            created += StockSnapshotService._write(pending)
+
+        # SKU chưa có giao dịch nào trước `end`: một dòng mở đầu theo ngày tạo
+        new_skus = _with_opening(
+            ProductSKU.objects.filter(created_at__lt=end).exclude(
+                Exists(StockSnapshot.objects.filter(product_sku=OuterRef('pk')))
+            ),
+            created_at__gte=end
+        ).values_list('pk', 'created_at', 'opening', 'cost_price')
+        snapshots = []
+        for sku_id, created_at, opening, cost_price in new_skus.iterator(chunk_size=2000):
+            value = _value(opening, cost_price)
+            snapshots.append(StockSnapshot(
+                product_sku_id=sku_id, date=timezone.localdate(created_at), quantity=opening, value=value,
+                quantity_change=opening, value_change=value
+            ))
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=BATCH_SIZE)
+        return created + len(snapshots)
+
+    @staticmethod
+    def _write(pending):
+        """Ghi snapshot của một lô SKU, chênh lệch tính từ snapshot trước đó của từng SKU"""
+        latest = StockSnapshot.objects.filter(product_sku=OuterRef('pk')).order_by('-date')
+        skus = ProductSKU.objects.filter(pk__in=list(pending)).annotate(
+            last_quantity=Subquery(latest.values('quantity')[:1]),
+            last_value=Subquery(latest.values('value')[:1]),
+        ).values_list('pk', 'created_at', 'cost_price', 'last_quantity', 'last_value')
+
+        snapshots = []
+        for sku_id, created_at, cost_price, last_quantity, last_value in skus:
+            opening, closings = pending[sku_id]
+            if last_quantity is None:
+                last_quantity, last_value = 0, ZERO
+                created_day = timezone.localdate(created_at)
+                if created_day < next(iter(closings)):
+                    closings = {created_day: opening, **closings}
+            for day, quantity in closings.items():
+                value = _value(quantity, cost_price)
+                snapshots.append(StockSnapshot(
+                    product_sku_id=sku_id, date=day, quantity=quantity, value=value,
+                    quantity_change=quantity - last_quantity, value_change=value - last_value
+                ))
+                last_quantity, last_value = quantity, value
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=BATCH_SIZE)
+        return len(snapshots)
+
+    @staticmethod
+    def _base(at):
+        """Ngày snapshot làm gốc cho thời điểm at và thời điểm bắt đầu phát lại sổ kho"""
+        last = StockSnapshotService.watermark()
+        if last is None:
+            return None, None
+        base_day = min(timezone.localdate(at) - timedelta(days=1), last)
+        return base_day, day_start(base_day + timedelta(days=1))
+
+    @staticmethod
+    def quantities_at(at, sku_ids):
+        """
+        Tồn kho của từng SKU tại thời điểm at
+
+        Returns:
+            {sku_id: {'quantity', 'value'}} (SKU chưa tồn tại tại at: 0)
+        """
+        sku_ids = list(sku_ids)
+        base_day, since = StockSnapshotService._base(at)
+        base = Value(None, output_field=IntegerField())
+        if base_day is not None:
+            base = Subquery(StockSnapshot.objects.filter(
+                product_sku=OuterRef('pk'), date__lte=base_day
+            ).order_by('-date').values('quantity')[:1])
+        skus = _with_opening(
+            ProductSKU.objects.filter(pk__in=sku_ids, created_at__lte=at), created_at__gt=at
+        ).annotate(base=base).values_list('pk', 'base', 'opening', 'cost_price')
+        replay = _replay(since, at, sku_ids)
+
+        result = {sku_id: {'quantity': 0, 'value': ZERO} for sku_id in sku_ids}
+        for sku_id, base_quantity, opening, cost_price in skus:
+            if sku_id in replay:
+                quantity = replay[sku_id][1]
+            elif base_quantity is not None:
+                quantity = base_quantity
+            else:
+                quantity = opening
+            result[sku_id] = {'quantity': quantity, 'value': _value(quantity, cost_price)}
+        return result
+
+    @staticmethod
+    def totals_at(at, sku_ids=None):
+        """
+        Tổng tồn kho (toàn kho hoặc các SKU) tại thời điểm at
+
+        Returns:
+            {'quantity', 'value'}
+        """
+        base_day, since = StockSnapshotService._base(at)
+        quantity, value = 0, ZERO
+        snapshots = StockSnapshot.objects.all()
+        if sku_ids is not None:
+            snapshots = snapshots.filter(product_sku_id__in=sku_ids)
+        if base_day is not None:
+            totals = snapshots.filter(date__lte=base_day).aggregate(
+                quantity=Sum('quantity_change'), value=Sum('value_change')
+            )
+            quantity, value = totals['quantity'] or 0, totals['value'] or ZERO
+
+        # Giao dịch sau ngày gốc: cộng chênh lệch (SKU chưa có snapshot: cộng cả tồn kho)
+        replay = _replay(since, at, sku_ids)
+        if replay:
+            known = set()
+            if base_day is not None:
+                known = set(snapshots.filter(product_sku_id__in=list(replay), date__lte=base_day)
+                            .values_list('product_sku_id', flat=True).distinct())
+            costs = dict(ProductSKU.objects.filter(pk__in=list(replay)).values_list('pk', 'cost_price'))
+            for sku_id, (before, after) in replay.items():
+                change = after - (before if sku_id in known else 0)
+                quantity += change
+                value += _value(change, costs.get(sku_id))
+
+        # SKU tạo sau ngày gốc, chưa có snapshot và chưa có giao dịch đến at
+        new_skus = ProductSKU.objects.filter(created_at__lte=at)
+        if since is not None:
+            new_skus = new_skus.filter(created_at__gte=since).exclude(Exists(
+                StockSnapshot.objects.filter(product_sku=OuterRef('pk'), date__lte=base_day)
+            ))
+        if sku_ids is not None:
+            new_skus = new_skus.filter(pk__in=sku_ids)
+        for sku_id, opening, cost_price in _with_opening(new_skus, created_at__gt=at).values_list(
+            'pk', 'opening', 'cost_price'
+        ).iterator(chunk_size=2000):
+            if sku_id not in replay:
+                quantity += opening
+                value += _value(opening, cost_price)
+        return {'quantity': quantity, 'value': value}
+
+    @staticmethod
+    def _tail_changes(last, until, sku_ids=None):
+        """
+        Chênh lệch tồn kho theo ngày sau ngày snapshot cuối (last) đến until:
+        phát lại sổ kho của đoạn này một lần, cộng tồn đầu của SKU mới tạo chưa có snapshot
+
+        Returns:
+            {ngày: [chênh lệch số lượng, chênh lệch giá trị]}
+        """
+        since = day_start(last + timedelta(days=1))
+        rows = StockHistory.objects.filter(created_at__gte=since, created_at__lte=until)
+        new_skus = ProductSKU.objects.filter(created_at__gte=since, created_at__lte=until).exclude(
+            Exists(StockSnapshot.objects.filter(product_sku=OuterRef('pk')))
+        )
+        if sku_ids is not None:
+            rows = rows.filter(product_sku_id__in=sku_ids)
+            new_skus = new_skus.filter(pk__in=sku_ids)
+        rows = list(rows.order_by('created_at', 'id').values_list(
+            'product_sku_id', 'created_at', 'quantity_before', 'quantity_after'
+        ))
+        new_skus = _with_opening(new_skus, created_at__gte=since).values_list('pk', 'created_at', 'opening', 'cost_price')
+
+        # Sự kiện theo thời gian: tạo SKU (tồn đầu) trước giao dịch cùng thời điểm
+        events, costs = [], {}
+        for sku_id, created_at, opening, cost_price in new_skus:
+            events.append((created_at, 0, sku_id, 0, opening))
+            costs[sku_id] = cost_price
+        events.extend((created_at, 1, sku_id, before, after) for sku_id, created_at, before, after in rows)
+        events.sort(key=lambda event: event[:2])
+
+        replayed = list({row[0] for row in rows} - set(costs))
+        costs.update(ProductSKU.objects.filter(pk__in=replayed).values_list('pk', 'cost_price'))
+        known = set(StockSnapshot.objects.filter(product_sku_id__in=replayed)
+                    .values_list('product_sku_id', flat=True).distinct())
+
+        # SKU có snapshot: giao dịch đầu tính từ quantity_before; SKU chưa có: từ 0
+        current = {}
+        changes = {}
+        for created_at, _, sku_id, before, after in events:
+            previous = current.get(sku_id, before if sku_id in known else 0)
+            current[sku_id] = after
+            change = changes.setdefault(timezone.localdate(created_at), [0, ZERO])
+            change[0] += after - previous
+            change[1] += _value(after - previous, costs.get(sku_id))
+        return changes
+
+    @staticmethod
+    def series(start, end, sku_ids=None):
+        """
+        Tồn kho cuối mỗi ngày trong [start, end] từ bảng snapshot; các ngày chưa dựng snapshot
+        được tính bằng một lần phát lại sổ kho sau ngày snapshot cuối
+
+        Returns:
+            List {'date', 'quantity', 'value'}
+
+        Raises:
+            ValueError: Khoảng ngày không hợp lệ, quá MAX_SERIES_DAYS hoặc chưa dựng snapshot
+        """
+        if end < start:
+            raise ValueError("Ngày kết thúc phải sau ngày bắt đầu")
+        if (end - start).days + 1 > MAX_SERIES_DAYS:
+            raise ValueError(f"Tối đa {MAX_SERIES_DAYS} ngày")
+        last = StockSnapshotService.watermark()
+        if last is None:
+            raise ValueError("Chưa có snapshot tồn kho - chạy lệnh build_stock_snapshots")
+        end = min(end, timezone.localdate())
+        snapshots = StockSnapshot.objects.all()
+        if sku_ids is not None:
+            snapshots = snapshots.filter(product_sku_id__in=sku_ids)
+
+        totals = snapshots.filter(date__lt=start).aggregate(
+            quantity=Sum('quantity_change'), value=Sum('value_change')
+        )
+        quantity, value = totals['quantity'] or 0, totals['value'] or ZERO
+        changes = {
+            row['date']: [row['quantity'], row['value']]
+            for row in snapshots.filter(date__gte=start, date__lte=min(end, last))
+            .values('date').annotate(quantity=Sum('quantity_change'), value=Sum('value_change')).order_by()
+        }
+        if end > last:
+            changes.update(StockSnapshotService._tail_changes(last, min(day_end(end), timezone.now()), sku_ids))
+
+        # Ngày sau last nhưng trước start vẫn phải cộng vào tồn kho đầu kỳ
+        points = []
+        day = min(start, last + timedelta(days=1))
+        while day <= end:
+            if day in changes:
+                quantity += changes[day][0]
+                value += changes[day][1]
+            if day >= start:
+                points.append({'date': day, 'quantity': quantity, 'value': value})
+            day += timedelta(days=1)
+        return points
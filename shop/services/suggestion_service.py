@@ -0,0 +1,304 @@
+"""
+Suggestion Service
+Gợi ý tìm kiếm khi gõ (search-as-you-type): index tiền tố trong bộ nhớ của mỗi process
+
+- Mục gợi ý: tên sản phẩm, thương hiệu, danh mục và tag phổ biến
+- Mảng khóa đã sắp xếp (bisect) - mỗi mục có một khóa cho mỗi vị trí đầu từ, nên "thun"
+  khớp cả "Áo thun nam"
+- Trọng số theo sold_count/view_count (thương hiệu/danh mục/tag = tổng trọng số sản phẩm)
+- Nạp lại tăng dần theo Product.updated_at như FuzzySearchIndex
+- Nạp toàn bộ: dựng index mới riêng (sort khóa một lần) rồi tráo vào dưới lock;
+  nạp lại định kỳ chạy ở thread nền, request vẫn dùng index cũ trong lúc dựng
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from heapq import nlargest
+from django.db import connection
+from ..models import Product
+from ..utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Một lượt bán có giá trị bằng bấy nhiêu lượt xem
+SOLD_WEIGHT = 10
+# Tag phải xuất hiện ở ít nhất bấy nhiêu sản phẩm mới được gợi ý
+MIN_TAG_PRODUCTS = 2
+# Tiền tố ngắn khớp rất nhiều khóa - cache kết quả (xóa khi index thay đổi)
+SHORT_PREFIX = 3
+
+
+def product_weight(sold_count, view_count):
+    return math.log1p((sold_count or 0) * SOLD_WEIGHT + (view_count or 0))
+
+
+class SuggestionIndex:
+    """
+    Index gợi ý trong bộ nhớ của mỗi process
+
+    - entries: (loại, id) -> [nhãn hiển thị, trọng số, slug]
+    - keys: list (khóa chuẩn hóa, (loại, id)) đã sắp xếp để tra tiền tố bằng bisect
+    - products: product_id -> (trọng số, brand_id, category_id, tags) để trừ đóng góp cũ khi nạp lại
+    """
+
+    REFRESH_INTERVAL = 30  # giây
+    # view_count/sold_count được cộng bằng UPDATE (không đổi updated_at) - nạp lại toàn bộ định kỳ
+    RELOAD_INTERVAL = 3600  # giây
+    REFRESH_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Chỉ một lần nạp toàn bộ tại một thời điểm
+        self._load_lock = threading.RLock()
+        self._reloading = False
+        self._building = False
+        self._removed = set()
+        self._reset()
+
+    def _reset(self):
+        self.entries = {}
+        self.keys = []
+        self.products = {}
+        self.groups = defaultdict(lambda: [0.0, 0, ''])  # (loại, id) -> [tổng trọng số, số sản phẩm, nhãn]
+        self.cache = {}
+        self.loaded = False
+        self.last_updated_at = None
+        self.last_refresh = 0
+        self.last_load = 0
+        # Đang nạp toàn bộ: chưa giữ mảng khóa, sắp xếp một lần ở _index_keys()
+        self._bulk = False
+
+    # ----- Xây dựng index -----
+
+    def _unkey(self, entry_key):
+        if self._bulk:
+            return
+        label = self.entries[entry_key][0]
+        for key in self._entry_keys(label):
+            index = bisect.bisect_left(self.keys, (key, entry_key))
+            if index < len(self.keys) and self.keys[index] == (key, entry_key):
+                self.keys.pop(index)
+
+    @staticmethod
+    def _entry_keys(label):
+        """Khóa cho mỗi vị trí đầu từ: "ao thun nam", "thun nam", "nam" """
+        terms = normalize_text(label).split()
+        return {' '.join(terms[position:]) for position in range(len(terms))}
+
+    def _set_entry(self, entry_key, label, weight, slug=None):
+        entry = self.entries.get(entry_key)
+        if entry and entry[0] != label:
+            self._unkey(entry_key)
+            entry = None
+        if entry is None and not self._bulk:
+            for key in self._entry_keys(label):
+                bisect.insort(self.keys, (key, entry_key))
+        self.entries[entry_key] = [label, weight, slug]
+
+    def _remove_entry(self, entry_key):
+        if entry_key in self.entries:
+            self._unkey(entry_key)
+            del self.entries[entry_key]
+
+    def _sync_group(self, entry_key):
+        weight, count, label = self.groups[entry_key]
+        minimum = MIN_TAG_PRODUCTS if entry_key[0] == 'tag' else 1
+        if count >= minimum and label:
+            self._set_entry(entry_key, label, round(weight, 4))
+        else:
+            self._remove_entry(entry_key)
+            if count <= 0:
+                del self.groups[entry_key]
+
+    def _product_groups(self, brand_id, category_id, tags):
+        groups = []
+        if brand_id:
+            groups.append(('brand', brand_id))
+        if category_id:
+            groups.append(('category', category_id))
+        groups.extend(('tag', tag) for tag in tags)
+        return groups
+
+    def _remove(self, product_id):
+        meta = self.products.pop(product_id, None)
+        if meta is None:
+            return
+        weight, brand_id, category_id, tags = meta
+        self._remove_entry(('product', product_id))
+        for entry_key in self._product_groups(brand_id, category_id, tags):
+            group = self.groups[entry_key]
+            group[0] -= weight
+            group[1] -= 1
+            self._sync_group(entry_key)
+
+    def _add(self, row):
+        product_id, name, slug, sold_count, view_count, brand_id, brand, category_id, category, tags = row
+        weight = product_weight(sold_count, view_count)
+        # Tag giữ nguyên chữ hiển thị đầu tiên gặp, gộp theo dạng chuẩn hóa
+        tag_labels = {}
+        for tag in tags if isinstance(tags, list) else ():
+            if isinstance(tag, str) and normalize_text(tag):
+                tag_labels.setdefault(normalize_text(tag), tag.strip())
+        tag_keys = tuple(tag_labels)
+
+        self.products[product_id] = (weight, brand_id, category_id, tag_keys)
+        self._set_entry(('product', product_id), name, round(weight, 4), slug)
+        labels = {('brand', brand_id): brand, ('category', category_id): category}
+        for entry_key in self._product_groups(brand_id, category_id, tag_keys):
+            group = self.groups[entry_key]
+            group[0] += weight
+            group[1] += 1
+            group[2] = labels.get(entry_key) or group[2] or tag_labels.get(entry_key[1], '')
+            self._sync_group(entry_key)
+
+    def _load_rows(self, queryset):
+        rows = queryset.values_list(
+            'id', 'name', 'slug', 'sold_count', 'view_count', 'brand_id', 'brand__name',
+            'category_id', 'category__name', 'tags', 'is_active', 'updated_at'
+        )
+        for row in rows.iterator(chunk_size=2000):
+            self._remove(row[0])
+            if row[10]:
+                self._add(row[:10])
+            if self.last_updated_at is None or row[11] > self.last_updated_at:
+                self.last_updated_at = row[11]
+        self.cache = {}
+
+    def _index_keys(self):
+        """Dựng mảng khóa từ entries bằng một lần sort (thay cho insort từng khóa)"""
+        self.keys = sorted(
+            (key, entry_key) for entry_key, entry in self.entries.items() for key in self._entry_keys(entry[0])
+        )
+        self._bulk = False
+
+    def load(self):
+        """
+        Nạp toàn bộ sản phẩm đang bán: dựng index mới ngoài lock rồi tráo vào,
+        request trong lúc dựng vẫn đọc index cũ
+        """
+        with self._load_lock:
+            fresh = SuggestionIndex()
+            fresh._bulk = True
+            with self._lock:
+                self._building = True
+                self._removed = set()
+            try:
+                fresh._load_rows(Product.objects.filter(is_active=True))
+                fresh._index_keys()
+                with self._lock:
+                    for name in ('entries', 'keys', 'products', 'groups', 'last_updated_at'):
+                        setattr(self, name, getattr(fresh, name))
+                    self.cache = {}
+                    self.loaded = True
+                    self.last_refresh = self.last_load = time.monotonic()
+                    # Thay đổi trong lúc dựng: sản phẩm bị xóa và sản phẩm sửa (theo updated_at)
+                    for product_id in self._removed:
+                        self._remove(product_id)
+                    self.refresh()
+            finally:
+                with self._lock:
+                    self._building = False
+                    self._removed = set()
+            logger.info(f"Suggestion index loaded: {len(self.entries)} entries, {len(self.keys)} keys")
+
+    def _background_load(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Suggestion index reload failed: {e}")
+        finally:
+            self._reloading = False
+            connection.close()
+
+    def reload_in_background(self):
+        """Nạp lại toàn bộ ở thread nền (bỏ qua nếu đang nạp)"""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_load, name='suggestion-index-reload', daemon=True).start()
+
+    def refresh(self, product_ids=None):
+        """Nạp lại sản phẩm thay đổi kể từ lần nạp trước (theo updated_at) hoặc các sản phẩm chỉ định"""
+        with self._lock:
+            if not self.loaded:
+                return
+            if product_ids is not None:
+                self._load_rows(Product.objects.filter(pk__in=list(product_ids)))
+            elif self.last_updated_at is not None:
+                self._load_rows(Product.objects.filter(updated_at__gt=self.last_updated_at - self.REFRESH_OVERLAP))
+            else:
+                self._load_rows(Product.objects.all())
+            self.last_refresh = time.monotonic()
+
+    def remove(self, product_id):
+        """Gỡ sản phẩm khỏi index (khi bị xóa)"""
+        with self._lock:
+            self._remove(product_id)
+            if self._building:
+                self._removed.add(product_id)
+            self.cache = {}
+
+    def ensure_fresh(self):
+        """
+        Nạp lần đầu (đồng bộ - chưa có gì để trả), nạp lại định kỳ ở thread nền,
+        hoặc refresh nếu đã quá REFRESH_INTERVAL (kiểm tra lại sau khi lấy lock)
+        """
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+            return
+        if time.monotonic() - self.last_load > self.RELOAD_INTERVAL:
+            self.reload_in_background()
+        if time.monotonic() - self.last_refresh > self.REFRESH_INTERVAL:
+            with self._lock:
+                if time.monotonic() - self.last_refresh > self.REFRESH_INTERVAL:
+                    self.refresh()
+
+    # ----- Tra cứu -----
+
+    def suggest(self, text, limit=8):
+        """
+        Gợi ý cho chuỗi đang gõ (khớp tiền tố từ bất kỳ vị trí đầu từ nào)
+
+        Returns:
+            List {'text', 'type', 'id', 'slug'} theo trọng số giảm dần
+        """
+        prefix = ' '.join(normalize_text(text).split())
+        if not prefix:
+            return []
+        self.ensure_fresh()
+
+        with self._lock:
+            cache_key = (prefix, limit)
+            if cache_key in self.cache:
+                return self.cache[cache_key]
+
+            matched = set()
+            index = bisect.bisect_left(self.keys, (prefix,))
+            while index < len(self.keys) and self.keys[index][0].startswith(prefix):
+                matched.add(self.keys[index][1])
+                index += 1
+            ranked = nlargest(limit, matched, key=lambda entry_key: (self.entries[entry_key][1], str(entry_key)))
+            results = [
+                {
+                    'text': self.entries[entry_key][0],
+                    'type': entry_key[0],
+                    'id': entry_key[1] if entry_key[0] != 'tag' else None,
+                    'slug': self.entries[entry_key][2],
+                }
+                for entry_key in ranked
+            ]
+            if len(prefix) <= SHORT_PREFIX:
+                self.cache[cache_key] = results
+            return results
+
+
+# Index dùng chung trong process
+suggestion_index = SuggestionIndex()
@@ -4,8 +4,20 @@
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Order, OrderItem, Review
+from .models import (
+    Order, OrderItem, Review, Product, ProductVariant, ProductVariantImage, ProductSKU,
+    Brand, Category, ProductVoucher, CartItem
+)
 from .services.stock_service import StockService
+from .services.product_summary_service import ProductSummaryService
+from .services.search_service import ProductSearchService
+from .services.fuzzy_search_service import fuzzy_search_index
+from .services.suggestion_service import suggestion_index
+from .services.catalog_cache_service import CatalogCacheService
+from .services.category_tree_service import CategoryTreeService
+from .services.image_rendition_service import ImageRenditionService
+from .services.media_blob_service import MediaBlobService
+from .services.stock_availability_service import StockAvailabilityService
 import logging
 import time
 
@@ -176,3 +188,147 @@ def update_product_rating(sender, instance, **kwargs):
         logger.info(f"Updated avg_rating for product: {product.name} -> {product.avg_rating}")
     except Exception as e:
         logger.error(f"Failed to update product rating: {str(e)}")
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductVariantImage)
+@receiver(post_delete, sender=ProductVariantImage)
+@receiver(post_save, sender=ProductSKU)
+@receiver(post_delete, sender=ProductSKU)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_product_summary(sender, instance, **kwargs):
+    """
+    Cập nhật dữ liệu tóm tắt của Product (giá, ảnh, tồn kho, số review)
+    khi variant, ảnh, SKU hoặc review thay đổi
+    """
+    if ProductSummaryService.is_suspended():
+        return
+    try:
+        if sender is ProductVariant or sender is Review:
+            product = instance.product
+        else:
+            product = instance.variant.product
+        ProductSummaryService.refresh_product(product)
+    except Exception as e:
+        # Product có thể đã bị xóa (cascade) - bỏ qua
+        logger.debug(f"Skip product summary refresh: {str(e)}")
+
+
+@receiver(post_save, sender=ProductSKU)
+@receiver(post_delete, sender=ProductSKU)
+def invalidate_stock_availability(sender, instance, **kwargs):
+    """Xóa cache tồn kho khả dụng của SKU (reserve/release/nhập/xuất đều lưu ProductSKU)"""
+    StockAvailabilityService.invalidate([instance.pk])
+
+
+# ============= IMAGE RENDITION & MEDIA BLOB SIGNALS =============
+
+@receiver(pre_save, sender=ProductVariantImage)
+def remember_previous_image(sender, instance, **kwargs):
+    """Lưu tên file cũ để đếm lại tham chiếu khi đổi ảnh"""
+    instance._previous_image = None
+    if instance.pk:
+        instance._previous_image = ProductVariantImage.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=ProductVariantImage)
+def generate_image_renditions(sender, instance, **kwargs):
+    """
+    Đếm tham chiếu blob và tạo ảnh thu nhỏ trên thread pool khi ảnh mới được upload hoặc file ảnh thay đổi.
+    Blob đã có ảnh thu nhỏ (upload trùng nội dung) thì dùng lại luôn
+    """
+    previous = getattr(instance, '_previous_image', None)
+    if instance.image.name != previous:
+        MediaBlobService.acquire(instance.image.name)
+        if previous:
+            MediaBlobService.release(previous)
+
+    if instance.image and not ImageRenditionService.is_current(instance):
+        existing = ProductVariantImage.objects.filter(image=instance.image.name).exclude(
+            pk=instance.pk
+        ).exclude(renditions={}).values_list('renditions', flat=True).first()
+        if existing:
+            instance.renditions = existing
+            ProductVariantImage.objects.filter(pk=instance.pk).update(renditions=existing)
+        else:
+            ImageRenditionService.schedule(instance.pk)
+
+
+@receiver(post_delete, sender=ProductVariantImage)
+def release_image_blob(sender, instance, **kwargs):
+    """Bỏ tham chiếu tới blob - file và ảnh thu nhỏ bị xóa khi không còn ảnh nào dùng"""
+    MediaBlobService.release(instance.image.name)
+
+
+# ============= SEARCH INDEX SIGNALS =============
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Cập nhật full-text index, fuzzy index và index gợi ý (của process hiện tại) khi Product được lưu"""
+    ProductSearchService.index_products([instance.pk])
+    fuzzy_search_index.refresh([instance.pk])
+    suggestion_index.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Gỡ Product khỏi full-text index, fuzzy index và index gợi ý khi bị xóa"""
+    ProductSearchService.remove_products([instance.pk])
+    fuzzy_search_index.remove(instance.pk)
+    suggestion_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def reindex_related_products(sender, instance, created, **kwargs):
+    """Đổi tên Brand/Category thì index lại các sản phẩm liên quan"""
+    if created:
+        return
+    product_ids = list(instance.products.values_list('pk', flat=True))
+    ProductSearchService.index_products(product_ids)
+    fuzzy_search_index.refresh(product_ids)
+    suggestion_index.refresh(product_ids)
+
+
+# ============= CATALOG CACHE SIGNALS =============
+
+CATALOG_MODELS = (Product, ProductVariant, ProductVariantImage, ProductSKU, Category, Brand, ProductVoucher)
+
+
+def bump_catalog_version(sender, **kwargs):
+    """
+    Dữ liệu catalog thay đổi: tăng catalog version ngay và thêm lần nữa sau khi commit
+    (tránh request đồng thời cache lại dữ liệu cũ trước khi transaction commit)
+    """
+    try:
+        CatalogCacheService.bump_version()
+        transaction.on_commit(CatalogCacheService.bump_version)
+    except Exception as e:
+        logger.warning(f"Could not bump catalog version: {str(e)}")
+
+
+for _model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version, sender=_model, dispatch_uid=f'catalog_version_save_{_model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=_model, dispatch_uid=f'catalog_version_delete_{_model.__name__}')
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def bump_cart_version(sender, instance, **kwargs):
+    """Giỏ hàng thay đổi: đổi ETag của GET /cart/ cho user đó"""
+    try:
+        user_id = instance.cart.user_id
+        if user_id:
+            CatalogCacheService.bump_version(CatalogCacheService.cart_scope(user_id))
+    except Exception as e:
+        logger.warning(f"Could not bump cart version: {str(e)}")
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_category_paths(sender, instance, **kwargs):
+    """Xóa danh mục cha thì các danh mục con thành danh mục gốc (SET_NULL) - tính lại path"""
+    CategoryTreeService.rebuild()
@@ -0,0 +1,81 @@
+"""
+Content-addressed storage cho ảnh sản phẩm
+
+File được đặt tên theo SHA-256 của nội dung: products/blobs/<2 ký tự đầu>/<sha256>.<ext>
+- Upload trùng nội dung (dù khác variant/sản phẩm) dùng chung một file, không ghi lại
+- Tên file không bao giờ đổi nội dung nên media server có thể cache vĩnh viễn
+- Số tham chiếu của mỗi file nằm trong MediaBlob (xem MediaBlobService), file chỉ bị xóa
+  khi không còn ProductVariantImage nào dùng
+"""
+
+import hashlib
+import os
+import posixpath
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.views.static import serve
+
+BLOB_PREFIX = 'products/blobs/'
+HASH_CHUNK = 1024 * 1024
+
+# Header cho file content-addressed (ảnh thu nhỏ có thể được tạo lại cùng tên nên không áp dụng)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def content_hash(content):
+    """SHA-256 của file upload (đọc theo khối, trả con trỏ về đầu file)"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK) if hasattr(content, 'chunks') else iter(lambda: content.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX) and '/renditions/' not in name
+
+
+class _BlobExists(Exception):
+    pass
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage đặt tên file theo nội dung và bỏ qua ghi trùng"""
+
+    def get_available_name(self, name, max_length=None):
+        # Tên cuối cùng được quyết định trong _save theo nội dung - không thêm hậu tố chống trùng.
+        # Nếu upload đồng thời khác vừa ghi cùng blob (FileSystemStorage._save gặp FileExistsError)
+        # thì dùng luôn file đó
+        if is_blob(name) and self.exists(name):
+            raise _BlobExists(name)
+        return name
+
+    def _save(self, name, content):
+        name = blob_name(content_hash(content), name)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except _BlobExists:
+            return name
+
+
+def variant_image_storage():
+    return ContentAddressedStorage()
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve (development) kèm Cache-Control vĩnh viễn cho file content-addressed"""
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if is_blob(posixpath.normpath(path)):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
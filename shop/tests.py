@@ -3,10 +3,30 @@ from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import Product, Category, Brand, Cart, CartItem, Order
+from django.utils import timezone
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from .models import (
+    Product, ProductVariant, ProductVariantImage, ProductSKU,
+    Category, Brand, Cart, CartItem, Order, OrderItem, Review, Wishlist, ProductBoughtTogether
+)
 
 User = get_user_model()
 
+
+def setUpModule():
+    # Bộ đếm ghi trễ: test tự flush_all(), không để thread nền ghi xuống DB giữa chừng
+    from shop.services.counter_service import stop_flusher
+    stop_flusher()
+
+
+def tearDownModule():
+    # Bỏ số đếm còn chờ trước khi hủy test DB (atexit không còn gì để ghi)
+    from shop.services.counter_service import reset_all
+    reset_all()
+
 class UserAuthenticationTest(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -118,3 +138,1547 @@ class OrderTest(APITestCase):
         
         response = self.client.post(order_url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ProductSummaryTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category')
+        self.brand = Brand.objects.create(name='Test Brand')
+
+    def create_product(self, name):
+        product = Product.objects.create(name=name, category=self.category, brand=self.brand)
+        for color, price, discount in [('Den', 200000, 150000), ('Trang', 250000, None)]:
+            variant = ProductVariant.objects.create(
+                product=product, color=color, price=price, discount_price=discount
+            )
+            ProductVariantImage.objects.create(variant=variant, image=f'products/{product.id}/{color}.jpg')
+            for size in ['M', 'L']:
+                ProductSKU.objects.create(variant=variant, size=size, stock_quantity=10, reserved_quantity=2)
+        return product
+
+    def test_summary_maintained_on_write(self):
+        """Summary fields follow variant, SKU, image and review changes"""
+        product = self.create_product('Ao Thun')
+        product.refresh_from_db()
+        self.assertEqual(product.min_price, 150000)
+        self.assertEqual(product.max_price, 250000)
+        self.assertEqual(product.base_price, 200000)
+        self.assertTrue(product.is_on_sale)
+        self.assertEqual(product.available_stock, 32)
+        self.assertEqual(product.primary_image, f'products/{product.id}/Den.jpg')
+        self.assertEqual(product.get_price_range(), '150,000₫ - 250,000₫')
+
+        user = User.objects.create_user(username='reviewer', password='testpassword123')
+        Review.objects.create(product=product, user=user, rating=5)
+        ProductVariant.objects.filter(product=product, color='Den').get().delete()
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, 1)
+        self.assertFalse(product.is_on_sale)
+        self.assertEqual(product.min_price, 250000)
+        self.assertEqual(product.available_stock, 16)
+
+    def test_rebuild_command(self):
+        """rebuild_product_summaries recomputes stale rows"""
+        product = self.create_product('Quan Jean')
+        Product.objects.filter(pk=product.pk).update(min_price=0, available_stock=0)
+        call_command('rebuild_product_summaries', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.min_price, 150000)
+        self.assertEqual(product.available_stock, 32)
+
+    def test_product_list_constant_queries(self):
+        """Product list query count does not grow with the page size"""
+        self.create_product('Ao 1')
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('product_list'))
+        for index in range(4):
+            self.create_product(f'Ao {index + 2}')
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(small_page), len(large_page))
+
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Áo Nam')
+        self.brand = Brand.objects.create(name='Coolmate')
+        self.tee = Product.objects.create(
+            name='Áo Thun Nam Basic', category=self.category, brand=self.brand, tags=['cotton', 'mùa hè']
+        )
+        self.polo = Product.objects.create(
+            name='Áo Polo', short_description='Chất liệu thun co giãn', category=self.category
+        )
+
+    def search(self, q):
+        response = self.client.get(reverse('product_list'), {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['id'] for product in response.data['results']]
+
+    def test_search_ranked_by_bm25(self):
+        """?q= uses the index, ignores diacritics and ranks name matches first"""
+        self.assertEqual(self.search('ao thun'), [self.tee.id, self.polo.id])
+        self.assertEqual(self.search('mua he'), [self.tee.id])
+        self.assertEqual(self.search('cool'), [self.tee.id])
+
+    def test_index_updated_incrementally(self):
+        """Product and brand saves update the index"""
+        self.tee.is_active = False
+        self.tee.save()
+        self.assertEqual(self.search('basic'), [])
+
+        self.polo.brand = self.brand
+        self.polo.save()
+        self.brand.name = 'Routine'
+        self.brand.save()
+        self.assertEqual(self.search('routine'), [self.polo.id])
+
+    def test_result_cap_reported(self):
+        """Matches beyond MAX_RESULTS are cut off and the response says so"""
+        from unittest import mock
+        from shop.services.search_service import ProductSearchService
+        response = self.client.get(reverse('product_list'), {'q': 'ao'})
+        self.assertIs(response.data['truncated'], False)
+        with mock.patch.object(ProductSearchService, 'MAX_RESULTS', 1):
+            response = self.client.get(reverse('product_list'), {'q': 'ao', 'facets': '1'})
+            self.assertEqual(len(response.data['results']), 1)
+            self.assertEqual(response.data['count'], 1)
+            self.assertIs(response.data['truncated'], True)
+            self.assertEqual(response.data['facets']['count'], 1)
+            self.assertIs(self.client.get(reverse('product_facets'), {'q': 'ao thun'}).data['truncated'], True)
+        self.assertNotIn('truncated', self.client.get(reverse('product_list')).data)
+
+
+class FuzzySearchTest(APITestCase):
+    def setUp(self):
+        from shop.services.fuzzy_search_service import fuzzy_search_index
+        self.index = fuzzy_search_index
+        self.index.load()
+        self.addCleanup(self.index._reset)
+        self.category = Category.objects.create(name='Thời Trang')
+        self.brand = Brand.objects.create(name='Đông Hải')
+        self.tee = Product.objects.create(name='Áo Thun Nam Cổ Tròn', category=self.category, brand=self.brand)
+        self.dress = Product.objects.create(name='Đầm Maxi Đi Biển', category=self.category)
+
+    def test_diacritics_and_typos(self):
+        """Matches without diacritics, with đ -> d and with a 1-2 character typo"""
+        self.assertEqual(self.index.search('ao thun nam'), [self.tee.id])
+        self.assertEqual(self.index.search('ao thnu'), [self.tee.id])
+        self.assertEqual(self.index.search('dam maxi'), [self.dress.id])
+        self.assertEqual(self.index.search('dong hai'), [self.tee.id])
+        self.assertEqual(self.index.search('ma'), [self.dress.id])
+
+        response = self.client.get(reverse('product_list'), {'q': 'dam maxxi', 'fuzzy': '1'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.dress.id])
+
+    def test_incremental_refresh(self):
+        """Changes are picked up by updated_at and inactive/deleted products drop out"""
+        self.tee.name = 'Áo Khoác Gió'
+        self.tee.save()
+        Product.objects.filter(pk=self.dress.pk).update(is_active=False, updated_at=timezone.now())
+        self.index.refresh()
+        self.assertEqual(self.index.search('khoac'), [self.tee.id])
+        self.assertEqual(self.index.search('thun'), [])
+        self.assertEqual(self.index.search('maxi'), [])
+
+        self.tee.delete()
+        self.assertEqual(self.index.search('khoac'), [])
+
+
+class ProductFacetTest(APITestCase):
+    def setUp(self):
+        self.shirts = Category.objects.create(name='Áo')
+        self.pants = Category.objects.create(name='Quần')
+        self.brand = Brand.objects.create(name='Coolmate')
+        self.tee = self.create_product('Áo Thun', self.shirts, 'Đỏ', ['M', 'L'], 150000, brand=self.brand)
+        self.shirt = self.create_product('Áo Sơ Mi', self.shirts, 'Trắng', ['M'], 450000, is_new=True)
+        self.jeans = self.create_product('Quần Jean', self.pants, 'Đỏ', ['L'], 650000, brand=self.brand)
+
+    def create_product(self, name, category, color, sizes, price, **kwargs):
+        product = Product.objects.create(name=name, category=category, **kwargs)
+        variant = ProductVariant.objects.create(product=product, color=color, price=price)
+        for size in sizes:
+            ProductSKU.objects.create(variant=variant, size=size, stock_quantity=5)
+        return product
+
+    def facets(self, **params):
+        response = self.client.get(reverse('product_facets'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    @staticmethod
+    def counts(values, key='value'):
+        return {value[key]: value['count'] for value in values}
+
+    def test_facet_counts(self):
+        """All facets come back together, with price buckets from the summary price range"""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.facets()
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(self.counts(data['category'], 'id'), {self.shirts.id: 2, self.pants.id: 1})
+        self.assertEqual(self.counts(data['brand'], 'id'), {self.brand.id: 2})
+        self.assertEqual(self.counts(data['color']), {'Đỏ': 2, 'Trắng': 1})
+        self.assertEqual(self.counts(data['size']), {'M': 2, 'L': 2})
+        self.assertEqual(self.counts(data['price'], 'key'), {'under-200k': 1, '200k-500k': 1, '500k-1m': 1, 'over-1m': 0})
+        self.assertEqual(data['is_new']['count'], 1)
+
+    def test_disjunctive_counts(self):
+        """A selected facet keeps counting its alternatives; other facets are narrowed"""
+        data = self.facets(color='Đỏ')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self.counts(data['color']), {'Đỏ': 2, 'Trắng': 1})
+        self.assertEqual(self.counts(data['category'], 'id'), {self.shirts.id: 1, self.pants.id: 1})
+
+        data = self.facets(color='Đỏ', category=str(self.shirts.id))
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(self.counts(data['color']), {'Đỏ': 1, 'Trắng': 1})
+        self.assertEqual(self.counts(data['category'], 'id'), {self.shirts.id: 1, self.pants.id: 1})
+        self.assertEqual(self.counts(data['size']), {'M': 1, 'L': 1})
+
+        response = self.client.get(reverse('product_list'), {'color': 'Đỏ', 'size': 'L', 'facets': '1'})
+        self.assertEqual({p['id'] for p in response.data['results']}, {self.tee.id, self.jeans.id})
+        self.assertEqual(response.data['facets']['count'], 2)
+
+    def test_search_narrows_facets(self):
+        """?search= narrows facet counts the same way it narrows the list"""
+        response = self.client.get(reverse('product_list'), {'search': 'Áo', 'facets': '1'})
+        self.assertEqual({p['id'] for p in response.data['results']}, {self.tee.id, self.shirt.id})
+        self.assertEqual(response.data['facets']['count'], 2)
+        self.assertEqual(self.counts(response.data['facets']['category'], 'id'), {self.shirts.id: 2})
+
+        data = self.facets(search='Quần', color='Trắng')
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(self.counts(data['color']), {'Đỏ': 1})
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Áo')
+        self.products = [
+            Product.objects.create(name=f'Áo {index}', category=category, sold_count=index % 3)
+            for index in range(7)
+        ]
+        # Trùng created_at để kiểm tra tie-break theo id
+        Product.objects.update(created_at=timezone.now())
+
+    def walk(self, params):
+        ids, url, params = [], reverse('product_list'), dict(params, pagination='cursor', page_size=3)
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [product['id'] for product in response.data['results']]
+            url, params = response.data['links']['next'], None
+        return ids, response
+
+    def test_walk_forward_and_back(self):
+        """Cursor pages cover every row once in (sort_key, id) order and can step back"""
+        ids, _ = self.walk({})
+        self.assertEqual(ids, sorted(product.id for product in self.products)[::-1])
+
+        ids, last = self.walk({'ordering': 'sold_count'})
+        expected = sorted(self.products, key=lambda product: (product.sold_count, product.id))
+        self.assertEqual(ids, [product.id for product in expected])
+        self.assertIsNone(last.data['count'])
+
+        previous = self.client.get(last.data['links']['previous'])
+        self.assertEqual([product['id'] for product in previous.data['results']], ids[3:6])
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get(reverse('product_list'), {'page': 2, 'page_size': 3})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(response.data['current_page'], 2)
+
+        response = self.client.get(reverse('product_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass12345')
+        category = Category.objects.create(name='Áo')
+        brand = Brand.objects.create(name='Coolmate')
+        for index in range(3):
+            product = Product.objects.create(name=f'Áo {index}', category=category, brand=brand)
+            variant = ProductVariant.objects.create(product=product, color='Đen', price=100000 + index)
+            ProductSKU.objects.create(variant=variant, size='M', stock_quantity=5)
+        Wishlist.objects.create(user=self.user, product=product)
+        Order.objects.create(user=self.user, total_price=100000)
+
+    def get(self, name, params, queries):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(captured), queries)
+        return response.data
+
+    def test_product_fields_and_expand(self):
+        """Only requested fields are serialized and only requested relations are prefetched"""
+        data = self.get('product_list', {'fields': 'id,name,price_range'}, 2)
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'price_range'})
+
+        data = self.get('product_list', {'expand': 'brand'}, 2)
+        product = data['results'][0]
+        self.assertEqual(product['brand']['name'], 'Coolmate')
+        self.assertNotIn('variants', product)
+        self.assertIn('min_price', product)
+
+    def test_card_view_reads_values(self):
+        data = self.get('product_list', {'view': 'card'}, 2)
+        card = data['results'][0]
+        self.assertEqual(card['brand_name'], 'Coolmate')
+        self.assertEqual(card['price_range'], '100,002₫')
+        self.assertNotIn('variants', card)
+
+    def test_order_and_wishlist_fields(self):
+        self.client.force_authenticate(self.user)
+        data = self.get('user_order_list', {'fields': 'id,status'}, 2)
+        self.assertEqual(set(data['results'][0]), {'id', 'status'})
+
+        data = self.get('wishlist', {'fields': 'id,product_name,product_price'}, 1)
+        self.assertEqual(set(data[0]), {'id', 'product_name', 'product_price'})
+        self.assertEqual(len(self.client.get(reverse('wishlist')).data[0]['product']['variants']), 1)
+
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Áo')
+        self.product = Product.objects.create(name='Áo Thun', category=self.category)
+
+    def test_cached_until_catalog_changes(self):
+        """Repeat requests skip the database; any catalog save invalidates"""
+        url = reverse('product_list')
+        first = self.client.get(url, {'page_size': 5, 'is_new': ''})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'is_new': '', 'page_size': 5})
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first.data, second.data)
+
+        Brand.objects.create(name='Coolmate')
+        self.product.name = 'Áo Polo'
+        self.product.save()
+        response = self.client.get(url, {'page_size': 5})
+        self.assertEqual(response.data['results'][0]['name'], 'Áo Polo')
+
+    def test_version_shared_between_workers(self):
+        """Version lives in the shared store: a bump in one worker invalidates the others' locmem caches"""
+        from unittest import mock
+        from django.core.cache import caches
+        from django.core.cache.backends.locmem import LocMemCache
+        from shop.services.catalog_cache_service import CatalogCacheService, VERSION_ALIAS
+        other = caches.create_connection(VERSION_ALIAS)
+        version = CatalogCacheService.bump_version()
+        self.assertEqual(other.get('catalog:version'), version)
+        self.assertGreater(CatalogCacheService.bump_version(), version)
+        self.assertEqual(other.get('catalog:version'), CatalogCacheService.get_version())
+
+        # Worker B có cache response locmem riêng
+        url = reverse('product_detail', args=[self.product.pk])
+        worker_b = LocMemCache('worker-b', {})
+        self.client.get(url)
+        with mock.patch.object(CatalogCacheService, 'cache', return_value=worker_b):
+            self.assertEqual(self.client.get(url).data['name'], 'Áo Thun')
+        self.product.name = 'Áo Polo'
+        self.product.save()  # ghi ở worker A
+        with mock.patch.object(CatalogCacheService, 'cache', return_value=worker_b):
+            self.assertEqual(self.client.get(url).data['name'], 'Áo Polo')
+
+    def test_errors_not_cached(self):
+        url = reverse('product_detail', args=[self.product.pk + 100])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        Product.objects.filter(pk=self.product.pk).update(id=self.product.pk + 100)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_concurrent_misses_coalesced(self):
+        import threading
+        import time
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from shop.services.catalog_cache_service import CatalogCacheService
+
+        CatalogCacheService.bump_version()
+        request = Request(APIRequestFactory().get('/api/brands/', {'x': '1'}))
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['data'], True
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(CatalogCacheService.get_or_build(request, build)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['data']] * 4)
+
+
+class CategoryTreeTest(APITestCase):
+    def setUp(self):
+        self.men = Category.objects.create(name='Nam', display_group='men')
+        self.shirts = Category.objects.create(name='Áo Nam', parent=self.men, display_group='men')
+        self.tees = Category.objects.create(name='Áo Thun Nam', parent=self.shirts, display_group='men')
+        self.women = Category.objects.create(name='Nữ', display_group='women')
+        self.tee = Product.objects.create(name='Áo Thun Basic', category=self.tees)
+        self.shirt = Product.objects.create(name='Áo Sơ Mi', category=self.shirts)
+        self.dress = Product.objects.create(name='Đầm', category=self.women)
+
+    def test_paths_maintained_on_save(self):
+        self.assertEqual(self.tees.path, f'/{self.men.id}/{self.shirts.id}/{self.tees.id}/')
+        self.shirts.parent = self.women
+        self.shirts.save()
+        self.tees.refresh_from_db()
+        self.assertEqual(self.tees.path, f'/{self.women.id}/{self.shirts.id}/{self.tees.id}/')
+        self.assertEqual(self.tees.depth, 2)
+
+        from django.core.exceptions import ValidationError
+        self.women.parent = self.tees
+        with self.assertRaises(ValidationError):
+            self.women.save()
+
+        self.women.refresh_from_db()
+        self.women.delete()
+        self.shirts.refresh_from_db()
+        self.assertEqual(self.shirts.path, f'/{self.shirts.id}/')
+
+    def test_descendant_filter_and_counts(self):
+        response = self.client.get(reverse('product_list'), {'category': self.shirts.id})
+        self.assertEqual({p['id'] for p in response.data['results']}, {self.tee.id, self.shirt.id})
+
+        counts = {c['id']: c['product_count'] for c in self.client.get(reverse('category_list')).data['results']}
+        self.assertEqual(counts[self.men.id], 2)
+        self.assertEqual(counts[self.tees.id], 1)
+
+        tree = self.client.get(reverse('category_tree')).data
+        self.assertEqual([group['display_group'] for group in tree], ['men', 'women'])
+        men = tree[0]['categories'][0]
+        self.assertEqual(men['product_count'], 2)
+        self.assertEqual(men['children'][0]['children'][0]['id'], self.tees.id)
+
+
+class BufferedCounterTest(APITestCase):
+    def setUp(self):
+        from shop.services.counter_service import product_view_counter
+        self.counter = product_view_counter
+        self.counter.flush()
+        category = Category.objects.create(name='Áo')
+        self.products = [Product.objects.create(name=f'Áo {index}', category=category) for index in range(3)]
+
+    def test_views_buffered_and_flushed_in_batches(self):
+        url = reverse('product_detail', args=[self.products[0].pk])
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.products[1].increment_view_count()
+        self.products[2].increment_view_count()
+
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).view_count, 0)
+        self.assertEqual(self.counter.pending(self.products[0].pk), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.counter.flush(), 3)
+        # Một UPDATE cho mỗi mức tăng (+3 và +1), không SELECT
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('view_count', flat=True)), [3, 1, 1]
+        )
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_increment_never_flushes_in_request(self):
+        from unittest import mock
+        from shop.services import counter_service
+        self.addCleanup(self.counter.reset)
+        with mock.patch.object(self.counter, 'max_pending', 2), \
+                mock.patch.object(counter_service, '_ensure_flusher') as ensure_flusher:
+            with CaptureQueriesContext(connection) as queries:
+                for product in self.products:
+                    product.increment_view_count()
+            self.assertEqual(len(queries), 0)
+            self.assertTrue(counter_service._wake.is_set())  # đánh thức thread nền
+            self.assertTrue(self.counter.due())
+        ensure_flusher.assert_called()
+        counter_service._wake.clear()
+        self.counter.reset()
+        self.assertEqual(self.counter.pending(self.products[0].pk), 0)
+        self.assertFalse(self.counter.due())
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass12345')
+        category = Category.objects.create(name='Áo')
+        self.product = Product.objects.create(name='Áo Thun', category=category)
+        variant = ProductVariant.objects.create(product=self.product, color='Đen', price=100000)
+        self.sku = ProductSKU.objects.create(variant=variant, size='M', stock_quantity=5)
+
+    def assert_not_modified(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+    def test_catalog_etag(self):
+        url = reverse('product_detail', args=[self.product.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assert_not_modified(url, etag)
+
+        self.product.name = 'Áo Polo'
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_consistent_across_workers(self):
+        """Every worker derives the same ETag from the shared versions and drops it after any write"""
+        from unittest import mock
+        from django.core.cache.backends.locmem import LocMemCache
+        from shop.services.catalog_cache_service import CatalogCacheService
+
+        def worker_b():
+            return mock.patch.object(CatalogCacheService, 'cache', return_value=LocMemCache('worker-b', {}))
+
+        url = reverse('product_detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        with worker_b():
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+            self.assert_not_modified(url, etag)
+        self.product.name = 'Áo Polo'
+        self.product.save()  # worker A ghi
+        with worker_b():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['name'], 'Áo Polo')
+
+        self.client.force_authenticate(self.user)
+        url = reverse('cart')
+        etag = self.client.get(url)['ETag']
+        CartItem.objects.create(cart=Cart.objects.get(user=self.user), product_sku=self.sku, quantity=1)
+        with worker_b():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_cart_etag(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('cart')
+        etag = self.client.get(url)['ETag']
+        self.assert_not_modified(url, etag)
+
+        cart = Cart.objects.get(user=self.user)
+        CartItem.objects.create(cart=cart, product_sku=self.sku, quantity=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['items']), 1)
+
+
+class CodeAllocatorTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Áo')
+        Product.objects.create(name='Áo Thun', category=self.category)
+        Product.objects.create(name='Áo Thun', category=self.category)
+
+    def test_batch_slugs_with_in_memory_suffixes(self):
+        from shop.services.code_allocator_service import CodeAllocatorService
+        products = [Product(name=name, category=self.category) for name in ('Áo Thun', 'Áo Thun', 'Quần Jean')]
+        # Mã khác chỉ trùng tiền tố không được kéo về
+        Product.objects.create(name='Áo Thun Dài Tay', category=self.category)
+        with CaptureQueriesContext(connection) as queries:
+            CodeAllocatorService.assign(products)
+        # IN theo index cho mọi gốc, rồi một query khoảng base-<số> cho gốc đã bị chiếm
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('LIKE', queries[1]['sql'])
+        self.assertEqual(CodeAllocatorService._taken(Product, 'slug', ['ao-thun']), {'ao-thun', 'ao-thun-1'})
+        self.assertEqual([product.slug for product in products], ['ao-thun-2', 'ao-thun-3', 'quan-jean'])
+
+        CodeAllocatorService.bulk_create(Product, products)
+        self.assertEqual(Product.objects.filter(slug__startswith='ao-thun').count(), 5)
+
+    def test_bulk_create_skus_and_retry_on_conflict(self):
+        from unittest import mock
+        from shop.services.code_allocator_service import CodeAllocatorService
+        product = Product.objects.create(name='Áo Polo', sku='POLO', category=self.category)
+        variant = ProductVariant.objects.create(product=product, color='Đen', price=100000)
+        ProductSKU.objects.create(variant=variant, size='M')
+        other = ProductVariant.objects.create(product=product, color='Trắng', price=100000)
+        # Writer khác đã chiếm mã gốc của size L
+        ProductSKU.objects.create(variant=variant, size='S', sku='POLO-TRẮNG-L')
+
+        skus = [ProductSKU(variant=other, size=size) for size in ('M', 'L')]
+        existing = CodeAllocatorService._taken(ProductSKU, 'sku', ['POLO-TRẮNG-M', 'POLO-TRẮNG-L'])
+        # Lần cấp đầu không thấy mã đang có (mô phỏng writer đồng thời), lần sau đọc lại DB
+        with mock.patch.object(CodeAllocatorService, '_taken', side_effect=[set(), existing]) as taken:
+            CodeAllocatorService.bulk_create(ProductSKU, skus)
+        self.assertEqual(taken.call_count, 2)
+        self.assertEqual(
+            sorted(ProductSKU.objects.filter(variant=other).values_list('sku', flat=True)),
+            ['POLO-TRẮNG-L-1', 'POLO-TRẮNG-M']
+        )
+        self.assertEqual(ProductSKU.objects.get(variant=variant, size='M').sku, 'POLO-ĐEN-M')
+
+
+class ProductDetailTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Áo')
+        brand = Brand.objects.create(name='Basic')
+        self.small = self.create_product('Áo Nhỏ', category, brand, colors=2, sizes=('S', 'M'))
+        self.large = self.create_product('Áo Lớn', category, brand, colors=4, sizes=('S', 'M', 'L', 'XL'))
+
+    def create_product(self, name, category, brand, colors, sizes):
+        product = Product.objects.create(name=name, category=category, brand=brand)
+        for index in range(colors):
+            variant = ProductVariant.objects.create(product=product, color=f'Màu {index}', price=100000)
+            for size in sizes:
+                ProductSKU.objects.create(variant=variant, size=size, stock_quantity=5)
+        return product
+
+    def test_constant_queries_by_slug_or_pk(self):
+        from shop.services.counter_service import flush_all
+        counts = []
+        for product in (self.small, self.large):
+            flush_all()  # lượt xem của test trước không được tính vào request này
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('product_detail_slug', args=[product.slug]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['id'], product.pk)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        flush_all()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product_detail', args=[self.large.pk]))
+        self.assertEqual(len(queries), counts[0])
+        self.assertEqual(response.data['slug'], self.large.slug)
+        self.assertEqual(len(response.data['variants']), 4)
+        response = self.client.get(reverse('product_detail_slug', args=['khong-co']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reserved_slugs(self):
+        category = Category.objects.create(name='Quần')
+        facets = Product.objects.create(name='Facets', category=category)
+        year = Product.objects.create(name='2024', category=category)
+        self.assertEqual((facets.slug, year.slug), ('facets-1', '2024-1'))
+        self.assertEqual(Product.objects.create(name='Facets', category=category).slug, 'facets-2')
+        response = self.client.get(reverse('product_detail_slug', args=[year.slug]))
+        self.assertEqual(response.data['id'], year.pk)
+
+    def test_only_active_variants_and_skus(self):
+        variant = self.small.variants.order_by('color').first()
+        variant.skus.filter(size='S').update(is_active=False)
+        ProductVariant.objects.filter(pk=self.small.variants.order_by('color').last().pk).update(is_active=False)
+
+        response = self.client.get(reverse('product_detail_slug', args=[self.small.slug]))
+        self.assertEqual([item['color'] for item in response.data['variants']], ['Màu 0'])
+        self.assertEqual([sku['size'] for sku in response.data['variants'][0]['skus']], ['M'])
+
+
+class BoughtTogetherTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass12345')
+        category = Category.objects.create(name='Áo')
+        self.products = {}
+        self.skus = {}
+        for name in 'ABCD':
+            product = Product.objects.create(name=f'Sản phẩm {name}', category=category)
+            variant = ProductVariant.objects.create(product=product, color='Đen', price=100000)
+            self.products[name] = product
+            self.skus[name] = ProductSKU.objects.create(variant=variant, size='M', stock_quantity=100)
+
+    def create_order(self, names, status='delivered', payment_status='pending'):
+        order = Order.objects.create(user=self.user, total_price=0, status=status, payment_status=payment_status)
+        for name in names:
+            OrderItem.objects.create(order=order, product_sku=self.skus[name], quantity=1, price_per_item=100000)
+        return order
+
+    def neighbours(self, name):
+        return [
+            (row.related_product.name[-1], round(row.lift, 2))
+            for row in ProductBoughtTogether.objects.filter(product=self.products[name]).order_by('rank')
+        ]
+
+    def test_lift_top_k_and_incremental_update(self):
+        from shop.services.co_purchase_service import CoPurchaseService
+        self.create_order('AB')
+        self.create_order('AB')
+        self.create_order('AC')
+        self.create_order('CD', status='processing', payment_status='paid')
+        self.create_order('CD', status='processing', payment_status='paid')
+        for _ in range(3):
+            self.create_order('AD', status='pending')  # Chưa giao, chưa thanh toán - bỏ qua
+
+        CoPurchaseService.update()
+        # N = 5; A/C có trong 3 đơn, B/D trong 2 đơn; cặp A-C chỉ có 1 đơn (< MIN_SUPPORT)
+        self.assertEqual(self.neighbours('A'), [('B', 1.67)])
+        self.assertEqual(self.neighbours('C'), [('D', 1.67)])
+
+        # Chỉ cộng thêm đơn mới; D được tính lại vì C (láng giềng của D) thay đổi
+        self.create_order('AC', payment_status='paid')
+        self.create_order('AC', payment_status='paid')
+        self.assertEqual(CoPurchaseService.update()[0], 4)
+        self.assertEqual(self.neighbours('A'), [('B', 1.4), ('C', 0.84)])
+        self.assertEqual(self.neighbours('D'), [('C', 1.4)])
+        self.assertEqual(CoPurchaseService.update(), (0, 0))
+
+        url = reverse('product_bought_together', args=[self.products['A'].pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            [item['id'] for item in response.data], [self.products['B'].pk, self.products['C'].pk]
+        )
+
+
+class RecommendationTest(APITestCase):
+    def setUp(self):
+        men = Category.objects.create(name='Nam', display_group='men')
+        women = Category.objects.create(name='Nữ', display_group='women')
+        shirts = Category.objects.create(name='Áo Nam', parent=men)
+        self.products = {
+            'A': Product.objects.create(name='A', category=shirts, sold_count=50),
+            'B': Product.objects.create(name='B', category=men, sold_count=10),
+            'C': Product.objects.create(name='C', category=women, sold_count=5),
+            'D': Product.objects.create(name='D', category=women, sold_count=30),
+        }
+        self.users = [User.objects.create_user(username=f'user{index}', password='pass12345') for index in range(4)]
+        for user, names in zip(self.users, ('AB', 'ABC', 'A')):
+            for name in names:
+                Wishlist.objects.create(user=user, product=self.products[name])
+
+    def ids(self, names):
+        return [self.products[name].pk for name in names]
+
+    def test_item_item_recommendations_and_cold_start(self):
+        from shop.services.recommendation_service import RecommendationService
+        self.assertEqual(RecommendationService.rebuild(chunk_size=2), (2, 3))
+
+        url = reverse('recommendations_for_you')
+        self.client.force_authenticate(user=self.users[2])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['source'], 'personalized')
+        self.assertEqual([item['id'] for item in response.data['results']], self.ids('BC'))
+
+        self.client.force_authenticate(user=self.users[0])
+        self.assertEqual([item['id'] for item in self.client.get(url).data['results']], self.ids('C'))
+
+        # User chưa có gợi ý: bán chạy xen kẽ các nhóm, hoặc của một nhóm
+        self.client.force_authenticate(user=self.users[3])
+        response = self.client.get(url)
+        self.assertEqual(response.data['source'], 'best_sellers')
+        self.assertEqual([item['id'] for item in response.data['results']], self.ids('ADBC'))
+        response = self.client.get(url, {'display_group': 'women'})
+        self.assertEqual([item['id'] for item in response.data['results']], self.ids('DC'))
+
+
+class SearchSuggestionTest(APITestCase):
+    def setUp(self):
+        from shop.services.suggestion_service import suggestion_index
+        self.index = suggestion_index
+        self.index.load()
+        self.addCleanup(self.index._reset)
+        self.category = Category.objects.create(name='Áo Thun')
+        self.brand = Brand.objects.create(name='Đông Hải')
+        self.basic = Product.objects.create(
+            name='Áo Thun Nam Basic', category=self.category, brand=self.brand, sold_count=5, tags=['cotton']
+        )
+        self.polo = Product.objects.create(
+            name='Áo Thun Polo', category=self.category, sold_count=50, view_count=200, tags=['Cotton', 'form rộng']
+        )
+
+    def test_weighted_prefix_suggestions(self):
+        response = self.client.get(reverse('search_suggestions'), {'q': 'ao th'})
+        self.assertEqual(
+            [(item['type'], item['text']) for item in response.data],
+            [('category', 'Áo Thun'), ('product', 'Áo Thun Polo'), ('product', 'Áo Thun Nam Basic')]
+        )
+        self.assertEqual(response.data[1]['slug'], self.polo.slug)
+        # Khớp từ giữa tên, không dấu; tag phổ biến (>= 2 sản phẩm) mới được gợi ý
+        self.assertEqual([item['text'] for item in self.index.suggest('nam')], ['Áo Thun Nam Basic'])
+        self.assertEqual([item['text'] for item in self.index.suggest('dong')], ['Đông Hải'])
+        self.assertEqual([item['type'] for item in self.index.suggest('cott')], ['tag'])
+        self.assertEqual(self.index.suggest('form'), [])
+
+    def test_incremental_refresh(self):
+        self.assertEqual(self.index.suggest('p')[0]['text'], 'Áo Thun Polo')
+        Product.objects.filter(pk=self.polo.pk).update(name='Quần Polo', tags=[], updated_at=timezone.now())
+        self.index.refresh()
+        self.assertEqual([item['text'] for item in self.index.suggest('qu')], ['Quần Polo'])
+        self.assertEqual([item['type'] for item in self.index.suggest('cotton')], [])
+
+        self.basic.delete()
+        self.assertEqual(self.index.suggest('dong'), [])
+        self.assertEqual(self.index.suggest('ao thun nam'), [])
+
+    def test_full_reload_off_request_path(self):
+        from unittest import mock
+        keys = list(self.index.keys)
+        self.index.load()
+        self.assertEqual(self.index.keys, keys)
+        self.assertEqual(self.index.keys, sorted(self.index.keys))
+
+        # Hết RELOAD_INTERVAL: request không tự nạp lại, chỉ khởi động một thread nền
+        self.index.last_load -= self.index.RELOAD_INTERVAL + 1
+        self.addCleanup(setattr, self.index, '_reloading', False)
+        with mock.patch.object(self.index, 'load') as load, \
+                mock.patch('shop.services.suggestion_service.threading.Thread') as thread:
+            self.assertEqual(self.index.suggest('polo')[0]['text'], 'Áo Thun Polo')
+            self.index.suggest('basic')
+        load.assert_not_called()
+        thread.assert_called_once()
+
+
+class HomePageTest(APITestCase):
+    def setUp(self):
+        men = Category.objects.create(name='Nam', display_group='men')
+        women = Category.objects.create(name='Nữ', display_group='women')
+        Category.objects.create(name='Áo Nam', parent=men)
+        self.products = [
+            Product.objects.create(
+                name=f'Sản phẩm {index}', category=men if index % 2 else women,
+                sold_count=index * 10, is_featured=index < 3, is_new=index >= 3,
+            )
+            for index in range(6)
+        ]
+
+    def test_sections_in_bounded_queries_and_cached(self):
+        url = reverse('home')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # featured, new, best_sellers, danh mục gốc + 2 display_group, card, cây danh mục (2)
+        self.assertEqual(len(queries), 9)
+        ids = [product.pk for product in self.products]
+        self.assertEqual([item['id'] for item in response.data['best_sellers']], ids[::-1])
+        self.assertEqual([item['id'] for item in response.data['featured']], [ids[2], ids[1], ids[0]])
+        self.assertEqual([item['id'] for item in response.data['new']], [ids[5], ids[4], ids[3]])
+        self.assertEqual(
+            [(group['display_group'], [item['id'] for item in group['products']]) for group in response.data['groups']],
+            [('men', [ids[5], ids[3], ids[1]]), ('women', [ids[4], ids[2], ids[0]])]
+        )
+        self.assertEqual([group['display_group'] for group in response.data['categories']], ['men', 'women'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).data, response.data)
+        self.assertEqual(len(queries), 0)
+
+        self.products[0].sold_count = 100
+        self.products[0].save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['best_sellers'][0]['id'], ids[0])
+
+
+class MediaTestMixin:
+    """MEDIA_ROOT tạm và ảnh upload mẫu"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Áo')
+        self.product = Product.objects.create(name='Áo Thun', category=category)
+        self.variant = ProductVariant.objects.create(product=self.product, color='Đen', price=100000)
+
+    def upload(self, size=(2000, 1000), mode='RGBA'):
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 10, 10, 128) if mode == 'RGBA' else (200, 10, 10)).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+
+class ImageRenditionTest(MediaTestMixin, APITestCase):
+    def test_renditions_scheduled_and_exposed(self):
+        from django.core.files.storage import default_storage
+        from shop.services.image_rendition_service import ImageRenditionService
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = ProductVariantImage.objects.create(variant=self.variant, image=self.upload(), is_primary=True)
+        # Chạy nền sau commit, không chạy trong request
+        self.assertTrue(callbacks)
+        self.assertEqual(ProductVariantImage.objects.get(pk=image.pk).renditions, {})
+
+        self.assertTrue(ImageRenditionService.generate(image.pk))
+        image.refresh_from_db()
+        self.assertEqual(
+            [(name, data['width'], data['height']) for name, data in image.renditions.items()],
+            [('thumbnail', 160, 80), ('card', 480, 240), ('detail', 960, 480), ('zoom', 1600, 800)]
+        )
+        self.assertTrue(all(
+            default_storage.exists(data[fmt]) for data in image.renditions.values() for fmt in ('webp', 'jpeg')
+        ))
+        self.assertTrue(ImageRenditionService.is_current(image))
+
+        response = self.client.get(reverse('product_detail', args=[self.product.pk]))
+        rendition = response.data['variants'][0]['images'][0]['renditions']['card']
+        self.assertTrue(rendition['webp'].startswith('http://testserver/media/'))
+        self.assertTrue(rendition['jpeg'].endswith('/card.jpg'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(default_storage.exists(rendition['webp'].split('/media/')[1]))
+
+    def test_backfill_command(self):
+        images = []
+        for index in range(3):
+            with self.captureOnCommitCallbacks():
+                images.append(ProductVariantImage.objects.create(variant=self.variant, image=self.upload((300, 200), 'RGB'), order=index))
+
+        out = StringIO()
+        # --workers 1: chạy ngay trên thread hiện tại (thấy được dữ liệu của transaction test)
+        call_command('generate_image_renditions', '--workers', '1', stdout=out)
+        self.assertIn('3 ảnh', out.getvalue())
+        self.assertFalse(ProductVariantImage.objects.filter(renditions={}).exists())
+        # Ảnh nhỏ hơn kích thước rendition không bị phóng to
+        self.assertEqual(ProductVariantImage.objects.get(pk=images[0].pk).renditions['zoom']['width'], 300)
+
+
+class ContentAddressedMediaTest(MediaTestMixin, APITestCase):
+    """Ảnh đặt tên theo nội dung, dùng chung file và đếm tham chiếu"""
+
+    def create(self, variant=None):
+        with self.captureOnCommitCallbacks():
+            return ProductVariantImage.objects.create(variant=variant or self.variant, image=self.upload((300, 200), 'RGB'))
+
+    def test_identical_uploads_share_blob(self):
+        from django.core.files.storage import default_storage
+        from shop.models import MediaBlob
+        other = ProductVariant.objects.create(product=self.product, color='Trắng', price=100000)
+        first, second = self.create(), self.create(other)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_renditions_deleted_with_last_reference(self):
+        from django.core.files.storage import default_storage
+        from shop.services.image_rendition_service import ImageRenditionService
+        first = self.create()
+        ImageRenditionService.generate(first.pk)
+        # Upload trùng nội dung dùng lại ảnh thu nhỏ đã có, không tạo lại
+        from unittest import mock
+        with mock.patch.object(ImageRenditionService, 'schedule') as schedule:
+            second = self.create()
+        schedule.assert_not_called()
+        first.refresh_from_db()
+        self.assertEqual(second.renditions, first.renditions)
+
+        path = first.renditions['card']['webp']
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(path))
+
+    def test_replacing_image_releases_old_blob(self):
+        from django.core.files.storage import default_storage
+        image = self.create()
+        old_name = image.image.name
+        image.image = self.upload((400, 200), 'RGB')
+        with self.captureOnCommitCallbacks(execute=False):
+            image.save()
+        self.assertNotEqual(image.image.name, old_name)
+        # File cũ chỉ bị xóa sau khi transaction commit
+        self.assertTrue(default_storage.exists(old_name))
+
+    def test_blob_served_with_immutable_cache_header(self):
+        from django.conf import settings
+        from shop.storage import IMMUTABLE_CACHE_CONTROL, serve_media
+        from django.test import RequestFactory
+        image = self.create()
+        request = RequestFactory().get('/media/' + image.image.name)
+        response = serve_media(request, image.image.name, document_root=settings.MEDIA_ROOT)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+
+class StockAvailabilityTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Áo')
+        product = Product.objects.create(name='Áo Thun', category=category)
+        variant = ProductVariant.objects.create(product=product, color='Đen', price=100000)
+        self.skus = [
+            ProductSKU.objects.create(variant=variant, size=size, stock_quantity=stock, reserved_quantity=reserved)
+            for size, stock, reserved in (('S', 20, 5), ('M', 3, 0), ('L', 1, 4))
+        ]
+        self.url = reverse('stock_availability')
+
+    def test_batch_lookup_cached(self):
+        ids = ','.join(str(sku.pk) for sku in self.skus) + ',999999'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'sku_ids': ids})
+        self.assertEqual(len(queries), 1)
+        results = response.data['results']
+        self.assertEqual(results[self.skus[0].pk], {
+            'available_quantity': 15, 'stock_quantity': 20, 'reserved_quantity': 5,
+            'is_low_stock': False, 'is_active': True,
+        })
+        self.assertTrue(results[self.skus[1].pk]['is_low_stock'])
+        self.assertEqual(results[self.skus[2].pk]['available_quantity'], 0)
+        self.assertEqual(response.data['missing'], [999999])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'sku_ids': ids})
+        self.assertEqual(len(queries), 1)  # chỉ SKU không tồn tại
+
+        # Lưu SKU xóa cache của nó
+        self.skus[0].reserved_quantity = 0
+        self.skus[0].save()
+        response = self.client.post(self.url, {'sku_ids': [self.skus[0].pk]}, format='json')
+        self.assertEqual(response.data['results'][self.skus[0].pk]['available_quantity'], 20)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get(self.url, {'sku_ids': '1,abc'}).status_code, 400)
+        response = self.client.post(self.url, {'sku_ids': list(range(6000))}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogImportTest(APITestCase):
+    CSV = (
+        "product_sku,name,category,brand,tags,color,price,discount_price,size,stock_quantity\n"
+        "SUP-1,Áo Thun Basic,Áo,Coolmate,cotton|basic,Đen,150000,,S,10\n"
+        "SUP-1,,,,,Đen,,,M,0\n"
+        "SUP-1,,,,,Trắng,160000,140000,M,7\n"
+        "SUP-2,Quần Jean,Không có,,,Xanh,300000,,32,5\n"
+        "SUP-3,Quần Short,Áo,,,Xám,abc,,L,1\n"
+        "SUP-4,,,,,Đen,100000,,L,1\n"
+    )
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Áo')
+
+    def import_csv(self, content, *args):
+        import os
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(content)
+        out = StringIO()
+        call_command('import_catalog', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_import_and_upsert(self):
+        output = self.import_csv(self.CSV, '--chunk-size', '2')
+        self.assertIn('Đã nhập 3 SKU', output)
+        self.assertIn('Dòng 5: Danh mục', output)
+        self.assertIn('Dòng 6: price không phải là số', output)
+        self.assertIn('Dòng 7: Sản phẩm mới cần name và category', output)
+
+        product = Product.objects.get(sku='SUP-1')
+        self.assertEqual(product.brand.name, 'Coolmate')
+        self.assertEqual(product.tags, ['cotton', 'basic'])
+        self.assertTrue(product.slug)
+        self.assertEqual(product.available_stock, 17)
+        self.assertEqual(product.min_price, 140000)
+        self.assertEqual(
+            sorted(ProductSKU.objects.filter(variant__product=product).values_list('variant__color', 'size', 'stock_quantity')),
+            [('Trắng', 'M', 7), ('Đen', 'M', 0), ('Đen', 'S', 10)]
+        )
+        self.assertTrue(ProductSKU.objects.get(variant__color='Đen', size='S').sku.startswith('SUP-1-'))
+
+        # Nhập lại: cập nhật tại chỗ, ô trống giữ nguyên
+        output = self.import_csv(
+            "product_sku,name,color,price,size,stock_quantity\n"
+            "SUP-1,Áo Thun Basic 2,Đen,155000,S,12\n"
+        )
+        self.assertIn('sản phẩm +0 / ~1', output)
+        product.refresh_from_db()
+        self.assertEqual(product.name, 'Áo Thun Basic 2')
+        self.assertEqual(product.tags, ['cotton', 'basic'])
+        self.assertEqual(ProductSKU.objects.filter(variant__product=product).count(), 3)
+        self.assertEqual(ProductSKU.objects.get(variant__color='Đen', size='S').stock_quantity, 12)
+        from shop.models import StockHistory
+        history = StockHistory.objects.filter(product_sku__size='S').order_by('id')
+        self.assertEqual(
+            [(h.transaction_type, h.quantity_before, h.quantity_after) for h in history],
+            [('import', 0, 10), ('adjustment', 10, 12)]
+        )
+
+    def test_reimport_writes_only_supplied_sku_columns(self):
+        from .models import StockHistory
+        self.import_csv(self.CSV)
+        with CaptureQueriesContext(connection) as queries:
+            self.import_csv(
+                "product_sku,color,size,minimum_stock\n"
+                "SUP-1,Đen,S,2\n"
+            )
+        # Dòng không có stock_quantity: UPDATE SKU không ghi cột tồn kho (không ghi đè số bán đồng thời)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shop_productsku"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"minimum_stock"', updates[0])
+        self.assertNotIn('"stock_quantity" =', updates[0])
+        sku = ProductSKU.objects.get(variant__color='Đen', size='S')
+        self.assertEqual((sku.minimum_stock, sku.stock_quantity), (2, 10))
+        self.assertFalse(StockHistory.objects.filter(product_sku=sku, transaction_type='adjustment').exists())
+
+    def test_explicit_sku_conflicts_rejected_per_row(self):
+        self.import_csv(self.CSV)
+        taken = ProductSKU.objects.get(variant__color='Đen', size='S').sku
+        output = self.import_csv(
+            "product_sku,name,category,color,price,size,sku,stock_quantity\n"
+            "SUP-5,Áo Polo,Áo,Đen,200000,M,POLO-M,2\n"
+            f"SUP-5,,,Đen,,S,{taken},1\n"
+            "SUP-5,,,Đen,,L,POLO-M,3\n"
+            "SUP-5,,,Đen,,XL,,4\n"
+            f"SUP-1,,,Đen,,S,{taken},10\n"
+        )
+        self.assertIn('Đã nhập 3 SKU', output)
+        self.assertIn(f"Dòng 3: Mã SKU '{taken}' đã thuộc SKU khác", output)
+        self.assertIn("Dòng 4: Mã SKU 'POLO-M' bị lặp trong file", output)
+        self.assertEqual(
+            sorted(ProductSKU.objects.filter(variant__product__sku='SUP-5').values_list('size', 'stock_quantity')),
+            [('M', 2), ('XL', 4)]
+        )
+        self.assertEqual(ProductSKU.objects.get(sku='POLO-M').size, 'M')
+        from .models import StockAlert
+        self.assertEqual(
+            sorted(StockAlert.objects.filter(is_resolved=False, product_sku__variant__product__sku='SUP-5')
+                   .values_list('product_sku__size', 'alert_type')),
+            [('M', 'low_stock'), ('XL', 'low_stock')]
+        )
+
+    def test_admin_ndjson_upload(self):
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        admin = User.objects.create_user(username='admin', password='x', is_admin=True)
+        self.client.force_authenticate(admin)
+        lines = [
+            json.dumps({
+                'sku': 'SUP-9', 'name': 'Váy Hoa', 'category': self.category.pk, 'tags': ['hè'],
+                'variants': [{'color': 'Đỏ', 'price': 250000, 'sizes': [
+                    {'size': 'S', 'stock_quantity': 3}, {'name': 'M', 'stock_quantity': 4},
+                ]}],
+            }),
+            '{không phải json',
+        ]
+        upload = SimpleUploadedFile('catalog.ndjson', '\n'.join(lines).encode('utf-8'))
+        response = self.client.post(reverse('admin_catalog_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['skus_created'], 2)
+        self.assertEqual(response.data['errors'][0]['line'], 2)
+        self.assertEqual(Product.objects.get(sku='SUP-9').available_stock, 7)
+        # Đã vào index tìm kiếm
+        response = self.client.get(reverse('product_list'), {'q': 'vay hoa'})
+        self.assertEqual([product['id'] for product in response.data['results']], [Product.objects.get(sku='SUP-9').pk])
+
+        from unittest import mock
+        with mock.patch('shop.services.catalog_import_service.MAX_UPLOAD_SIZE', 10):
+            upload = SimpleUploadedFile('catalog.ndjson', lines[0].encode('utf-8'))
+            response = self.client.post(reverse('admin_catalog_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+
+        self.client.force_authenticate(User.objects.create_user(username='khach', password='x'))
+        upload = SimpleUploadedFile('catalog.ndjson', lines[0].encode('utf-8'))
+        response = self.client.post(reverse('admin_catalog_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+
+class AdminProductUpdateTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', is_admin=True)
+        self.client.force_authenticate(self.admin)
+        self.category = Category.objects.create(name='Áo')
+        self.product = Product.objects.create(name='Áo Thun', sku='TEE', category=self.category)
+        for index in range(10):
+            variant = ProductVariant.objects.create(product=self.product, color=f'Màu {index:02d}', price=100000)
+            for size in ('XS', 'S', 'M', 'L', 'XL', 'XXL', '3XL', '4XL'):
+                ProductSKU.objects.create(variant=variant, size=size, stock_quantity=5)
+        self.url = reverse('admin_product_detail', args=[self.product.pk])
+
+    def payload(self):
+        variants = []
+        for variant in self.product.variants.prefetch_related('skus'):
+            variants.append({
+                'id': variant.pk, 'color': variant.color, 'price': str(variant.price), 'is_active': True,
+                'sizes': [
+                    {'id': sku.pk, 'name': sku.size, 'stock_quantity': sku.stock_quantity,
+                     'minimum_stock': sku.minimum_stock, 'reorder_point': sku.reorder_point, 'cost_price': str(sku.cost_price)}
+                    for sku in variant.skus.all()
+                ],
+            })
+        return variants
+
+    def test_diff_apply_with_constant_queries(self):
+        variants = self.payload()
+        variants[0]['price'] = '120000'
+        variants[1]['sizes'][0]['stock_quantity'] = 9
+        removed_sku = variants[2]['sizes'].pop()['id']
+        variants[3]['sizes'].append({'name': '5XL', 'stock_quantity': 2})
+        removed_variant = variants.pop(4)['id']
+        variants.append({'color': 'Mới', 'price': 90000, 'sizes': [{'name': 'M', 'stock_quantity': 4}]})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'name': 'Áo Thun Mới', 'variants': variants}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        # xóa variant/SKU kéo theo một DELETE stock_snapshots mỗi lần; đồng bộ cảnh báo tồn kho: 3 query;
+        # tồn kho sửa qua delta: khóa/UPDATE/đọc lại + lịch sử + cảnh báo của SKU đã điều chỉnh
+        self.assertLess(len(queries), 52)
+
+        self.assertEqual(ProductVariant.objects.filter(product=self.product).count(), 10)
+        self.assertFalse(ProductVariant.objects.filter(pk=removed_variant).exists())
+        self.assertFalse(ProductSKU.objects.filter(pk=removed_sku).exists())
+        self.assertEqual(ProductVariant.objects.get(pk=variants[0]['id']).price, 120000)
+        self.assertEqual(ProductSKU.objects.get(pk=variants[1]['sizes'][0]['id']).stock_quantity, 9)
+        new_sku = ProductSKU.objects.get(variant__product=self.product, variant__color='Mới')
+        self.assertTrue(new_sku.sku.startswith('TEE-'))
+        # Cảnh báo tồn kho đồng bộ theo SKU đã sửa / tạo
+        from .models import StockAlert
+        open_alerts = StockAlert.objects.filter(is_resolved=False)
+        self.assertEqual(
+            list(open_alerts.filter(product_sku_id=variants[1]['sizes'][0]['id']).values_list('alert_type', flat=True)),
+            ['reorder_needed']
+        )
+        self.assertEqual(list(open_alerts.filter(product_sku=new_sku).values_list('alert_type', flat=True)), ['low_stock'])
+        # Tồn kho đổi qua admin có trong sổ kho (snapshot / tồn kho theo thời điểm dựa trên sổ kho)
+        from .models import StockHistory
+        self.assertEqual(
+            sorted(StockHistory.objects.filter(product_sku__variant__product=self.product).values_list(
+                'transaction_type', 'quantity_before', 'quantity_after', 'created_by'
+            )),
+            [('adjustment', 5, 9, self.admin.pk), ('import', 0, 2, self.admin.pk), ('import', 0, 4, self.admin.pk)]
+        )
+
+        # Response từ cây trong bộ nhớ khớp với DB
+        self.product.refresh_from_db()
+        self.assertEqual(response.data['name'], 'Áo Thun Mới')
+        self.assertEqual(response.data['available_stock'], self.product.available_stock)
+        self.assertEqual(
+            [(v['color'], len(v['skus'])) for v in response.data['variants']],
+            [(v.color, v.skus.count()) for v in self.product.variants.all()]
+        )
+
+        # Gửi lại đúng dữ liệu hiện tại: không ghi gì ngoài sản phẩm
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(self.url, {'variants': self.payload()}, format='json')
+        self.assertFalse([
+            q for q in queries
+            if q['sql'].startswith(('UPDATE', 'DELETE', 'INSERT')) and ('shop_productsku' in q['sql'] or 'shop_productvariant' in q['sql'])
+            and not q['sql'].startswith('UPDATE "shop_product" ')
+        ])
+
+    def test_concurrent_sale_is_not_overwritten(self):
+        from .models import StockHistory
+        from .services import StockService
+        from .services.product_write_service import ProductWriteService, tree_queryset
+        # Admin nạp form khi tồn kho là 5; trong lúc đó hai SKU mỗi SKU bán 2
+        variants = self.payload()
+        product = tree_queryset().get(pk=self.product.pk)
+        edited, threshold_only = variants[0]['sizes'][0], variants[0]['sizes'][1]
+        edited['stock_quantity'] = 7
+        threshold_only['minimum_stock'] = 1
+        for size in (edited, threshold_only):
+            StockService.export_stock(ProductSKU.objects.get(pk=size['id']), 2)
+
+        ProductWriteService.apply(product, variants_data=variants, user=self.admin)
+
+        # Phần admin sửa (+2) cộng vào giá trị hiện tại, SKU chỉ đổi ngưỡng giữ số đã bán
+        self.assertEqual(ProductSKU.objects.get(pk=edited['id']).stock_quantity, 5)
+        sku = ProductSKU.objects.get(pk=threshold_only['id'])
+        self.assertEqual((sku.stock_quantity, sku.minimum_stock), (3, 1))
+        self.assertEqual(
+            list(StockHistory.objects.filter(product_sku_id=edited['id']).order_by('id').values_list(
+                'transaction_type', 'quantity_before', 'quantity_after'
+            )),
+            [('export', 5, 3), ('adjustment', 3, 5)]
+        )
+        self.assertFalse(StockHistory.objects.filter(product_sku=sku, transaction_type='adjustment').exists())
+
+    def test_form_data_vouchers_and_invalid_json(self):
+        import json
+        response = self.client.patch(self.url, {
+            'vouchers': json.dumps([{
+                'code': 'TEE10', 'name': 'Giảm 10%', 'discount_value': 10,
+                'valid_from': '2026-01-01T00:00:00Z', 'valid_to': '2026-12-31T00:00:00Z',
+            }]),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([v['code'] for v in response.data['vouchers']], ['TEE10'])
+        self.assertEqual(ProductVariant.objects.filter(product=self.product).count(), 10)
+
+        response = self.client.patch(self.url, {'name': 'Đổi tên', 'variants': '[{'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Áo Thun')
+
+
+class AtomicStockTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Áo')
+        self.product = Product.objects.create(name='Áo Thun', category=category)
+        variant = ProductVariant.objects.create(product=self.product, color='Đen', price=100000)
+        self.sku = ProductSKU.objects.create(variant=variant, size='M', stock_quantity=2, reserved_quantity=1)
+
+    def test_stale_objects_do_not_oversell(self):
+        from .models import StockHistory
+        from .services import StockService
+        # Hai worker cùng nạp SKU khi còn 1 hàng khả dụng
+        first = ProductSKU.objects.get(pk=self.sku.pk)
+        second = ProductSKU.objects.get(pk=self.sku.pk)
+        StockService.export_stock(first, 1)
+        with self.assertRaises(ValueError):
+            StockService.export_stock(second, 1)
+        self.assertEqual(second.available_quantity, 0)
+
+        # Giá trị trước/sau lấy từ DB, không từ object cũ
+        StockService.return_stock(second, 3)
+        self.assertEqual(
+            list(StockHistory.objects.filter(product_sku=self.sku).order_by('id')
+                 .values_list('transaction_type', 'quantity_before', 'quantity_after')),
+            [('export', 2, 1), ('return', 1, 4)]
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.available_stock, 3)
+
+        with self.assertRaises(ValueError):
+            StockService.mark_damaged(first, 5)
+        StockService.mark_damaged(first, 4)
+        self.sku.refresh_from_db()
+        self.assertEqual((self.sku.stock_quantity, self.sku.reserved_quantity), (0, 1))
+
+    def test_reserve_and_release(self):
+        from .services.stock_availability_service import StockAvailabilityService
+        user = User.objects.create_user(username='buyer', password='pass')
+        cart = Cart.objects.create(user=user)
+        stale = ProductSKU.objects.get(pk=self.sku.pk)
+        item = CartItem.objects.create(cart=cart, product_sku=stale, quantity=1)
+        other = CartItem.objects.create(cart=cart, product_sku=ProductSKU.objects.get(pk=self.sku.pk), quantity=1)
+        StockAvailabilityService.availability([self.sku.pk])  # cache
+
+        self.assertTrue(item.reserve_stock())
+        self.assertFalse(other.reserve_stock())  # object cũ vẫn thấy còn 1 hàng
+        self.assertEqual(
+            StockAvailabilityService.availability([self.sku.pk])[self.sku.pk]['reserved_quantity'], 2
+        )
+
+        item.release_reservation()
+        item.release_reservation()  # đã hủy: không trừ thêm
+        self.sku.refresh_from_db()
+        self.assertEqual(self.sku.reserved_quantity, 1)
+        self.assertFalse(item.is_reserved)
+
+
+class OrderStockExportTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass')
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name='Áo')
+        product = Product.objects.create(name='Áo Thun', category=category)
+        self.skus = []
+        for index in range(20):
+            variant = ProductVariant.objects.create(product=product, color=f'Màu {index}', price=100000)
+            self.skus.append(ProductSKU.objects.create(variant=variant, size='M', stock_quantity=10, minimum_stock=5))
+        self.cart = Cart.objects.create(user=self.user)
+        for sku in self.skus:
+            CartItem.objects.create(cart=self.cart, product_sku=sku, quantity=2)
+
+    def checkout_data(self):
+        return {'shipping_name': 'A', 'shipping_address': 'B', 'shipping_city': 'C', 'phone_number': '0123456789'}
+
+    def test_export_many_is_set_based(self):
+        from .models import StockAlert, StockHistory
+        from .services import StockService
+        order = Order.objects.create(user=self.user, total_price=0)
+        lines = [(sku, 3) for sku in self.skus] + [(self.skus[0], 2)]
+        with CaptureQueriesContext(connection) as queries:
+            StockService.export_stock_many(order, lines)
+        self.assertLessEqual(len(queries), 8)
+
+        self.assertEqual(
+            list(StockHistory.objects.filter(product_sku=self.skus[0]).order_by('id')
+                 .values_list('quantity', 'quantity_before', 'quantity_after')),
+            [(-3, 10, 7), (-2, 7, 5)]
+        )
+        self.assertEqual(ProductSKU.objects.get(pk=self.skus[1].pk).stock_quantity, 7)
+        self.assertEqual(self.skus[0].stock_quantity, 5)
+        self.assertEqual(
+            set(StockAlert.objects.values_list('product_sku_id', 'alert_type')),
+            {(self.skus[0].pk, 'low_stock')} | {(sku.pk, 'reorder_needed') for sku in self.skus[1:]}
+        )
+
+        # Thiếu hàng ở một SKU: không SKU nào bị trừ
+        with self.assertRaises(ValueError):
+            StockService.export_stock_many(order, [(self.skus[1], 1), (self.skus[2], 8)])
+        self.assertEqual(ProductSKU.objects.get(pk=self.skus[1].pk).stock_quantity, 7)
+
+    def test_checkout_exports_once(self):
+        from .models import StockHistory
+        for url in (reverse('create_order_from_cart'), reverse('order_create')):
+            response = self.client.post(url, self.checkout_data())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertFalse(self.cart.items.exists())
+            for sku in self.skus:
+                CartItem.objects.create(cart=self.cart, product_sku=sku, quantity=2)
+        self.assertEqual(StockHistory.objects.filter(transaction_type='export').count(), 40)
+        self.assertEqual(set(ProductSKU.objects.values_list('stock_quantity', flat=True)), {6})
+
+    def test_checkout_out_of_stock(self):
+        ProductSKU.objects.filter(pk=self.skus[5].pk).update(stock_quantity=1)
+        for url in (reverse('create_order_from_cart'), reverse('order_create')):
+            response = self.client.post(url, self.checkout_data())
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 20)
+        self.assertEqual(ProductSKU.objects.get(pk=self.skus[0].pk).stock_quantity, 10)
+
+
+class StockAlertReconcileTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Áo')
+        product = Product.objects.create(name='Áo Thun', category=category)
+        variant = ProductVariant.objects.create(product=product, color='Đen', price=100000)
+        # available: 0, 3, 8, 50 - minimum_stock 5, reorder_point 10
+        self.skus = {
+            size: ProductSKU.objects.create(
+                variant=variant, size=size, stock_quantity=stock, reserved_quantity=reserved,
+                minimum_stock=5, reorder_point=10
+            )
+            for size, stock, reserved in (('S', 2, 4), ('M', 3, 0), ('L', 10, 2), ('XL', 50, 0))
+        }
+
+    def open_alerts(self):
+        from .models import StockAlert
+        return set(StockAlert.objects.filter(is_resolved=False).values_list(
+            'product_sku__size', 'alert_type', 'current_quantity', 'threshold'
+        ))
+
+    def test_refresh_command(self):
+        from .models import StockAlert
+        StockAlert.objects.create(product_sku=self.skus['XL'], alert_type='low_stock', current_quantity=1, threshold=5)
+        StockAlert.objects.create(product_sku=self.skus['S'], alert_type='low_stock', current_quantity=4, threshold=5)
+        StockAlert.objects.create(product_sku=self.skus['M'], alert_type='out_of_stock', current_quantity=0, threshold=0)
+        out = StringIO()
+        call_command('refresh_stock_alerts', stdout=out)
+        self.assertIn('Đã tạo 3 alerts mới, resolve 2, cập nhật 1', out.getvalue())
+        self.assertEqual(self.open_alerts(), {
+            ('S', 'out_of_stock', 0, 0), ('S', 'low_stock', 0, 5),
+            ('M', 'low_stock', 3, 5), ('L', 'reorder_needed', 8, 10),
+        })
+        self.assertEqual(StockAlert.objects.get(product_sku=self.skus['XL']).current_quantity, 50)
+
+        # Chạy lại: không thay đổi gì
+        with CaptureQueriesContext(connection) as queries:
+            from .services.stock_alert_service import StockAlertService
+            self.assertEqual(StockAlertService.reconcile(), {'created': 0, 'resolved': 0, 'updated': 0})
+        self.assertEqual(len(queries), 3)
+
+    def test_stock_changes_reconcile(self):
+        from .services import StockService
+        StockService.export_stock(self.skus['XL'], 46)
+        self.assertEqual(self.open_alerts(), {('XL', 'low_stock', 4, 5)})
+        StockService.import_stock(self.skus['XL'], 3)
+        self.assertEqual(self.open_alerts(), {('XL', 'reorder_needed', 7, 10)})
+        StockService.adjust_stock(self.skus['XL'], 30)
+        self.assertEqual(self.open_alerts(), set())
+
+
+class InventorySnapshotTest(APITestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from .models import StockHistory
+        from .services import StockService
+        from .services.stock_snapshot_service import day_start
+        category = Category.objects.create(name='Áo')
+        product = Product.objects.create(name='Áo Thun', category=category)
+        variant = ProductVariant.objects.create(product=product, color='Đen', price=100000)
+        self.today = timezone.localdate()
+        self.days = [self.today - timedelta(days=n) for n in range(5, -1, -1)]
+        self.sku = ProductSKU.objects.create(variant=variant, size='M', stock_quantity=10, cost_price=1000)
+        ProductSKU.objects.filter(pk=self.sku.pk).update(created_at=day_start(self.days[0]) + timedelta(hours=9))
+
+        # 10 (ngày 0) -> 15 (ngày 2) -> 12 (ngày 3) -> 20 (hôm nay)
+        for day, change in ((self.days[2], 5), (self.days[3], -3), (self.today, 8)):
+            if change > 0:
+                StockService.import_stock(self.sku, change, cost_per_item=1000)
+            else:
+                StockService.export_stock(self.sku, -change)
+            at = min(day_start(day) + timedelta(hours=12), timezone.now())
+            StockHistory.objects.filter(pk=StockHistory.objects.latest('id').pk).update(created_at=at)
+        self.new_sku = ProductSKU.objects.create(variant=variant, size='L', stock_quantity=7, cost_price=2000)
+
+    def test_build_and_lookup(self):
+        from datetime import timedelta
+        from .models import StockSnapshot
+        from .services.stock_snapshot_service import StockSnapshotService, day_start, day_end
+        self.assertEqual(StockSnapshotService.build(until=self.days[2]), 2)
+        self.assertEqual(StockSnapshotService.build(), 1)  # chỉ dựng ngày còn thiếu
+        self.assertEqual(StockSnapshotService.build(), 0)
+        self.assertEqual(list(StockSnapshot.objects.order_by('date').values_list('date', 'quantity', 'quantity_change')), [
+            (self.days[0], 10, 10), (self.days[2], 15, 5), (self.days[3], 12, -3),
+        ])
+
+        for at, quantity in (
+            (day_end(self.days[1]), 10),
+            (day_start(self.days[2]) + timedelta(hours=6), 10),
+            (day_start(self.days[2]) + timedelta(hours=13), 15),
+            (day_end(self.days[4]), 12),
+            (timezone.now(), 20),
+        ):
+            self.assertEqual(StockSnapshotService.quantities_at(at, [self.sku.pk])[self.sku.pk]['quantity'], quantity)
+        self.assertEqual(StockSnapshotService.quantities_at(day_end(self.days[0] - timedelta(days=1)), [self.sku.pk]),
+                         {self.sku.pk: {'quantity': 0, 'value': 0}})
+
+        # Chỉ phát lại sổ kho từ đầu ngày, không quét từ đầu
+        with CaptureQueriesContext(connection) as queries:
+            StockSnapshotService.quantities_at(timezone.now(), [self.sku.pk])
+        replay = [q['sql'] for q in queries if q['sql'].startswith('SELECT "shop_stockhistory"')]
+        self.assertEqual(len(replay), 1)
+        self.assertIn('"created_at" >=', replay[0])
+
+        totals = StockSnapshotService.totals_at(timezone.now())
+        self.assertEqual((totals['quantity'], totals['value']), (27, 34000))
+        points = StockSnapshotService.series(self.days[0], self.today)
+        self.assertEqual([p['quantity'] for p in points], [10, 10, 15, 12, 12, 27])
+        self.assertEqual(points[3]['value'], 12000)
+        with self.assertRaises(ValueError):
+            StockSnapshotService.series(self.today, self.days[0])
+
+    def test_series_replays_lagging_tail_once(self):
+        from .services.stock_snapshot_service import StockSnapshotService
+        with self.assertRaises(ValueError):
+            StockSnapshotService.series(self.days[0], self.today)  # chưa dựng snapshot
+
+        StockSnapshotService.build(until=self.days[0])
+        with CaptureQueriesContext(connection) as queries:
+            points = StockSnapshotService.series(self.days[1], self.today)
+        self.assertEqual([p['quantity'] for p in points], [10, 15, 12, 12, 27])
+        self.assertEqual([p['value'] for p in points], [10000, 15000, 12000, 12000, 34000])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT "shop_stockhistory"')]), 1)
+        self.assertEqual(
+            [p['quantity'] for p in StockSnapshotService.series(self.days[4], self.today, [self.sku.pk])], [12, 20]
+        )
+
+    def test_admin_endpoints(self):
+        call_command('build_stock_snapshots', stdout=StringIO())
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True)
+        self.client.force_authenticate(user=admin)
+
+        response = self.client.get(reverse('admin_inventory_at'), {
+            'at': self.days[2].isoformat(), 'sku_ids': f'{self.sku.pk},{self.new_sku.pk}'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quantity'], 15)
+        self.assertEqual(response.data['skus'][self.new_sku.pk]['quantity'], 0)
+        self.assertEqual(self.client.get(reverse('admin_inventory_at'), {'at': 'abc'}).status_code, 400)
+
+        response = self.client.get(reverse('admin_inventory_series'), {
+            'start': self.days[0].isoformat(), 'end': self.today.isoformat()
+        })
+        self.assertEqual([p['quantity'] for p in response.data['points']], [10, 10, 15, 12, 12, 27])
+        response = self.client.get(reverse('admin_inventory_series'), {'start': '2020-01-01', 'end': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
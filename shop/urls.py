@@ -1,14 +1,15 @@
 from django.urls import path
 from .views import (
-    CartView, RegisterView, UserProfileView, ProductListView, ProductDetailView,
-    CategoryListView, BrandListView,  # Public views
+    CartView, RegisterView, UserProfileView, ProductListView, ProductFacetView, ProductDetailView,
+    BoughtTogetherView, ForYouView, SearchSuggestionView, HomeView, StockAvailabilityView,
+    CategoryListView, CategoryTreeView, BrandListView,  # Public views
     OrderCreateView, OrderListView, OrderDetailView, 
     AdminOrderListView, AdminOrderStatusUpdateView, CancelOrderView,
     CreateOrderFromCartView, UserOrderListView, UserOrderDetailView, OrderStatusUpdateView,
     # Admin views
     AdminCategoryListView, AdminCategoryDetailView,
     AdminBrandListView, AdminBrandDetailView,
-    AdminProductListView, AdminProductDetailView, AdminCheckView,
+    AdminProductListView, AdminProductDetailView, AdminCatalogImportView, AdminCheckView,
     # Admin dashboard and management
     AdminDashboardStatsView, AdminOrderStatsView, AdminUserStatsView,
     AdminUserListView, AdminUserDetailView, AdminUserStatusUpdateView,
@@ -21,6 +22,7 @@ from .views import (
     AdminStockHistoryView, AdminStockAlertsView, AdminStockAlertResolveView,
     AdminInventoryReportView, AdminVariantStockDetailView,
     AdminStockReturnView, AdminVariantStockHistoryView, AdminVariantListView,
+    AdminInventoryAtView, AdminInventorySeriesView,
     # Coupon & Birthday views
     UserCouponListView, ApplyCouponView,
     AdminCouponListCreateView, AdminCouponDetailView, AdminUserCouponListView,
@@ -41,12 +43,19 @@ urlpatterns = [
     path('user/profile/', UserProfileView.as_view(), name='user_profile'),
     path('user/change-password/', ChangePasswordView.as_view(), name='change_password'),
     
+    # Home page
+    path('home/', HomeView.as_view(), name='home'),
+    
     # Products
     path('products/', ProductListView.as_view(), name='product_list'),
+    path('products/facets/', ProductFacetView.as_view(), name='product_facets'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
+    path('products/<slug:slug>/', ProductDetailView.as_view(), name='product_detail_slug'),
+    path('search/suggestions/', SearchSuggestionView.as_view(), name='search_suggestions'),
     
     # Categories & Brands (Public API)
     path('categories/', CategoryListView.as_view(), name='category_list'),
+    path('categories/tree/', CategoryTreeView.as_view(), name='category_tree'),
     path('brands/', BrandListView.as_view(), name='brand_list'),
     
     # Cart
@@ -77,6 +86,7 @@ urlpatterns = [
     # Admin - Products
     path('admin/products/', AdminProductListView.as_view(), name='admin_product_list'),
     path('admin/products/<int:pk>/', AdminProductDetailView.as_view(), name='admin_product_detail'),
+    path('admin/products/import/', AdminCatalogImportView.as_view(), name='admin_catalog_import'),
     
     # Admin - Authentication
     path('admin/check-admin/', AdminCheckView.as_view(), name='admin_check'),
@@ -97,6 +107,9 @@ urlpatterns = [
     # Reviews
     path('products/<int:product_id>/reviews/', ProductReviewListView.as_view(), name='product_reviews'),
     path('products/<int:product_id>/stats/', ProductStatsView.as_view(), name='product_stats'),
+    path('products/<int:product_id>/bought-together/', BoughtTogetherView.as_view(), name='product_bought_together'),
+    path('recommendations/for-you/', ForYouView.as_view(), name='recommendations_for_you'),
+    path('stock/availability/', StockAvailabilityView.as_view(), name='stock_availability'),
     path('reviews/create/', ReviewCreateView.as_view(), name='review_create'),
     path('reviews/my-reviews/', UserReviewListView.as_view(), name='user_reviews'),
     path('reviews/<int:pk>/', ReviewDetailView.as_view(), name='review_detail'),
@@ -117,6 +130,8 @@ urlpatterns = [
     path('admin/stock/alerts/<int:pk>/resolve/', AdminStockAlertResolveView.as_view(), name='admin_stock_alert_resolve'),
     path('admin/inventory/report/', AdminInventoryReportView.as_view(), name='admin_inventory_report'),
     path('admin/inventory/variants/<int:pk>/', AdminVariantStockDetailView.as_view(), name='admin_variant_stock_detail'),
+    path('admin/inventory/at/', AdminInventoryAtView.as_view(), name='admin_inventory_at'),
+    path('admin/inventory/series/', AdminInventorySeriesView.as_view(), name='admin_inventory_series'),
     # Lấy danh sách variants cho Stock Management
     path('admin/products/variants/', AdminVariantListView.as_view(), name='admin_variant_list'),
     
@@ -1,5 +1,7 @@
 # shop/utils.py - Utility functions for better code organization
 import logging
+import re
+import unicodedata
 from django.http import JsonResponse
 from django.conf import settings
 from rest_framework import status
@@ -24,4 +26,35 @@ def validate_stock_availability(cart_items):
     for item in cart_items:
         if item.product_variant.stock_quantity < item.quantity:
             return False, f"Not enough stock for {item.product_variant.product.name}"
-    return True, None
\ No newline at end of file
+    return True, None
+
+def normalize_text(text):
+    """
+    Chuẩn hóa chuỗi để tìm kiếm: chữ thường, bỏ dấu tiếng Việt (kể cả đ/Đ),
+    thay ký tự không phải chữ/số bằng khoảng trắng
+    Ví dụ: "Áo Thun Nam - Đen" -> "ao thun nam den"
+    """
+    if not text:
+        return ''
+    text = str(text).lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+def format_price_range(min_price, max_price):
+    """Chuỗi khoảng giá hiển thị trên product card, ví dụ: 150,000₫ - 200,000₫"""
+    if not max_price:
+        return "0₫"
+    if min_price == max_price:
+        return f"{int(min_price):,}₫"
+    return f"{int(min_price):,}₫ - {int(max_price):,}₫"
+
+def media_url(path):
+    """URL của file trong default storage (None nếu không có / storage không tạo được URL)"""
+    if not path:
+        return None
+    from django.core.files.storage import default_storage
+    try:
+        return default_storage.url(path)
+    except ValueError:
+        return None
@@ -15,11 +15,23 @@ from .serializers import (
     OrderItemSerializer, UserSerializer,
     CategorySerializer, BrandSerializer, ReviewSerializer, 
     WishlistSerializer, WishlistItemSerializer,
-    ProductVariantSerializer
+    ProductVariantSerializer, ProductCardSerializer
 )
 from rest_framework_simplejwt.views import TokenObtainPairView
 from shop.services.stock_service import StockService
-from django.db import transaction
+from shop.services.search_service import ProductSearchService
+from shop.services.fuzzy_search_service import fuzzy_search_index
+from shop.services.suggestion_service import suggestion_index
+from shop.services.facet_service import ProductFacetService
+from shop.services.counter_service import product_view_counter
+from shop.services.category_tree_service import CategoryTreeService, active_product_count
+from shop.services.catalog_cache_service import CatalogCacheService, CATALOG_SCOPE
+from shop.services.product_write_service import ProductWriteService, tree_queryset
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 
 # Custom permission for admin only
 class IsAdminUser(permissions.BasePermission):
@@ -146,70 +158,352 @@ class UserProfileView(APIView):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def annotated_categories():
+    """
+    Category queryset kèm active_product_count (gộp cả danh mục con, theo materialized path)
+    và children (đã annotate) cho CategorySerializer
+    """
+    return Category.objects.annotate(active_product_count=active_product_count()).prefetch_related(
+        Prefetch('children', queryset=Category.objects.annotate(active_product_count=active_product_count()))
+    )
+
+
+def product_card_queryset(fields=None):
+    """
+    Product queryset với prefetch cho ProductSerializer
+    Số query cố định cho mỗi trang, không phụ thuộc số sản phẩm
+
+    Args:
+        fields: Các field serializer sẽ trả về (None = tất cả) - chỉ prefetch quan hệ được yêu cầu
+    """
+    queryset = Product.objects.all()
+    if fields is None or 'brand' in fields:
+        queryset = queryset.select_related('brand')
+    if fields is None or 'category' in fields:
+        queryset = queryset.prefetch_related(Prefetch('category', queryset=annotated_categories()))
+    if fields is None or 'variants' in fields:
+        queryset = queryset.prefetch_related('variants__images', 'variants__skus')
+    if fields is None or 'vouchers' in fields:
+        queryset = queryset.prefetch_related('vouchers')
+    return queryset
+
+
+def product_detail_queryset():
+    """
+    Product queryset cho trang chi tiết với số query cố định (không phụ thuộc số màu/size):
+    sản phẩm + brand, danh mục (+ danh mục con), variants, ảnh, SKUs, vouchers
+    Chỉ lấy variant/SKU đang bán, sắp xếp ổn định
+    """
+    variants = ProductVariant.objects.filter(is_active=True).order_by('color', 'id').prefetch_related(
+        Prefetch('images', queryset=ProductVariantImage.objects.order_by('order', 'id')),
+        Prefetch('skus', queryset=ProductSKU.objects.filter(is_active=True).order_by('size', 'id')),
+    )
+    return Product.objects.select_related('brand').prefetch_related(
+        Prefetch('category', queryset=annotated_categories()),
+        Prefetch('variants', queryset=variants),
+        Prefetch('vouchers', queryset=ProductVoucher.objects.order_by('id')),
+    )
+
+
+def order_list_queryset(queryset, fields):
+    """Prefetch cho OrderSerializer theo các field được yêu cầu (?fields=/?expand=)"""
+    queryset = queryset.select_related('user', 'used_coupon__coupon')
+    if 'items' in fields or 'total_items' in fields:
+        queryset = queryset.prefetch_related(
+            'items__product_sku__variant__product', 'items__product_sku__variant__images'
+        )
+    return queryset
+
+
+# ETag / Last-Modified từ version dùng chung giữa các worker (CatalogCacheService.versions())
+def catalog_etag(request, *args, **kwargs):
+    return CatalogCacheService.get_etag(request)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return CatalogCacheService.get_last_modified()
+
+
+class CatalogCacheMixin:
+    """
+    Cache response GET của API catalog công khai theo catalog version + query string
+    (xem CatalogCacheService). Chỉ cache response 200
+
+    ETag/Last-Modified tính từ catalog version: If-None-Match khớp thì trả 304
+    mà không chạy queryset/serializer
+    """
+
+    @method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified))
+    def get(self, request, *args, **kwargs):
+        def build():
+            response = super(CatalogCacheMixin, self).get(request, *args, **kwargs)
+            # Chỉ cache data (picklable) của response 200
+            if response.status_code == status.HTTP_200_OK:
+                return response.data, True
+            return response, False
+
+        result = CatalogCacheService.get_or_build(request, build)
+        return result if isinstance(result, Response) else Response(result)
+
+
 # Danh sÃ¡ch sáº£n pháº©m
-class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related('variants')
+class ProductListView(CatalogCacheMixin, generics.ListAPIView):
+    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = ProductPagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # ?search= (SearchFilter) được áp dụng trong get_base_queryset để facet cũng đếm theo kết quả tìm kiếm
+    filter_backends = [filters.OrderingFilter]
     search_fields = ['name', 'description', 'category__name', 'brand__name', 'tags']
-    ordering_fields = ['created_at', 'sold_count', 'average_rating', 'variants__price']
+    ordering_fields = ['created_at', 'sold_count', 'average_rating', 'variants__price', 'min_price']
     ordering = ['-created_at']  # Default ordering
     
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        # Filter by is_new
-        is_new = self.request.query_params.get('is_new')
-        if is_new:
-            queryset = queryset.filter(is_new=True)
-        
-        # Filter by on_sale (có discount)
-        on_sale = self.request.query_params.get('on_sale')
-        if on_sale:
-            queryset = queryset.filter(variants__discount_price__isnull=False).distinct()
-        
-        # Filter by category
-        category = self.request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category_id=category)
+    def get_base_queryset(self):
+        """Queryset đã áp dụng tìm kiếm và các bộ lọc không phải facet (dùng chung cho list và facets)"""
+        if self.use_card_view():
+            queryset = super().get_queryset()
+        else:
+            # Chỉ prefetch các quan hệ mà ?fields=/?expand= yêu cầu
+            queryset = product_card_queryset(set(self.get_serializer().fields)).filter(is_active=True)
+        
+        # Full-text search (?q=) - dùng FTS5 index, xếp hạng theo BM25
+        # ?q=...&fuzzy=1 - không phân biệt dấu, chịu lỗi gõ (index trong bộ nhớ)
+        # Chỉ lấy MAX_RESULTS kết quả tốt nhất: lấy thừa một để báo truncated cho client
+        self.search_ids = None
+        self.search_truncated = False
+        q = self.request.query_params.get('q')
+        if q:
+            limit = ProductSearchService.MAX_RESULTS
+            if self.request.query_params.get('fuzzy') in ('1', 'true'):
+                self.search_ids = fuzzy_search_index.search(q, limit + 1)
+            elif ProductSearchService.is_available():
+                self.search_ids = ProductSearchService.search(q, limit + 1)
+            if self.search_ids is not None:
+                self.search_truncated = len(self.search_ids) > limit
+                self.search_ids = self.search_ids[:limit]
+                queryset = queryset.filter(pk__in=self.search_ids)
+            else:
+                from django.db.models import Q
+                queryset = queryset.filter(
+                    Q(name__icontains=q) | Q(short_description__icontains=q) |
+                    Q(brand__name__icontains=q) | Q(category__name__icontains=q)
+                )
         
         # Filter by min_rating
         min_rating = self.request.query_params.get('min_rating')
         if min_rating:
             queryset = queryset.filter(average_rating__gte=float(min_rating))
         
-        # Filter by price range
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        if min_price:
-            queryset = queryset.filter(variants__price__gte=float(min_price)).distinct()
-        if max_price:
-            queryset = queryset.filter(variants__price__lte=float(max_price)).distinct()
-        
+        # ?search= theo search_fields
+        return filters.SearchFilter().filter_queryset(self.request, queryset, self)
+    
+    def get_queryset(self):
+        # Facet: category, brand, khoảng giá, color, size, is_new, on_sale (xem ProductFacetService)
+        self.base_queryset = self.get_base_queryset()
+        self.facet_selection = ProductFacetService.parse_selection(self.request.query_params)
+        queryset = ProductFacetService.apply_selection(self.base_queryset, self.facet_selection)
+        if self.use_card_view():
+            queryset = queryset.values(*ProductCardSerializer.VALUES)
         return queryset
+    
+    def use_card_view(self):
+        """?view=card: card serializer đọc từ .values() cho grid sản phẩm"""
+        return self.request.query_params.get('view') == 'card'
+    
+    def get_serializer_class(self):
+        if self.use_card_view():
+            return ProductCardSerializer
+        return super().get_serializer_class()
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        # ?facets=1: trả kèm số đếm facet trong cùng một request
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = ProductFacetService.facet_counts(self.base_queryset, self.facet_selection)
+        # ?q= khớp nhiều hơn MAX_RESULTS: count / số trang chỉ tính trên MAX_RESULTS kết quả đầu
+        if self.search_ids is not None:
+            response.data['truncated'] = self.search_truncated
+        return response
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Kết quả ?q= giữ thứ tự BM25 trừ khi client chỉ định ordering
+        if self.search_ids and not self.request.query_params.get('ordering'):
+            from django.db.models import Case, When, IntegerField
+            queryset = queryset.order_by(Case(
+                *[When(pk=pk, then=position) for position, pk in enumerate(self.search_ids)],
+                output_field=IntegerField()
+            ))
+        return queryset
+
+# Facet cho bộ lọc sản phẩm (cùng tham số với ProductListView)
+class ProductFacetView(ProductListView):
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        self.get_queryset()
+        data = ProductFacetService.facet_counts(self.base_queryset, self.facet_selection)
+        if self.search_ids is not None:
+            data['truncated'] = self.search_truncated
+        return Response(data)
 
 # Chi tiáº¿t sáº£n pháº©m
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+# Chi tiết sản phẩm: /products/<pk>/ hoặc /products/<slug>/
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
     serializer_class = ProductSerializer
     permission_classes = (permissions.AllowAny,)
 
+    def get_queryset(self):
+        return product_detail_queryset()
+
+    def get_object(self):
+        if 'slug' in self.kwargs:
+            self.lookup_field = 'slug'
+        return super().get_object()
+
+    @staticmethod
+    def product_id_for_slug(slug):
+        """ID sản phẩm theo slug (cache theo catalog version, dùng khi response lấy từ cache / 304)"""
+        cache = CatalogCacheService.cache()
+        key = f"product-slug:{CatalogCacheService.get_version()}:{slug}"
+        product_id = cache.get(key)
+        if product_id is None:
+            product_id = Product.objects.filter(slug=slug).values_list('pk', flat=True).first()
+            if product_id is not None:
+                cache.set(key, product_id)
+        return product_id
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # Đếm lượt xem cả khi response lấy từ cache / 304 (ghi trễ theo lô)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            product_id = kwargs.get('pk')
+            if product_id is None and isinstance(response.data, dict):
+                product_id = response.data.get('id')
+            if product_id is None:
+                product_id = self.product_id_for_slug(kwargs['slug'])
+            if product_id is not None:
+                product_view_counter.increment(product_id)
+        return response
+
+# Trang chủ: mọi mục trong một response, cache cả response theo catalog version
+class HomeView(CatalogCacheMixin, generics.ListAPIView):
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        from shop.services.home_service import HomePageService
+        rows, sections, categories = HomePageService.build(ProductCardSerializer.VALUES)
+        # Serialize mỗi sản phẩm một lần, dùng lại cho mọi mục
+        cards = dict(zip(rows, ProductCardSerializer(list(rows.values()), many=True, context={'request': request}).data))
+
+        def section(product_ids):
+            return [cards[pk] for pk in product_ids if pk in cards]
+
+        return Response({
+            'featured': section(sections['featured']),
+            'new': section(sections['new']),
+            'best_sellers': section(sections['best_sellers']),
+            'groups': [
+                {'display_group': group['display_group'], 'label': group['label'], 'products': section(group['products'])}
+                for group in sections['groups']
+            ],
+            'categories': categories,
+        })
+
+# Gợi ý khi gõ ô tìm kiếm (index tiền tố trong bộ nhớ, không query DB)
+class SearchSuggestionView(APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 8)), 1), 20)
+        except ValueError:
+            limit = 8
+        return Response(suggestion_index.suggest(request.query_params.get('q', ''), limit))
+
+# Tồn kho khả dụng của nhiều SKU (GET ?sku_ids=1,2,3 hoặc POST {"sku_ids": [...]} cho danh sách dài)
+class StockAvailabilityView(APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        return self.lookup(request.query_params.get('sku_ids', ''))
+
+    def post(self, request):
+        return self.lookup(request.data.get('sku_ids', []))
+
+    def lookup(self, raw):
+        from shop.services.stock_availability_service import StockAvailabilityService
+        try:
+            sku_ids = StockAvailabilityService.parse_ids(raw)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        results = StockAvailabilityService.availability(sku_ids)
+        return Response({
+            'results': results,
+            'missing': [sku_id for sku_id in sku_ids if sku_id not in results],
+        })
+
+# Sản phẩm thường được mua cùng (dựng offline bởi lệnh build_bought_together)
+class BoughtTogetherView(CatalogCacheMixin, generics.ListAPIView):
+    serializer_class = ProductCardSerializer
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+
+    def get_queryset(self):
+        # Một query: index (product, rank) của ProductBoughtTogether join Product
+        return Product.objects.filter(
+            bought_together_of__product_id=self.kwargs['product_id'], is_active=True
+        ).order_by('bought_together_of__rank').values(*ProductCardSerializer.VALUES)
+
+# Gợi ý "dành cho bạn" (dựng offline bởi lệnh build_recommendations)
+class ForYouView(APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        from shop.services.recommendation_service import RecommendationService, TOP_N
+        try:
+            limit = min(max(int(request.query_params.get('limit', TOP_N)), 1), TOP_N)
+        except ValueError:
+            limit = TOP_N
+
+        rows = []
+        if request.user.is_authenticated:
+            # Một query: index (user, rank) của UserRecommendation join Product
+            rows = list(
+                Product.objects.filter(recommended_to__user=request.user, is_active=True)
+                .order_by('recommended_to__rank').values(*ProductCardSerializer.VALUES)[:limit]
+            )
+        source = 'personalized'
+        if not rows:
+            # Cold start: bán chạy theo display_group
+            source = 'best_sellers'
+            product_ids = RecommendationService.cold_start(request.query_params.get('display_group'), limit)
+            by_id = {row['id']: row for row in Product.objects.filter(pk__in=product_ids).values(*ProductCardSerializer.VALUES)}
+            rows = [by_id[pk] for pk in product_ids if pk in by_id]
+
+        serializer = ProductCardSerializer(rows, many=True, context={'request': request})
+        return Response({'source': source, 'results': serializer.data})
+
 # Public Categories List (for filtering)
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(CatalogCacheMixin, generics.ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = (permissions.AllowAny,)
     
     def get_queryset(self):
         # Tối ưu: prefetch children và annotate product_count để tránh N+1 queries
-        from django.db.models import Count, Q
-        return Category.objects.prefetch_related('children').annotate(
-            active_product_count=Count('products', filter=Q(products__is_active=True))
-        )
+        return annotated_categories()
+
+# Cây danh mục đầy đủ cho mega menu (nhóm theo display_group)
+class CategoryTreeView(CatalogCacheMixin, generics.ListAPIView):
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        return Response(CategoryTreeService.tree())
 
 # Public Brands List (for filtering)  
-class BrandListView(generics.ListAPIView):
+class BrandListView(CatalogCacheMixin, generics.ListAPIView):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     permission_classes = (permissions.AllowAny,)
@@ -217,9 +511,26 @@ class BrandListView(generics.ListAPIView):
 #------------------------------them gio hang----------------------------------------
 
 # API giá» hÃ ng
+def cart_etag(request, *args, **kwargs):
+    # Giỏ hàng hiển thị cả giá/tồn kho của SKU nên phụ thuộc cả catalog version
+    return CatalogCacheService.get_etag(
+        request, CATALOG_SCOPE, CatalogCacheService.cart_scope(request.user.pk)
+    )
+
+
+def cart_last_modified(request, *args, **kwargs):
+    timestamps = [
+        CatalogCacheService.get_last_modified(),
+        CatalogCacheService.get_last_modified(CatalogCacheService.cart_scope(request.user.pk)),
+    ]
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    return max(timestamps) if timestamps else None
+
+
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(condition(etag_func=cart_etag, last_modified_func=cart_last_modified))
     def get(self, request):
         cart, created = Cart.objects.get_or_create(user=request.user)
         serializer = CartSerializer(cart, context={'request': request})
@@ -378,8 +689,8 @@ class OrderListView(generics.ListAPIView):
     pagination_class = OrderPagination
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).select_related('user').prefetch_related(
-            'items__product_sku__variant__product'
+        return order_list_queryset(
+            Order.objects.filter(user=self.request.user), self.get_serializer().fields
         ).order_by('-created_at')
 
 # Get order details
@@ -398,9 +709,7 @@ class AdminOrderListView(generics.ListAPIView):
     pagination_class = AdminPagination
     
     def get_queryset(self):
-        queryset = Order.objects.all().select_related('user').prefetch_related(
-            'items__product_sku__variant__product'
-        ).order_by('-created_at')
+        queryset = order_list_queryset(Order.objects.all(), self.get_serializer().fields).order_by('-created_at')
         
         # Search filter (by order ID or username)
         search = self.request.query_params.get('search', None)
@@ -508,10 +817,12 @@ class CreateOrderFromCartView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            cart_items = list(cart.items.select_related('product_sku__variant__product'))
+            
             # Calculate total price using ProductSKU
             total_price = sum(
                 item.quantity * item.product_sku.get_final_price()
-                for item in cart.items.all()
+                for item in cart_items
             )
             
             # Create order
@@ -528,49 +839,50 @@ class CreateOrderFromCartView(APIView):
                 'payment_method': request.data.get('payment_method', 'cod')
             }
             
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                total_price=total_price,
-                shipping_name=order_data['shipping_name'],
-                shipping_address=order_data['shipping_address'],
-                shipping_city=order_data['shipping_city'],
-                shipping_postal_code=order_data['shipping_postal_code'],
-                shipping_country=order_data['shipping_country'],
-                phone_number=order_data['phone_number'],
-                notes=order_data['notes']
-            )
-            
-            # Create order items from cart items and export stock
-            with transaction.atomic():
-                for cart_item in cart.items.all():
-                    # Create order item using ProductSKU
-                    OrderItem.objects.create(
-                        order=order,
-                        product_sku=cart_item.product_sku,
-                        quantity=cart_item.quantity,
-                        price_per_item=cart_item.product_sku.get_final_price()
+            try:
+                with transaction.atomic():
+                    # Create order
+                    order = Order.objects.create(
+                        user=request.user,
+                        total_price=total_price,
+                        shipping_name=order_data['shipping_name'],
+                        shipping_address=order_data['shipping_address'],
+                        shipping_city=order_data['shipping_city'],
+                        shipping_postal_code=order_data['shipping_postal_code'],
+                        shipping_country=order_data['shipping_country'],
+                        phone_number=order_data['phone_number'],
+                        notes=order_data['notes']
                     )
                     
-                    # Export stock using StockService with ProductSKU
-                    try:
-                        StockService.export_stock(
+                    # Release reservation before export (reserved stock becomes available to this order)
+                    for cart_item in cart_items:
+                        if cart_item.is_reserved:
+                            cart_item.release_reservation()
+                    
+                    # Create order items using ProductSKU - bulk_create không gửi signal xuất kho
+                    order_items = OrderItem.objects.bulk_create([
+                        OrderItem(
+                            order=order,
                             product_sku=cart_item.product_sku,
                             quantity=cart_item.quantity,
-                            order=order,
-                            user=request.user,
-                            notes=f"Order #{order.id} - Customer checkout"
+                            price_per_item=cart_item.product_sku.get_final_price()
                         )
-                    except ValueError as e:
-                        # Rollback and return error
-                        raise Exception(f"Failed to export stock: {str(e)}")
+                        for cart_item in cart_items
+                    ])
                     
-                    # Release reservation if cart item was reserved
-                    if cart_item.is_reserved:
-                        cart_item.release_reservation()
-            
-            # Clear cart
-            cart.items.all().delete()
+                    # Export stock cho cả đơn: một UPDATE, một bulk_create lịch sử
+                    StockService.export_stock_many(
+                        order, [(item.product_sku, item.quantity) for item in order_items],
+                        notes=f"Order #{order.id} - Customer checkout", user=request.user
+                    )
+                    
+                    # Clear cart
+                    cart.items.all().delete()
+            except ValueError as e:
+                return Response(
+                    {"error": f"Failed to export stock: {str(e)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             # Return order details
             serializer = OrderSerializer(order)
@@ -595,7 +907,9 @@ class UserOrderListView(generics.ListAPIView):
     pagination_class = OrderPagination
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).select_related('user').prefetch_related('items__product_sku__variant__product').order_by('-created_at')
+        return order_list_queryset(
+            Order.objects.filter(user=self.request.user), self.get_serializer().fields
+        ).order_by('-created_at')
 
 
 # Order detail for user
@@ -913,6 +1227,42 @@ class AdminProductListView(generics.ListCreateAPIView):
             except json.JSONDecodeError:
                 pass
 
+# Admin: Nhập catalog hàng loạt từ file CSV / NDJSON (xem services/catalog_import_service.py)
+class AdminCatalogImportView(APIView):
+    """
+    POST /api/shop/admin/products/import/ (multipart)
+    Form: file=<catalog.csv|catalog.ndjson>, chunk_size=2000 (tùy chọn), reference_number (tùy chọn)
+    Nhập đồng bộ trong request, báo cáo trả về khi xong: file lớn hơn MAX_UPLOAD_SIZE (20MB) trả 413,
+    dùng lệnh python manage.py import_catalog
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        from shop.services.catalog_import_service import (
+            CatalogImportService, CHUNK_SIZE, MAX_UPLOAD_SIZE, detect_format
+        )
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'Vui lòng chọn file catalog'}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.size > MAX_UPLOAD_SIZE:
+            return Response(
+                {'error': f'File lớn hơn {MAX_UPLOAD_SIZE // (1024 * 1024)}MB - '
+                          f'nhập bằng lệnh: python manage.py import_catalog <file>'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        try:
+            fmt = detect_format(upload.name)
+            chunk_size = int(request.data.get('chunk_size') or CHUNK_SIZE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = CatalogImportService.import_file(
+            upload, fmt, chunk_size=chunk_size, user=request.user,
+            reference=request.data.get('reference_number', ''),
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
 class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = AdminProductSerializer
@@ -921,16 +1271,10 @@ class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         if not (self.request.user.is_admin or self.request.user.is_superuser):
             return Product.objects.none()
-        return Product.objects.all().select_related('category', 'brand').prefetch_related('variants', 'vouchers')
+        # Nạp cả cây variant (ảnh, SKU) và voucher một lần - update() so sánh trên cây này
+        return tree_queryset()
     
     def update(self, request, *args, **kwargs):
-        # Debug logging
-        print("=== ADMIN PRODUCT UPDATE DEBUG ===")
-        print("User:", request.user.username)
-        print("Product ID:", kwargs.get('pk'))
-        print("Request data keys:", list(request.data.keys()))
-        print("Request files keys:", list(request.FILES.keys()))
-        
         # Check admin permission
         if not (request.user.is_admin or request.user.is_superuser):
             return Response(
@@ -938,220 +1282,36 @@ class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Get the product instance
         instance = self.get_object()
         
-        # Debug brand field specifically
-        print("Brand in request.data:", request.data.get('brand'))
-        print("Category in request.data:", request.data.get('category'))
+        # variants / vouchers: chuỗi JSON (FormData) hoặc list (JSON body), ghi bởi ProductWriteService
+        try:
+            variants_data = ProductWriteService.parse_json(request.data.get('variants'))
+            vouchers_data = ProductWriteService.parse_json(request.data.get('vouchers'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = request.data
+        if not hasattr(data, 'getlist'):
+            # JSON body: không để serializer lồng nhau tự xóa/tạo lại variants
+            data = {key: value for key, value in data.items() if key not in ('variants', 'vouchers')}
         
         # Update basic product fields
-        serializer = self.get_serializer(instance, data=request.data, partial=True)
-        if serializer.is_valid():
-            print("Serializer is valid. Validated data:", serializer.validated_data)
-            product = serializer.save()
-            
-            # Handle variants update (replace all - NEW STRUCTURE)
-            variants_json = request.data.get('variants')
-            if variants_json:
-                import json
-                try:
-                    variants_data = json.loads(variants_json)
-                    
-                    print("\n--- VARIANTS UPDATE DEBUG ---")
-                    print(f"Has variants_json: True")
-                    print(f"Variants data count: {len(variants_data)}")
-                    print(f"Variants data: {variants_data}")
-                    
-                    # INCREMENTAL UPDATE: Chỉ xóa variants KHÔNG CÓ trong request
-                    incoming_variant_ids = [v.get('id') for v in variants_data if v.get('id')]
-                    print(f"Incoming variant IDs: {incoming_variant_ids}")
-                    
-                    # Xóa variants không còn trong request
-                    variants_to_delete = product.variants.exclude(id__in=incoming_variant_ids) if incoming_variant_ids else product.variants.all()
-                    deleted_count = variants_to_delete.count()
-                    if deleted_count > 0:
-                        print(f"⚠️  Deleting {deleted_count} variants not in request")
-                        variants_to_delete.delete()
-                    
-                    # Update/Create variants
-                    for idx, variant_data in enumerate(variants_data, 1):
-                        variant_id = variant_data.get('id')
-                        color = variant_data.get('color', '')
-                        
-                        print(f"\n  Variant {idx}: ID={variant_id}, Color={color}")
-                        
-                        if variant_id:
-                            # UPDATE existing variant
-                            try:
-                                variant = ProductVariant.objects.get(id=variant_id, product=product)
-                                print(f"    ✓ Updating existing variant")
-                                variant.color = color
-                                variant.price = variant_data.get('price', 0)
-                                variant.discount_price = variant_data.get('discount_price')
-                                variant.is_active = variant_data.get('is_active', True)
-                                variant.save()
-                                
-                                # Check if has new images to upload
-                                image_files = [f for k, f in request.FILES.items() if k.startswith(f'variant_image_{color}')]
-                                existing_images_count = variant.images.count()
-                                print(f"    📸 Image check: current={existing_images_count}, new_files={[f.name for f in image_files]}")
-                                
-                                has_new_images = len(image_files) > 0
-                                print(f"    📸 Has new images: {has_new_images}")
-                                
-                                if has_new_images:
-                                    # Delete old images only if uploading new ones
-                                    print(f"    🗑️  Deleting {existing_images_count} old images")
-                                    variant.images.all().delete()
-                                else:
-                                    # Keep existing images
-                                    print(f"    ✓ No new images, keeping {existing_images_count} existing images")
-                                
-                            except ProductVariant.DoesNotExist:
-                                print(f"    ⚠️  Variant ID {variant_id} not found, creating NEW")
-                                variant = ProductVariant.objects.create(
-                                    product=product,
-                                    color=color,
-                                    price=variant_data.get('price', 0),
-                                    discount_price=variant_data.get('discount_price'),
-                                    is_active=variant_data.get('is_active', True)
-                                )
-                                has_new_images = True  # New variant needs images
-                        else:
-                            # CREATE new variant
-                            print(f"    ⚠️  No ID, creating NEW variant")
-                            variant = ProductVariant.objects.create(
-                                product=product,
-                                color=color,
-                                price=variant_data.get('price', 0),
-                                discount_price=variant_data.get('discount_price'),
-                                is_active=variant_data.get('is_active', True)
-                            )
-                            has_new_images = True  # New variant needs images
-                            existing_images_count = 0
-                        
-                        # Upload new images if has_new_images flag is True
-                        if has_new_images:
-                            # Support multiple images per variant
-                            image_index = 0
-                            while True:
-                                image_key = f'variant_image_{color}_{image_index}' if image_index > 0 else f'variant_image_{color}'
-                                image_file = request.FILES.get(image_key)
-                                if not image_file:
-                                    break
-                                
-                                ProductVariantImage.objects.create(
-                                    variant=variant,
-                                    image=image_file,
-                                    is_primary=(image_index == 0),
-                                    order=image_index
-                                )
-                                print(f"    ✅ Created image {image_index}: {image_file.name}")
-                                image_index += 1
-                        
-                        # Update ProductSKUs (sizes)
-                        sizes_data = variant_data.get('sizes', [])
-                        incoming_sku_ids = [s.get('id') for s in sizes_data if s.get('id')]
-                        
-                        # Delete SKUs not in request
-                        skus_to_delete = variant.skus.exclude(id__in=incoming_sku_ids) if incoming_sku_ids else variant.skus.all()
-                        deleted_skus = skus_to_delete.count()
-                        if deleted_skus > 0:
-                            print(f"    🗑️  Deleting {deleted_skus} SKUs not in request")
-                            skus_to_delete.delete()
-                        
-                        # Update/Create SKUs
-                        for size_data in sizes_data:
-                            sku_id = size_data.get('id')
-                            if sku_id:
-                                # Update existing SKU
-                                try:
-                                    sku = ProductSKU.objects.get(id=sku_id, variant=variant)
-                                    sku.size = size_data.get('name', sku.size)
-                                    sku.stock_quantity = size_data.get('stock_quantity', sku.stock_quantity)
-                                    sku.minimum_stock = size_data.get('minimum_stock', sku.minimum_stock)
-                                    sku.reorder_point = size_data.get('reorder_point', sku.reorder_point)
-                                    sku.cost_price = size_data.get('cost_price', sku.cost_price)
-                                    sku.save()
-                                except ProductSKU.DoesNotExist:
-                                    # Create if not found
-                                    ProductSKU.objects.create(
-                                        variant=variant,
-                                        size=size_data.get('name', ''),
-                                        stock_quantity=size_data.get('stock_quantity', 0),
-                                        minimum_stock=size_data.get('minimum_stock', 5),
-                                        reorder_point=size_data.get('reorder_point', 10),
-                                        cost_price=size_data.get('cost_price', 0)
-                                    )
-                            else:
-                                # Create new SKU
-                                ProductSKU.objects.create(
-                                    variant=variant,
-                                    size=size_data.get('name', ''),
-                                    stock_quantity=size_data.get('stock_quantity', 0),
-                                    minimum_stock=size_data.get('minimum_stock', 5),
-                                    reorder_point=size_data.get('reorder_point', 10),
-                                    cost_price=size_data.get('cost_price', 0)
-                                )
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                    pass
-            
-            # Handle vouchers update (replace all)
-            vouchers_json = request.data.get('vouchers')
-            if vouchers_json:
-                try:
-                    vouchers_data = json.loads(vouchers_json)
-                    
-                    # Delete existing vouchers (except ones being kept)
-                    existing_voucher_ids = [v.get('id') for v in vouchers_data if v.get('id')]
-                    product.vouchers.exclude(id__in=existing_voucher_ids).delete()
-                    
-                    # Create or update vouchers
-                    for voucher_data in vouchers_data:
-                        voucher_id = voucher_data.get('id')
-                        if voucher_id:
-                            # Update existing voucher
-                            try:
-                                voucher = ProductVoucher.objects.get(id=voucher_id, product=product)
-                                voucher.code = voucher_data.get('code', voucher.code)
-                                voucher.name = voucher_data.get('name', voucher.name)
-                                voucher.description = voucher_data.get('description', '')
-                                voucher.discount_type = voucher_data.get('discount_type', voucher.discount_type)
-                                voucher.discount_value = voucher_data.get('discount_value', voucher.discount_value)
-                                voucher.max_discount_amount = voucher_data.get('max_discount_amount')
-                                voucher.max_uses = voucher_data.get('max_uses')
-                                voucher.valid_from = voucher_data.get('valid_from', voucher.valid_from)
-                                voucher.valid_to = voucher_data.get('valid_to', voucher.valid_to)
-                                voucher.is_active = voucher_data.get('is_active', voucher.is_active)
-                                voucher.save()
-                            except ProductVoucher.DoesNotExist:
-                                pass
-                        else:
-                            # Create new voucher
-                            ProductVoucher.objects.create(
-                                product=product,
-                                code=voucher_data.get('code', ''),
-                                name=voucher_data.get('name', ''),
-                                description=voucher_data.get('description', ''),
-                                discount_type=voucher_data.get('discount_type', 'percentage'),
-                                discount_value=voucher_data.get('discount_value', 0),
-                                max_discount_amount=voucher_data.get('max_discount_amount'),
-                                max_uses=voucher_data.get('max_uses'),
-                                current_uses=voucher_data.get('current_uses', 0),
-                                valid_from=voucher_data.get('valid_from'),
-                                valid_to=voucher_data.get('valid_to'),
-                                is_active=voucher_data.get('is_active', True),
-                            )
-                except json.JSONDecodeError:
-                    pass
-            
-            # Return updated product data
-            return Response(self.get_serializer(product).data)
-        else:
-            print("Serializer errors:", serializer.errors)
+        serializer = self.get_serializer(instance, data=data, partial=True)
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Một transaction: field sản phẩm + diff variant / SKU / ảnh / voucher
+        try:
+            with transaction.atomic():
+                product = serializer.save()
+                ProductWriteService.apply(product, variants_data, vouchers_data, request.FILES, user=request.user)
+        except DjangoValidationError as e:
+            return Response({'error': e.message_dict if hasattr(e, 'error_dict') else e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError as e:
+            return Response({'error': f'Dữ liệu bị trùng hoặc không hợp lệ: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Response đọc từ cây đã nạp / vừa ghi (không query lại variants)
+        return Response(self.get_serializer(product).data)
 
 # Admin check endpoint
 class AdminCheckView(APIView):
@@ -1397,8 +1557,16 @@ class WishlistView(APIView):
     
     def get(self, request):
         """Get user's wishlist"""
-        wishlist_items = Wishlist.objects.filter(user=request.user).select_related('product')
-        serializer = WishlistItemSerializer(wishlist_items, many=True)
+        context = {'request': request}
+        fields = WishlistItemSerializer(context=context).fields
+        wishlist_items = Wishlist.objects.filter(user=request.user)
+        if 'product' in fields:
+            wishlist_items = wishlist_items.prefetch_related(Prefetch('product', queryset=product_card_queryset()))
+        else:
+            wishlist_items = wishlist_items.select_related('product')
+            if 'product_discount_price' in fields:
+                wishlist_items = wishlist_items.prefetch_related('product__variants')
+        serializer = WishlistItemSerializer(wishlist_items, many=True, context=context)
         return Response(serializer.data)
     
     def post(self, request):
@@ -2058,6 +2226,79 @@ class AdminVariantStockHistoryView(generics.ListAPIView):
         ).order_by('-created_at')
 
 
+# Tồn kho tại một thời điểm / theo ngày (snapshot cuối ngày + phát lại StockHistory)
+class AdminInventoryAtView(APIView):
+    """
+    API tồn kho tại một thời điểm
+    GET /api/shop/admin/inventory/at/
+    Query params:
+        - at: Thời điểm (ISO datetime) hoặc ngày (YYYY-MM-DD = cuối ngày), mặc định hiện tại
+        - sku_ids: Danh sách SKU (1,2,3) - có thì trả thêm tồn kho từng SKU, không có thì toàn kho
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from django.utils import timezone
+        from django.utils.dateparse import parse_date, parse_datetime
+        from shop.services.stock_availability_service import StockAvailabilityService
+        from shop.services.stock_snapshot_service import StockSnapshotService, day_end
+
+        raw = request.query_params.get('at')
+        at = timezone.now()
+        if raw:
+            try:
+                day = parse_date(raw)
+                at = day_end(day) if day else parse_datetime(raw)
+            except ValueError:
+                at = None
+            if not at:
+                return Response({'error': 'at phải là ngày hoặc thời điểm ISO'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        sku_ids = None
+        if request.query_params.get('sku_ids'):
+            try:
+                sku_ids = StockAvailabilityService.parse_ids(request.query_params['sku_ids'])
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {'at': at, **StockSnapshotService.totals_at(at, sku_ids)}
+        if sku_ids is not None:
+            data['skus'] = StockSnapshotService.quantities_at(at, sku_ids)
+        return Response(data)
+
+
+class AdminInventorySeriesView(APIView):
+    """
+    API biểu đồ tồn kho cuối ngày (đọc từ snapshot)
+    GET /api/shop/admin/inventory/series/
+    Query params:
+        - start, end: Khoảng ngày (YYYY-MM-DD), tối đa 366 ngày, mặc định 30 ngày gần nhất
+        - sku_ids: Danh sách SKU (1,2,3), không có thì toàn kho
+    Chưa dựng snapshot (build_stock_snapshots): 400
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from datetime import timedelta
+        from django.utils import timezone
+        from django.utils.dateparse import parse_date
+        from shop.services.stock_availability_service import StockAvailabilityService
+        from shop.services.stock_snapshot_service import StockSnapshotService
+
+        try:
+            end = parse_date(request.query_params.get('end', '')) or timezone.localdate()
+            start = parse_date(request.query_params.get('start', '')) or end - timedelta(days=29)
+            sku_ids = None
+            if request.query_params.get('sku_ids'):
+                sku_ids = StockAvailabilityService.parse_ids(request.query_params['sku_ids'])
+            points = StockSnapshotService.series(start, end, sku_ids)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'start': start, 'end': end, 'points': points})
+
+
 # 11. List All Variants for Stock Management - NEW
 class AdminVariantListView(generics.ListAPIView):
     """